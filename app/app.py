@@ -1,35 +1,368 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from typing import Dict
+import asyncio
+from collections.abc import Mapping
+from functools import partial
+import os
 import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
 
-from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Request
-from fastapi.responses import PlainTextResponse, JSONResponse
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, JSONResponse, Response
+from lxml import etree
 from lxml.etree import XMLSyntaxError
 from mediahaven import MediaHaven
 from mediahaven.mediahaven import MediaHavenException
 from mediahaven.oauth2 import RequestTokenError, ROPCGrant
-from viaa.configuration import ConfigParser
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+)
 from viaa.observability import logging
 
+from .helpers.cache import TTLCache
+from .helpers.dedup import DedupIndex
 from .helpers.events_parser import (
     InvalidPremisEventException,
     PremisEvent,
-    PremisEvents,
+    PremisPayloadParser,
+    PrescanResult,
+)
+from .helpers.journal import EventJournal
+from .helpers.metrics import (
+    BACKLOG,
+    COALESCED_LOOKUPS,
+    COLD_START,
+    DEDUP_HITS,
+    DROPPED_EVENTS,
+    DROPPED_PAYLOADS,
+    EVENTS,
+    STAGE_DURATION,
+    CacheCollector,
+    observe_archive_lag,
+    process_age,
+)
+from .helpers.settings import get_config
+from .helpers.single_flight import AsyncSingleFlight, SingleFlight
+from .helpers.work_queue import QueueFullException, WorkQueue
+from .helpers.worker_slot import WorkerSlot
+from .helpers.xml_helper import XMLTemplate
+from .services.mediahaven_pool import (
+    FragmentLookupBatcher,
+    MediaHavenPool,
+    token_refresh_delay,
 )
-from .helpers.xml_helper import XMLBuilder
-from .services.rabbit_service import RabbitService
-from .services.s3 import S3Client
+from .services.rabbit_service import DEFAULT_OUTBOX_PATH, RabbitService
+from .services.s3 import S3BatchDeleter, S3Client
+
+# The heavy imports above are done by now
+_imported_after = process_age()
 
 app = FastAPI()
-config = ConfigParser()
+config = get_config()
 log = logging.get_logger(__name__, config=config)
-_mediahaven_client: MediaHaven = None
-mediahaven_lock = threading.Lock()
+_mediahaven_pool: MediaHavenPool = None
+_rabbit_service: RabbitService = None
+rabbit_service_lock = threading.Lock()
+_s3_client: S3Client = None
+_s3_deleter: S3BatchDeleter = None
+s3_client_lock = threading.Lock()
+_fragment_cache: TTLCache = None
+fragment_cache_lock = threading.Lock()
+fragment_cache_collector = CacheCollector("fragment", lambda: _fragment_cache)
+REGISTRY.register(fragment_cache_collector)
+_fragment_lookup: FragmentLookupBatcher = None
+fragment_lookup_lock = threading.Lock()
+# Concurrent lookups of the same fragment share one MediaHaven request
+_fragment_flights = SingleFlight(on_shared=COALESCED_LOOKUPS.inc)
+_work_queue: WorkQueue = None
+work_queue_lock = threading.Lock()
+_dedup_index: DedupIndex = None
+dedup_index_lock = threading.Lock()
+_journal: EventJournal = None
+journal_lock = threading.Lock()
+_worker_slot: WorkerSlot = None
+worker_slot_lock = threading.Lock()
+# Services of the async pipeline, see `create_async_pipeline`
+_async_mediahaven = None
+_async_rabbit_service = None
+_async_s3_deleter = None
+_async_tasks: Set[asyncio.Task] = set()
+_async_lookups = AsyncSingleFlight(on_shared=COALESCED_LOOKUPS.inc)
+_async_token_refresh: asyncio.Task = None
+# Set once the warm-up is done, cleared again on shutdown
+_ready = threading.Event()
+_startup_started: float = None
+_backlog_sampler: threading.Thread = None
+_stop_backlog_sampler = threading.Event()
+
+
+def _backlog() -> int:
+    return (_work_queue.depth if _work_queue else 0) + len(_async_tasks)
+
+
+def _multiprocess_metrics() -> bool:
+    """Whether metrics are aggregated over worker processes, see main.py"""
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+if not _multiprocess_metrics():
+    BACKLOG.set_function(_backlog)
+
+
+def get_worker_slot() -> Optional[WorkerSlot]:
+    """Return the slot of this worker process, claiming one if needed.
+
+    Returns None if the application is served by a single process.
+    """
+    global _worker_slot
+    with worker_slot_lock:
+        if _worker_slot is None:
+            server_config = config.config["environment"].get("server", {})
+            workers = int(server_config.get("workers", 1))
+            if workers <= 1:
+                return None
+            _worker_slot = WorkerSlot(server_config.get("lock_dir", "locks"), workers)
+            log.info(f"Serving as worker {_worker_slot.number} of {workers}.")
+        return _worker_slot
+
+
+def _worker_path(path: Optional[str]) -> Optional[str]:
+    """Return the file of this worker for the path of an outbox or journal"""
+    worker_slot = get_worker_slot()
+    if path and worker_slot is not None:
+        return worker_slot.path(path)
+    return path
+
+
+def get_fragment_cache() -> TTLCache:
+    """Return the cache of MediaHaven fragments, creating it if needed"""
+    global _fragment_cache
+    with fragment_cache_lock:
+        if _fragment_cache is None:
+            mediahaven_config = config.config["environment"]["mediahaven"]
+            _fragment_cache = TTLCache(
+                maxsize=int(mediahaven_config.get("cache_size", 10000)),
+                ttl=float(mediahaven_config.get("cache_ttl", 300)),
+            )
+        return _fragment_cache
+
+
+def get_fragment_lookup() -> FragmentLookupBatcher:
+    """Return the batcher of MediaHaven fragment lookups, creating it if needed"""
+    global _fragment_lookup
+    with fragment_lookup_lock:
+        if _fragment_lookup is None:
+            mediahaven_config = config.config["environment"]["mediahaven"]
+            _fragment_lookup = FragmentLookupBatcher(
+                window=float(mediahaven_config.get("batch_window", 0)),
+                batch_size=int(mediahaven_config.get("batch_size", 100)),
+            )
+        return _fragment_lookup
+
+
+def get_dedup_index() -> DedupIndex:
+    """Return the index of handled event IDs, creating it if needed"""
+    global _dedup_index
+    with dedup_index_lock:
+        if _dedup_index is None:
+            dedup_config = config.config["environment"].get("dedup", {})
+            _dedup_index = DedupIndex(
+                max_size=int(dedup_config.get("size", 100000)),
+                # Shared by the workers, so a retry handled by another
+                # worker is still skipped
+                path=dedup_config.get("path"),
+            )
+        return _dedup_index
+
+
+def get_journal() -> Optional[EventJournal]:
+    """Return the journal of accepted events, creating it if needed.
+
+    Returns None if no journal path is configured.
+    """
+    global _journal
+    with journal_lock:
+        if _journal is None:
+            journal_config = config.config["environment"].get("journal", {})
+            if not journal_config.get("path"):
+                return None
+            _journal = EventJournal(
+                _worker_path(journal_config["path"]),
+                compact_after=int(journal_config.get("compact_after", 10000)),
+            )
+        return _journal
+
+
+def _journal_callback(journal_id: Optional[str]):
+    """Return a callback marking a journal entry as done, if there is one"""
+    if journal_id is None:
+        return None
+    return partial(get_journal().done, journal_id)
+
+
+def _defers_journal_entry(event: PremisEvent, handled: bool) -> bool:
+    """Whether the journal entry of an event is done by the S3 delete"""
+    return handled and event.has_valid_outcome and event.is_valid
+
+
+def _deletion_callback(
+    event: PremisEvent, dedup_index: DedupIndex, journal_done: Optional[Callable]
+):
+    """
+    Return the callback for once the S3 object of a journaled event is
+    deleted. Only then the event ID is committed to the dedup index: if the
+    process stops before the delete, the replayed event must not be skipped
+    as a duplicate.
+    """
+    if journal_done is None:
+        return None
+
+    def on_deleted():
+        if event.event_id:
+            dedup_index.commit(event.event_id)
+        journal_done()
+
+    return on_deleted
+
+
+# Largest accepted payload, in bytes
+DEFAULT_MAX_BODY_SIZE = 64 * 1024 * 1024
+
+
+# The fields of a MediaHaven fragment that are used, by their path in the record
+FRAGMENT_FIELDS = {
+    "pid": ("Administrative", "ExternalId"),
+    "organisation_name": ("Administrative", "OrganisationName"),
+    "s3_object_key": ("Dynamic", "s3_object_key"),
+    "s3_bucket": ("Dynamic", "s3_bucket"),
+    "md5": ("Technical", "Md5"),
+}
+
+# The essenceArchived XML always has the same elements, only their text varies
+ESSENCE_ARCHIVED_TEMPLATE = XMLTemplate(
+    ("timestamp", "file", "pid", "s3bucket", "md5sum"), pretty=True
+)
+
+
+def _project_fragment(fragment) -> Dict[str, str]:
+    """
+    Keep only the fields in FRAGMENT_FIELDS of a MediaHaven record, so the
+    full record can be freed right away. A missing field is None.
+
+    Arguments:
+        fragment -- The MediaHaven record, as an object or as JSON.
+
+    Returns:
+        Dict[str, str] -- The value of each field.
+    """
+    projection = {}
+    for name, path in FRAGMENT_FIELDS.items():
+        value = fragment
+        for attribute in path:
+            if isinstance(value, Mapping):
+                value = value.get(attribute)
+            else:
+                value = getattr(value, attribute, None)
+            if value is None:
+                break
+        projection[name] = value
+    return projection
+
+
+def _get_fragment(fragment_id: str, mh_pool: MediaHavenPool) -> Dict[str, str]:
+    """
+    Get the fields of a fragment from MediaHaven, or from the cache if it was
+    recently fetched. A fragment that was not found is cached as well (for a
+    shorter time) so repeated events for it don't query MediaHaven either.
+    Concurrent lookups of the same fragment share one MediaHaven request.
+
+    Two layers share requests. `_fragment_flights` shares the whole lookup,
+    including the caching of the result and the `records.get` of a fragment
+    missing from a search, also when batching is disabled. The batcher
+    shares the fragments queued in its batches, which is also what lets a
+    lookup wait for a `_prefetch_fragments` of the same fragment.
+
+    Arguments:
+        fragment_id {str} -- Fragment ID of the fragment to get.
+        mh_pool {MediaHavenPool} -- The pool of MH clients.
+
+    Returns:
+        Dict[str, str] -- The fields of the fragment, see `_project_fragment`.
+
+    Raises:
+        MediaHavenException -- If the fragment could not be fetched.
+    """
+    cache = get_fragment_cache()
+    fragment = cache.get(fragment_id)
+    if isinstance(fragment, MediaHavenException):
+        raise fragment
+    if fragment is not None:
+        return fragment
+    return _fragment_flights.do(fragment_id, _fetch_fragment, cache, fragment_id, mh_pool)
+
+
+def _fetch_fragment(
+    cache: TTLCache, fragment_id: str, mh_pool: MediaHavenPool
+) -> Dict[str, str]:
+    # A lookup that just finished may have cached the fragment in the meantime.
+    # The caller already counted the miss.
+    fragment = cache.peek(fragment_id)
+    if isinstance(fragment, MediaHavenException):
+        raise fragment
+    if fragment is not None:
+        return fragment
+
+    try:
+        with STAGE_DURATION.labels(stage="mediahaven_lookup").time():
+            fragment = _project_fragment(
+                get_fragment_lookup().get(mh_pool, fragment_id)
+            )
+    except MediaHavenException as error:
+        _cache_not_found(cache, fragment_id, error)
+        raise
+    cache.set(fragment_id, fragment)
+    return fragment
+
+
+def _cache_not_found(cache: TTLCache, fragment_id: str, error: MediaHavenException):
+    """Cache a 404 error of MediaHaven for a fragment, for a shorter time"""
+    if error.status_code == "404":
+        mediahaven_config = config.config["environment"]["mediahaven"]
+        cache.set(
+            fragment_id,
+            error,
+            ttl=float(mediahaven_config.get("cache_negative_ttl", 60)),
+        )
+
+
+def _prefetch_fragments(fragment_ids: List[str], mh_pool: MediaHavenPool):
+    """
+    Look up the fragments of a payload with as few MediaHaven requests as
+    possible and cache them for the events that need them. Events whose
+    fragment is still being looked up wait for that lookup.
+
+    Arguments:
+        fragment_ids {List[str]} -- Fragment IDs of the events in the payload.
+        mh_pool {MediaHavenPool} -- The pool of MH clients.
+    """
+    cache = get_fragment_cache()
+    missing = [fragment_id for fragment_id in fragment_ids if fragment_id not in cache]
+    if len(missing) < 2:
+        return
+    with STAGE_DURATION.labels(stage="mediahaven_lookup").time():
+        fragments = get_fragment_lookup().prefetch(mh_pool, missing)
+    for fragment_id, fragment in fragments.items():
+        cache.set(fragment_id, _project_fragment(fragment))
+    log.debug(f"Prefetched {len(fragments)} of {len(missing)} fragment(s).")
 
 
-def _get_fragment_metadata(fragment_id: str, mh_client: MediaHaven) -> Dict[str, str]:
+def _get_fragment_metadata(fragment_id: str, mh_pool: MediaHavenPool) -> Dict[str, str]:
     """
     Query MediaHaven for the given fragment ID.
     Return the pid, md5, s3 object key and s3 bucket as a dictionary.
@@ -38,50 +371,49 @@ def _get_fragment_metadata(fragment_id: str, mh_client: MediaHaven) -> Dict[str,
 
     Arguments:
         fragment_id {str} -- Fragment ID for which the information is fetched.
-        mh_client {Mediahaven} -- The MH client.
+        mh_pool {MediaHavenPool} -- The pool of MH clients.
 
     Returns:
         Dict[str, str] -- Dictionary containing the retrieved metadata.
     """
 
     try:
-        with mediahaven_lock:
-            fragment = mh_client.records.get(fragment_id)
+        fragment = _get_fragment(fragment_id, mh_pool)
     except MediaHavenException as error:
-        if error.status_code == "404":
-            log.error(
-                f"MediaHaven object not found for ID: {fragment_id}",
-                mediahaven_response=f"{error}",
-            )
-        else:
-            log.error(
-                f"MediaHaven object getting failed: {fragment_id}",
-                mediahaven_response=f"{error}",
-            )
+        _log_fragment_error(fragment_id, error)
         return {}
+    return _fragment_metadata(fragment_id, fragment)
 
-    try:
-        pid: str = fragment.Administrative.ExternalId
-        s3_object_key: str = fragment.Dynamic.s3_object_key
-        s3_bucket: str = fragment.Dynamic.s3_bucket
-        md5: str = fragment.Technical.Md5
-    except AttributeError as error:
+
+def _log_fragment_error(fragment_id: str, error: MediaHavenException):
+    if error.status_code == "404":
+        log.error(
+            f"MediaHaven object not found for ID: {fragment_id}",
+            mediahaven_response=f"{error}",
+        )
+    else:
+        log.error(
+            f"MediaHaven object getting failed: {fragment_id}",
+            mediahaven_response=f"{error}",
+        )
+
+
+def _fragment_metadata(fragment_id: str, fragment: Dict[str, str]) -> Dict[str, str]:
+    """The metadata of `_get_fragment_metadata` from the fields of a fragment"""
+    metadata = {key: fragment[key] for key in ("pid", "md5", "s3_object_key", "s3_bucket")}
+    missing = [key for key, value in metadata.items() if value is None]
+    if missing:
         log.warning(
-            f"{error} is not found in the MediaHaven object.",
+            f"{', '.join(missing)} not found in the MediaHaven object.",
             fragment_id=fragment_id,
             fragment=fragment,
         )
         return {}
 
-    return {
-        "pid": pid,
-        "md5": md5,
-        "s3_object_key": s3_object_key,
-        "s3_bucket": s3_bucket,
-    }
+    return metadata
 
 
-def _generate_vrt_xml(fragment_info: dict, event_timestamp: str) -> str:
+def _generate_vrt_xml(fragment_info: dict, event_timestamp: str) -> bytes:
     """
     Generates a basic xml for the essenceArchived event.
 
@@ -94,7 +426,7 @@ def _generate_vrt_xml(fragment_info: dict, event_timestamp: str) -> str:
         event_timestamp {str} -- Timestamp of archived event.
 
     Returns:
-        str -- EssenceArchived XML with pid, s3 object key, md5 checksum, s3 bucket and timestamp.
+        bytes -- EssenceArchived XML with pid, s3 object key, md5 checksum, s3 bucket and timestamp.
     """
 
     xml_data_dict = {
@@ -105,14 +437,12 @@ def _generate_vrt_xml(fragment_info: dict, event_timestamp: str) -> str:
         "md5sum": fragment_info["md5"],
     }
 
-    builder = XMLBuilder()
-    builder.build(xml_data_dict)
-    xml = builder.to_string(True)
+    return ESSENCE_ARCHIVED_TEMPLATE.render(xml_data_dict)
 
-    return xml
 
-
-def _handle_premis_event(event: PremisEvent, mh_client: MediaHaven):
+def _handle_premis_event(
+    event: PremisEvent, mh_pool: MediaHavenPool, journal_id: str = None
+):
     """Handle a premis event
 
     A premis event should have an outcome that is considered successful. If that
@@ -133,7 +463,51 @@ def _handle_premis_event(event: PremisEvent, mh_client: MediaHaven):
 
     Arguments:
         event {PremisEvent} -- Premis event to handle.
-        mh_client {Mediahaven} -- The MH client.
+        mh_pool {MediaHavenPool} -- The pool of MH clients.
+        journal_id {str} -- ID of the journal entry of the event, if any.
+    """
+    journal_done = _journal_callback(journal_id)
+    # MediaHaven resends events on timeouts: skip the ones already handled
+    dedup_index = get_dedup_index()
+    if event.event_id and not dedup_index.claim(event.event_id):
+        DEDUP_HITS.inc()
+        log.info(
+            f"Skipping already handled event -> ID:{event.event_id}, type:{event.event_type}",
+            fragment_id=event.fragment_id,
+            pid=event.external_id,
+        )
+        if journal_done is not None:
+            journal_done()
+        return
+
+    handled = False
+    try:
+        handled = _process_premis_event(
+            event, mh_pool, _deletion_callback(event, dedup_index, journal_done)
+        )
+    finally:
+        # A deferred journal entry commits the event ID once it is deleted
+        if journal_done is None or not _defers_journal_entry(event, handled):
+            if event.event_id:
+                if handled:
+                    dedup_index.commit(event.event_id)
+                else:
+                    dedup_index.release(event.event_id)
+            if journal_done is not None:
+                journal_done()
+
+
+def _process_premis_event(
+    event: PremisEvent, mh_pool: MediaHavenPool, on_deleted: Callable[[], None] = None
+) -> bool:
+    """Process a premis event, see `_handle_premis_event`.
+
+    Arguments:
+        on_deleted {Callable} -- Called once the S3 object was deleted.
+
+    Returns:
+        bool -- False if the event couldn't be handled and should be handled
+            again when it's resent.
     """
     log.debug(
         f"event_type: {event.event_type} / fragment_id: {event.fragment_id} / external_id: {event.external_id}"
@@ -148,9 +522,8 @@ def _handle_premis_event(event: PremisEvent, mh_client: MediaHaven):
         )
         # Get the fragment metadata to find the organisation
         try:
-            with mediahaven_lock:
-                fragment = mh_client.records.get(event.fragment_id)
-            organisation_name = fragment.Administrative.OrganisationName
+            fragment = _get_fragment(event.fragment_id, mh_pool)
+            organisation_name = fragment["organisation_name"] or "unknown"
         except MediaHavenException as e:
             log.warning(e, fragment_id=event.fragment_id, pid=event.external_id)
             organisation_name = "unknown"
@@ -158,76 +531,638 @@ def _handle_premis_event(event: PremisEvent, mh_client: MediaHaven):
         # Send a message to an "error" exchange for reporting purposes
         routing_key = f"NOK.{organisation_name}.{event.event_type}".lower()
         exchange = config.config["environment"]["rabbit"]["exchange_nok"]
-        RabbitService(config=config.config).publish_message(
-            event.to_string(), exchange, routing_key
-        )
-        return
+        with STAGE_DURATION.labels(stage="rabbit_publish").time():
+            get_rabbit_service().publish_message(
+                event.to_bytes(), exchange, routing_key
+            )
+        return True
 
     # is_valid means we have a FragmentID and a "(RECORDS.)FLOW.ARCHIVED" eventType
     if not event.is_valid:
         log.debug(f"Dropping event -> ID:{event.event_id}, type:{event.event_type}")
-        return
+        return True
+
+    fragment_info = _get_fragment_metadata(event.fragment_id, mh_pool)
+    if not fragment_info:
+        return False
 
-    fragment_info = _get_fragment_metadata(event.fragment_id, mh_client)
-    if fragment_info:
+    with STAGE_DURATION.labels(stage="xml_generation").time():
         message = _generate_vrt_xml(
             fragment_info,
             event.event_datetime,
         )
 
-        s3_bucket = fragment_info["s3_bucket"]
-        s3_object_key = fragment_info["s3_object_key"]
-        # If we have a collateral (subtitle): no need for an archivedEvent
-        if s3_bucket == "mam-collaterals":
-            log.info(
-                f"Not sending essenceArchivedEvent for {event.external_id}.",
-                mediahaven_event=event.event_type,
-                fragment_id=event.fragment_id,
-                pid=event.external_id,
-                s3_bucket=s3_bucket,
-                s3_object_key=s3_object_key,
-            )
-        else:
-            # Send essenceArchivedEvent to the queue
-            routing_key = config.config["environment"]["rabbit"]["queue"]
-            exchange = config.config["environment"]["rabbit"]["exchange"]
-            RabbitService(config=config.config).publish_message(
+    s3_bucket = fragment_info["s3_bucket"]
+    s3_object_key = fragment_info["s3_object_key"]
+    # If we have a collateral (subtitle): no need for an archivedEvent
+    if s3_bucket == "mam-collaterals":
+        log.info(
+            f"Not sending essenceArchivedEvent for {event.external_id}.",
+            mediahaven_event=event.event_type,
+            fragment_id=event.fragment_id,
+            pid=event.external_id,
+            s3_bucket=s3_bucket,
+            s3_object_key=s3_object_key,
+        )
+    else:
+        # Send essenceArchivedEvent to the queue
+        routing_key = config.config["environment"]["rabbit"]["queue"]
+        exchange = config.config["environment"]["rabbit"]["exchange"]
+        with STAGE_DURATION.labels(stage="rabbit_publish").time():
+            get_rabbit_service().publish_message(
                 message, exchange, routing_key
             )
+        observe_archive_lag(event.event_datetime)
+
+        log.info(
+            f"essenceArchivedEvent sent for {event.external_id}.",
+            mediahaven_event=event.event_type,
+            fragment_id=event.fragment_id,
+            pid=event.external_id,
+            s3_bucket=s3_bucket,
+            s3_object_key=s3_object_key,
+        )
+
+    # Delete the s3 object, batched with other deletes in the same bucket
+    get_s3_deleter().delete(s3_bucket, s3_object_key, on_deleted)
+    return True
+
+
+def _use_async_pipeline() -> bool:
+    """Whether events are handled by the async pipeline instead of threads"""
+    return config.config["environment"].get("pipeline", "threads") == "async"
+
+
+async def _get_fragment_async(fragment_id: str) -> Dict[str, str]:
+    """
+    Async version of `_get_fragment`, used by the async pipeline. Concurrent
+    lookups of the same fragment share one MediaHaven request.
+
+    Arguments:
+        fragment_id {str} -- Fragment ID of the fragment to get.
+
+    Returns:
+        Dict[str, str] -- The fields of the fragment, see `_project_fragment`.
+
+    Raises:
+        MediaHavenException -- If the fragment could not be fetched.
+    """
+    cache = get_fragment_cache()
+    fragment = cache.get(fragment_id)
+    if isinstance(fragment, MediaHavenException):
+        raise fragment
+    if fragment is not None:
+        return fragment
 
-            log.info(
-                f"essenceArchivedEvent sent for {event.external_id}.",
-                mediahaven_event=event.event_type,
-                fragment_id=event.fragment_id,
-                pid=event.external_id,
-                s3_bucket=s3_bucket,
-                s3_object_key=s3_object_key,
+    return await _async_lookups.do(fragment_id, _fetch_fragment_async, cache, fragment_id)
+
+
+async def _fetch_fragment_async(cache: TTLCache, fragment_id: str) -> Dict[str, str]:
+    try:
+        with STAGE_DURATION.labels(stage="mediahaven_lookup").time():
+            fragment = _project_fragment(
+                await _async_mediahaven.get_record(fragment_id)
             )
+    except MediaHavenException as error:
+        _cache_not_found(cache, fragment_id, error)
+        raise
+    cache.set(fragment_id, fragment)
+    return fragment
 
-        # Delete the s3 object
-        S3Client(config_dict=config.config).delete_object(s3_bucket, s3_object_key)
+
+async def _handle_premis_event_async(event: PremisEvent, journal_id: str = None):
+    """Async version of `_handle_premis_event`, used by the async pipeline.
+
+    Arguments:
+        event {PremisEvent} -- Premis event to handle.
+        journal_id {str} -- ID of the journal entry of the event, if any.
+    """
+    journal_done = _journal_callback(journal_id)
+    dedup_index = get_dedup_index()
+    if event.event_id and not dedup_index.claim(event.event_id):
+        DEDUP_HITS.inc()
+        log.info(
+            f"Skipping already handled event -> ID:{event.event_id}, type:{event.event_type}",
+            fragment_id=event.fragment_id,
+            pid=event.external_id,
+        )
+        if journal_done is not None:
+            await asyncio.to_thread(journal_done)
+        return
+
+    handled = False
+    try:
+        handled = await _process_premis_event_async(
+            event, _deletion_callback(event, dedup_index, journal_done)
+        )
+    finally:
+        # A deferred journal entry commits the event ID once it is deleted
+        if journal_done is None or not _defers_journal_entry(event, handled):
+            if event.event_id:
+                if handled:
+                    dedup_index.commit(event.event_id)
+                else:
+                    dedup_index.release(event.event_id)
+            if journal_done is not None:
+                await asyncio.to_thread(journal_done)
+
+
+async def _process_premis_event_async(
+    event: PremisEvent, on_deleted: Callable[[], None] = None
+) -> bool:
+    """Async version of `_process_premis_event`.
+
+    Returns:
+        bool -- False if the event couldn't be handled and should be handled
+            again when it's resent.
+    """
+    if not event.has_valid_outcome:
+        log.warning(
+            f"Archived event has status: {event.event_outcome} for fragment ID: {event.fragment_id}.",
+            fragment_id=event.fragment_id,
+            pid=event.external_id,
+        )
+        try:
+            fragment = await _get_fragment_async(event.fragment_id)
+            organisation_name = fragment["organisation_name"] or "unknown"
+        except MediaHavenException as e:
+            log.warning(e, fragment_id=event.fragment_id, pid=event.external_id)
+            organisation_name = "unknown"
+
+        routing_key = f"NOK.{organisation_name}.{event.event_type}".lower()
+        exchange = config.config["environment"]["rabbit"]["exchange_nok"]
+        with STAGE_DURATION.labels(stage="rabbit_publish").time():
+            await _async_rabbit_service.publish_message(
+                event.to_bytes(), exchange, routing_key
+            )
+        return True
+
+    if not event.is_valid:
+        log.debug(f"Dropping event -> ID:{event.event_id}, type:{event.event_type}")
+        return True
+
+    try:
+        fragment = await _get_fragment_async(event.fragment_id)
+    except MediaHavenException as error:
+        _log_fragment_error(event.fragment_id, error)
+        return False
+    fragment_info = _fragment_metadata(event.fragment_id, fragment)
+    if not fragment_info:
+        return False
+
+    with STAGE_DURATION.labels(stage="xml_generation").time():
+        message = _generate_vrt_xml(fragment_info, event.event_datetime)
+
+    s3_bucket = fragment_info["s3_bucket"]
+    s3_object_key = fragment_info["s3_object_key"]
+    if s3_bucket == "mam-collaterals":
+        log.info(
+            f"Not sending essenceArchivedEvent for {event.external_id}.",
+            mediahaven_event=event.event_type,
+            fragment_id=event.fragment_id,
+            pid=event.external_id,
+            s3_bucket=s3_bucket,
+            s3_object_key=s3_object_key,
+        )
+    else:
+        routing_key = config.config["environment"]["rabbit"]["queue"]
+        exchange = config.config["environment"]["rabbit"]["exchange"]
+        with STAGE_DURATION.labels(stage="rabbit_publish").time():
+            await _async_rabbit_service.publish_message(message, exchange, routing_key)
+        observe_archive_lag(event.event_datetime)
+
+        log.info(
+            f"essenceArchivedEvent sent for {event.external_id}.",
+            mediahaven_event=event.event_type,
+            fragment_id=event.fragment_id,
+            pid=event.external_id,
+            s3_bucket=s3_bucket,
+            s3_object_key=s3_object_key,
+        )
+
+    await _async_s3_deleter.delete(s3_bucket, s3_object_key, on_deleted)
+    return True
+
+
+def _async_task_done(task: asyncio.Task):
+    _async_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        log.error(
+            f"Background task failed: {task.exception()!r}",
+            exc_info=task.exception(),
+        )
+
+
+def _submit_async(events: List[PremisEvent], journal_ids: List[str] = None):
+    """Handle events on the event loop, all or none of them.
+
+    Arguments:
+        events {List[PremisEvent]} -- The events to handle.
+        journal_ids {List[str]} -- IDs of the journal entries of the events.
+
+    Raises:
+        QueueFullException -- If too many events would be in flight.
+    """
+    max_depth = int(
+        config.config["environment"].get("workers", {}).get("max_depth", 1000)
+    )
+    if len(_async_tasks) + len(events) > max_depth:
+        raise QueueFullException(
+            f"The event loop is full: {len(_async_tasks)} of {max_depth} events in flight."
+        )
+    if journal_ids is None:
+        journal_ids = [None] * len(events)
+    for event, journal_id in zip(events, journal_ids):
+        task = asyncio.ensure_future(_handle_premis_event_async(event, journal_id))
+        _async_tasks.add(task)
+        task.add_done_callback(_async_task_done)
+
+
+def get_work_queue() -> WorkQueue:
+    """Return the queue of events to handle, creating it if needed"""
+    global _work_queue
+    with work_queue_lock:
+        if _work_queue is None:
+            workers_config = config.config["environment"].get("workers", {})
+            _work_queue = WorkQueue(
+                workers=int(workers_config.get("count", 4)),
+                max_depth=int(workers_config.get("max_depth", 1000)),
+            )
+        return _work_queue
+
+
+# Registered before the other shutdown handlers: stop receiving new events
+# and handle the accepted ones before the clients they need are closed.
+@app.on_event("shutdown")
+def stop_ready():
+    _ready.clear()
+
+
+@app.on_event("shutdown")
+def close_work_queue():
+    global _work_queue
+    with work_queue_lock:
+        if _work_queue is not None:
+            # Handle the events that were already accepted
+            _work_queue.close()
+            _work_queue = None
+
+
+@app.on_event("shutdown")
+async def close_async_pipeline():
+    global _async_mediahaven, _async_rabbit_service, _async_s3_deleter
+    global _async_token_refresh
+    if _async_token_refresh is not None:
+        _async_token_refresh.cancel()
+        _async_token_refresh = None
+    # Handle the events that were already accepted
+    if _async_tasks:
+        await asyncio.gather(*_async_tasks, return_exceptions=True)
+    if _async_s3_deleter is not None:
+        await _async_s3_deleter.close()
+        await _async_s3_deleter.s3_client.close()
+        _async_s3_deleter = None
+    if _async_rabbit_service is not None:
+        await _async_rabbit_service.close()
+        _async_rabbit_service = None
+    if _async_mediahaven is not None:
+        await _async_mediahaven.close()
+        _async_mediahaven = None
+
+
+# Registered before the other startup handlers
+@app.on_event("startup")
+def start_startup_timer():
+    global _startup_started
+    _startup_started = time.perf_counter()
 
 
 @app.on_event("startup")
-def create_mediahaven_client():
-    global _mediahaven_client
+def create_mediahaven_pool():
+    global _mediahaven_pool
+    if _use_async_pipeline():
+        return
     mediahaven_config = config.config["environment"]["mediahaven"]
     client_id = mediahaven_config["client_id"]
     client_secret = mediahaven_config["client_secret"]
     user = mediahaven_config["username"]
     password = mediahaven_config["password"]
     url = mediahaven_config["host"]
-    grant = ROPCGrant(url, client_id, client_secret)
+    # The amount of concurrent MediaHaven requests
+    pool_size = int(mediahaven_config.get("pool_size", 4))
+    clients = []
+    grants = {}
+    expiries = []
+    for _ in range(pool_size):
+        grant = ROPCGrant(url, client_id, client_secret)
+        try:
+            expiries.append(_request_token(grant, user, password))
+        except RequestTokenError as e:
+            log.error(e)
+            raise e
+        client = MediaHaven(url, grant)
+        clients.append(client)
+        grants[id(client)] = grant
+    _mediahaven_pool = MediaHavenPool(clients)
+    # Request new tokens before the current ones expire, at least every
+    # `token_refresh_interval` seconds
+    refresh_interval = float(mediahaven_config.get("token_refresh_interval", 1800))
+    if refresh_interval > 0:
+        _mediahaven_pool.start_token_refresh(
+            lambda client: _request_token(grants[id(client)], user, password),
+            refresh_interval,
+            expires_in=min(
+                (expiry for expiry in expiries if expiry is not None), default=None
+            ),
+        )
+
+
+def _request_token(grant: ROPCGrant, user: str, password: str) -> Optional[float]:
+    """
+    Request a new token for a grant.
+
+    Returns:
+        Optional[float] -- Seconds until the token expires, None if unknown.
+
+    Raises:
+        RequestTokenError -- If the token could not be requested.
+    """
+    token = grant.request_token(user, password)
+    if not isinstance(token, Mapping):
+        # The token of the OAuth2 session of the grant
+        session = getattr(grant, "session", None) or getattr(grant, "_session", None)
+        token = getattr(session, "token", None)
+    if not isinstance(token, Mapping):
+        return None
+    if token.get("expires_at") is not None:
+        return float(token["expires_at"]) - time.time()
+    if token.get("expires_in") is not None:
+        return float(token["expires_in"])
+    return None
+
+
+@app.on_event("shutdown")
+def close_mediahaven_pool():
+    if _mediahaven_pool is not None:
+        _mediahaven_pool.close()
+
+
+def get_mediahaven_pool():
+    return _mediahaven_pool
+
+
+@app.on_event("startup")
+def create_s3_client():
+    if not _use_async_pipeline():
+        get_s3_deleter()
+
+
+@app.on_event("shutdown")
+def close_s3_deleter():
+    global _s3_deleter
+    with s3_client_lock:
+        if _s3_deleter is not None:
+            # Delete the objects that are still queued
+            _s3_deleter.close()
+            _s3_deleter = None
+
+
+def get_s3_client() -> S3Client:
+    """Return the S3Client shared by all events, creating it if needed"""
+    global _s3_client
+    with s3_client_lock:
+        if _s3_client is None:
+            _s3_client = S3Client(config_dict=config.config)
+        return _s3_client
+
+
+def get_s3_deleter() -> S3BatchDeleter:
+    """Return the S3BatchDeleter shared by all events, creating it if needed"""
+    global _s3_deleter
+    if _s3_deleter is None:
+        s3_client = get_s3_client()
+        with s3_client_lock:
+            if _s3_deleter is None:
+                _s3_deleter = S3BatchDeleter(s3_client, config_dict=config.config)
+    return _s3_deleter
+
+
+@app.on_event("startup")
+def create_rabbit_service():
+    # Start delivering messages that were left in the outbox
+    if not _use_async_pipeline():
+        get_rabbit_service().start()
+
+
+@app.on_event("startup")
+async def create_async_pipeline():
+    """Create the services of the async pipeline, if it is enabled"""
+    global _async_mediahaven, _async_rabbit_service, _async_s3_deleter
+    global _async_token_refresh
+    if not _use_async_pipeline():
+        return
+    # These need extra client libraries, only required by the async pipeline
+    from .services.async_mediahaven import AsyncMediaHaven
+    from .services.async_rabbit_service import AsyncRabbitService
+    from .services.async_s3 import AsyncS3BatchDeleter, AsyncS3Client
+
+    mediahaven_config = config.config["environment"]["mediahaven"]
+    _async_mediahaven = AsyncMediaHaven(
+        mediahaven_config["host"],
+        mediahaven_config["client_id"],
+        mediahaven_config["client_secret"],
+        mediahaven_config["username"],
+        mediahaven_config["password"],
+        max_connections=int(mediahaven_config.get("pool_size", 4)),
+    )
     try:
-        grant.request_token(user, password)
-    except RequestTokenError as e:
+        await _async_mediahaven.request_token()
+    except MediaHavenException as e:
         log.error(e)
         raise e
-    _mediahaven_client = MediaHaven(url, grant)
+    _async_s3_deleter = AsyncS3BatchDeleter(
+        AsyncS3Client(config_dict=config.config), config_dict=config.config
+    )
+    _async_rabbit_service = AsyncRabbitService(
+        config=config.config, outbox_path=_outbox_path()
+    )
+    await _async_rabbit_service.start()
+
+    refresh_interval = float(mediahaven_config.get("token_refresh_interval", 1800))
+    if refresh_interval > 0:
+        _async_token_refresh = asyncio.ensure_future(
+            _refresh_async_token(refresh_interval)
+        )
+
+
+async def _refresh_async_token(interval: float):
+    """Request a new MediaHaven token before the current one expires, at
+    least every `interval` seconds"""
+    delay = token_refresh_delay(interval, _async_mediahaven.token_expires_in)
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await _async_mediahaven.request_token()
+            delay = token_refresh_delay(interval, _async_mediahaven.token_expires_in)
+        except MediaHavenException as error:
+            log.error(f"Refreshing the MediaHaven token failed: {error}")
+            delay = min(interval, 30)
+
+
+@app.on_event("startup")
+async def replay_journal():
+    """Handle the events a previous run accepted but didn't finish"""
+    journal = get_journal()
+    if journal is None:
+        return
+    entries = await asyncio.to_thread(journal.recover)
+    if not entries:
+        return
+    log.warning(f"Replaying {len(entries)} unfinished event(s) from the journal.")
+    journal_ids = [entry_id for entry_id, _ in entries]
+    events = [PremisEvent(etree.fromstring(event.encode("utf-8"))) for _, event in entries]
+    for event in events:
+        event.detach()
+    try:
+        if _use_async_pipeline():
+            _submit_async(events, journal_ids)
+        else:
+            get_work_queue().submit_all(
+                [
+                    (_handle_premis_event, (event, _mediahaven_pool, journal_id))
+                    for event, journal_id in zip(events, journal_ids)
+                ]
+            )
+    except QueueFullException as e:
+        # The entries stay in the journal and are replayed on the next start
+        log.error(f"Unable to replay the journal: {e}")
+
+
+@app.on_event("startup")
+async def warm_up():
+    """Open the connections the first events need, then report ready.
+
+    The MediaHaven tokens and the S3 client are created by the startup
+    handlers above.
+    """
+    try:
+        if _use_async_pipeline():
+            await _async_rabbit_service.warm_up()
+        else:
+            await asyncio.to_thread(get_rabbit_service().warm_up)
+    except Exception as error:
+        # Messages are kept in the outbox until RabbitMQ is reachable
+        log.warning(f"Could not connect to RabbitMQ during warm-up: {error}")
+    _ready.set()
+    _report_cold_start()
+
+
+def _report_cold_start():
+    """Log and expose how long the imports and the startup handlers took"""
+    startup = time.perf_counter() - _startup_started
+    ready_after = process_age()
+    if _imported_after is None or ready_after is None:
+        log.info(f"Ready, the startup handlers took {startup:.2f}s.")
+        return
+    COLD_START.labels(phase="import").set(_imported_after)
+    COLD_START.labels(phase="ready").set(ready_after)
+    log.info(
+        f"Ready {ready_after:.2f}s after the start of the process: imports done "
+        f"after {_imported_after:.2f}s, the startup handlers took {startup:.2f}s.",
+        imported_after=_imported_after,
+        startup=startup,
+        ready_after=ready_after,
+    )
+
+
+@app.on_event("shutdown")
+def close_rabbit_service():
+    global _rabbit_service
+    with rabbit_service_lock:
+        if _rabbit_service is not None:
+            _rabbit_service.close()
+            _rabbit_service = None
+
+
+def get_rabbit_service() -> RabbitService:
+    """Return the RabbitService shared by all events, creating it if needed"""
+    global _rabbit_service
+    with rabbit_service_lock:
+        if _rabbit_service is None:
+            _rabbit_service = RabbitService(
+                config=config.config, outbox_path=_outbox_path()
+            )
+        return _rabbit_service
+
+
+# Registered after the S3 deleters are closed, which mark the last entries done
+@app.on_event("shutdown")
+def close_journal():
+    global _journal
+    with journal_lock:
+        if _journal is not None:
+            _journal.close()
+            _journal = None
+
 
+# Registered after the S3 deleters are closed, which commit the last event IDs
+@app.on_event("shutdown")
+def close_dedup_index():
+    global _dedup_index
+    with dedup_index_lock:
+        if _dedup_index is not None:
+            _dedup_index.close()
+            _dedup_index = None
 
-def get_mediahaven_client():
-    return _mediahaven_client
+
+def _outbox_path() -> str:
+    rabbit_config = config.config["environment"]["rabbit"]
+    return _worker_path(rabbit_config.get("outbox_path", DEFAULT_OUTBOX_PATH))
+
+
+@app.on_event("startup")
+def start_backlog_sampler():
+    """Write the backlog to the metric files of this worker every second"""
+    global _backlog_sampler
+    if not _multiprocess_metrics():
+        return
+
+    def sample():
+        while not _stop_backlog_sampler.wait(1):
+            BACKLOG.set(_backlog())
+
+    _stop_backlog_sampler.clear()
+    _backlog_sampler = threading.Thread(target=sample, name="backlog-sampler", daemon=True)
+    _backlog_sampler.start()
+
+
+# Registered last: the other shutdown handlers may still use the slot
+@app.on_event("shutdown")
+def release_worker_slot():
+    global _worker_slot, _backlog_sampler
+    if _backlog_sampler is not None:
+        _stop_backlog_sampler.set()
+        _backlog_sampler.join()
+        _backlog_sampler = None
+    if _multiprocess_metrics():
+        # Drop the live gauges of this worker from the aggregated metrics
+        multiprocess.mark_process_dead(os.getpid())
+    with worker_slot_lock:
+        if _worker_slot is not None:
+            _worker_slot.release()
+            _worker_slot = None
+
+
+@app.get("/metrics")
+def metrics() -> Response:
+    registry = REGISTRY
+    if _multiprocess_metrics():
+        # Aggregate the metrics of all worker processes. The cache counters
+        # are those of the worker serving the scrape.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(fragment_cache_collector)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/health/live", response_class=PlainTextResponse)
@@ -235,25 +1170,143 @@ async def liveness_check() -> str:
     return "OK"
 
 
+@app.get("/health/ready", response_class=PlainTextResponse)
+async def readiness_check() -> str:
+    if not _ready.is_set():
+        raise HTTPException(status_code=503, detail="NOK: not ready")
+    return "OK"
+
+
+def _discard_journal_entries(journal: EventJournal, journal_ids: List[str]):
+    for journal_id in journal_ids:
+        journal.done(journal_id)
+
+
+def _raise_queue_full(reason):
+    """Refuse a payload with a 503 telling MediaHaven when to retry"""
+    log.warning(reason)
+    retry_after = config.config["environment"].get("workers", {}).get(
+        "retry_after", 30
+    )
+    raise HTTPException(
+        status_code=503,
+        detail=f"NOK: {reason}",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+async def _read_payload(request: Request, payload: PremisPayloadParser) -> PrescanResult:
+    """Feed the body of a request to a payload parser as it arrives.
+
+    Raises:
+        HTTPException -- If the body is larger than `server.max_body_size`.
+        XMLSyntaxError -- If the XML is not well-formed.
+        InvalidPremisEventException -- If the XML contains no events.
+    """
+    max_body_size = int(
+        config.config["environment"].get("server", {}).get(
+            "max_body_size", DEFAULT_MAX_BODY_SIZE
+        )
+    )
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_body_size:
+        _raise_body_too_large(max_body_size)
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_body_size:
+            _raise_body_too_large(max_body_size)
+        payload.feed(chunk)
+    log.debug(f"Received a payload of {size} bytes.")
+    return payload.close()
+
+
+def _raise_body_too_large(max_body_size: int):
+    log.warning(f"Refusing a payload larger than {max_body_size} bytes.")
+    raise HTTPException(
+        status_code=413,
+        detail=f"NOK: the payload is larger than {max_body_size} bytes",
+    )
+
+
 @app.post("/event", status_code=202)
 async def handle_event(
     request: Request,
-    background_tasks: BackgroundTasks,
-    mh_client: MediaHaven = Depends(get_mediahaven_client),
+    mh_pool: MediaHavenPool = Depends(get_mediahaven_pool),
 ) -> JSONResponse:
-    # Get and parse the incoming event(s)
-    events_xml: bytes = await request.body()
-    log.debug(events_xml.decode("utf8"))
+    work_queue = get_work_queue()
+    use_async_pipeline = _use_async_pipeline()
+    if not use_async_pipeline and work_queue.full:
+        # Don't even read the payload: let MediaHaven back off and resend it
+        _raise_queue_full(f"The work queue is full: {work_queue.depth} tasks pending.")
+
+    # Journal the events before acknowledging them, with a single commit
+    journal = get_journal()
+    events = []
+
+    def accept(event: PremisEvent):
+        EVENTS.labels(event_type=event.event_type, outcome=event.event_outcome).inc()
+        # Only events with a NOK outcome or valid archived events need work
+        if event.has_valid_outcome and not event.is_valid:
+            DROPPED_EVENTS.inc()
+            log.debug(f"Dropping event -> ID:{event.event_id}, type:{event.event_type}")
+            return
+        # Accepted events shouldn't keep the rest of the payload alive
+        event.detach(keep_xml=journal is not None)
+        events.append(event)
+
+    # Parse the incoming event(s) while they arrive
+    payload = PremisPayloadParser(on_event=accept)
     try:
-        premis_events = PremisEvents(events_xml)
+        event_count, actionable = await _read_payload(request, payload)
     except (XMLSyntaxError, InvalidPremisEventException) as e:
         log.error(e)
         raise HTTPException(status_code=400, detail=f"NOK: {e}")
 
-    log.debug(f"Events in payload: {len(premis_events.events)}")
-    for event in premis_events.events:
-        background_tasks.add_task(_handle_premis_event, event, mh_client)
+    # Most payloads only contain events we drop: acknowledge them unparsed
+    if not actionable:
+        DROPPED_PAYLOADS.inc()
+        DROPPED_EVENTS.inc(event_count)
+        log.debug(f"Dropping payload with {event_count} event(s) without action.")
+        return {"message": f"Dropped {event_count} event(s) without action."}
+
+    STAGE_DURATION.labels(stage="parse").observe(payload.parse_time)
+    log.debug(f"Events in payload: {payload.count}")
+    journal_ids = [None] * len(events)
+    if journal is not None and events:
+        try:
+            with STAGE_DURATION.labels(stage="journal").time():
+                journal_ids = await asyncio.to_thread(
+                    journal.add_all, [event.to_string() for event in events]
+                )
+        except OSError as e:
+            log.error(f"Unable to journal the events: {e}")
+            raise HTTPException(status_code=503, detail=f"NOK: {e}")
+        # Only the XML of events that are forwarded is still needed
+        for event in events:
+            event.detach()
+
+    try:
+        if use_async_pipeline:
+            _submit_async(events, journal_ids)
+        else:
+            tasks = [
+                (_handle_premis_event, (event, mh_pool, journal_id))
+                for event, journal_id in zip(events, journal_ids)
+            ]
+            # Look up the fragments of all events at once, before handling them
+            fragment_ids = list(
+                dict.fromkeys(event.fragment_id for event in events if event.fragment_id)
+            )
+            if len(fragment_ids) > 1:
+                tasks.insert(0, (_prefetch_fragments, (fragment_ids, mh_pool)))
+            work_queue.submit_all(tasks)
+    except QueueFullException as e:
+        # MediaHaven resends refused events, so they aren't replayed
+        if journal is not None and events:
+            await asyncio.to_thread(_discard_journal_entries, journal, journal_ids)
+        _raise_queue_full(e)
 
     return {
-        "message": f"Processing {len(premis_events.events)} event(s) in the background."
+        "message": f"Processing {payload.count} event(s) in the background."
     }
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import os
+import threading
+
+from viaa.observability import logging
+
+from .settings import get_config
+
+config = get_config()
+logger = logging.get_logger(__name__, config=config)
+
+# Size of the hash stored per ID
+DIGEST_SIZE = 8
+
+
+class DedupIndex:
+    """Bounded index of handled IDs, optionally persisted to disk.
+
+    An ID is first claimed, so concurrent duplicates are skipped while the
+    first one is being handled, and then committed or released depending on
+    whether handling succeeded. Only the `max_size` most recently committed
+    IDs are remembered, as compact 8-byte hashes. With a `path`, committed
+    hashes are appended to that file and loaded again on startup. A
+    `max_size` of 0 disables deduplication.
+
+    Worker processes can share the file: the hashes other processes
+    committed are read from it before every claim, and appends and
+    compactions are serialized with a lock file next to it. IDs that are
+    being handled are only known to the process handling them.
+    """
+
+    def __init__(self, max_size: int = 100000, path: str = None):
+        self.max_size = max_size
+        self.path = path
+        self._seen = OrderedDict()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._file = None
+        self._lock_file = None
+        # Bytes of the file that were read
+        self._offset = 0
+        self._closed = False
+        self.hits = 0
+        if path and max_size > 0:
+            self._load()
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+
+    def _load(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(f"{self.path}.lock", "ab")
+        with self._file_lock():
+            self._open()
+            size = os.fstat(self._file.fileno()).st_size
+            # Drop a torn last entry
+            if size % DIGEST_SIZE or size > 2 * self.max_size * DIGEST_SIZE:
+                self._compact()
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold the lock shared with the other processes using the file"""
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _open(self):
+        """Open the file and read all hashes in it"""
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, "a+b")
+        self._offset = 0
+        self._read()
+
+    def _read(self):
+        """Read the hashes that were appended since the last read"""
+        if os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino:
+            # Another process compacted the file
+            self._open()
+            return
+        self._file.seek(self._offset)
+        data = self._file.read()
+        # An entry that is still being written is read the next time
+        size = len(data) - len(data) % DIGEST_SIZE
+        start = max(size // DIGEST_SIZE - self.max_size, 0) * DIGEST_SIZE
+        for offset in range(start, size, DIGEST_SIZE):
+            self._remember(data[offset:offset + DIGEST_SIZE])
+        self._offset += size
+
+    def _remember(self, digest: bytes):
+        self._seen[digest] = None
+        self._seen.move_to_end(digest)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+    def _append(self, digest: bytes):
+        """Append a hash to the file, holding the file lock"""
+        self._read()
+        # Truncate a torn entry, left by a process that stopped while writing
+        size = os.fstat(self._file.fileno()).st_size
+        if size != self._offset:
+            self._file.truncate(self._offset)
+        self._file.write(digest)
+        self._file.flush()
+        self._offset += DIGEST_SIZE
+        if self._offset > 2 * self.max_size * DIGEST_SIZE:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the file with only the remembered hashes, holding the file
+        lock"""
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "wb") as temporary_file:
+            temporary_file.write(b"".join(self._seen))
+        os.replace(temporary_path, self.path)
+        self._file.close()
+        self._file = open(self.path, "a+b")
+        self._offset = len(self._seen) * DIGEST_SIZE
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            if self._file is not None:
+                self._read()
+        return self._digest(key) in self._seen
+
+    def claim(self, key: str) -> bool:
+        """Claim an ID for handling.
+
+        Returns:
+            bool -- False if the ID was already handled or is being handled.
+        """
+        if self.max_size <= 0:
+            return True
+        digest = self._digest(key)
+        with self._lock:
+            if self._file is not None:
+                self._read()
+            if digest in self._seen or digest in self._in_flight:
+                self.hits += 1
+                return False
+            self._in_flight.add(digest)
+            return True
+
+    def release(self, key: str):
+        """Give up a claim so the ID can be handled again"""
+        with self._lock:
+            self._in_flight.discard(self._digest(key))
+
+    def commit(self, key: str):
+        """Remember a claimed ID as handled"""
+        if self.max_size <= 0:
+            return
+        digest = self._digest(key)
+        with self._lock:
+            self._in_flight.discard(digest)
+            self._remember(digest)
+            if self._closed and self.path:
+                logger.warning(
+                    f"Committing an ID to the closed dedup index {self.path}: it is not persisted."
+                )
+            elif self._file is not None:
+                with self._file_lock():
+                    self._append(digest)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
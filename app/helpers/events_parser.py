@@ -2,21 +2,228 @@
 # -*- coding: utf-8 -*-
 
 from io import BytesIO
+import re
+import time
+from typing import Callable, Iterator, List, NamedTuple
 from lxml import etree
 
 # Constants
 PREMIS_NAMESPACE = "info:lc/xmlns/premis-v2"
+NAMESPACES = {"p": PREMIS_NAMESPACE}
 VALID_EVENT_TYPES = ["RECORDS.FLOW.ARCHIVED"]
 VALID_OUTCOME = "OK"
 
+# Patterns for the pre-scan of a payload, matching any namespace prefix
+EVENT_START_PATTERN = re.compile(rb"<(?:[\w.-]+:)?event[\s/>]")
+# The tags that decide whether a payload is actionable. An eventType or
+# eventOutcome is only read if it holds plain text, any other form of those
+# tags is matched as "doubt", as are comments, CDATA, DTDs and processing
+# instructions, which could hide or add elements.
+PRESCAN_TOKEN_PATTERN = re.compile(
+    rb"<(?:[\w.-]+:)?(?P<leaf>eventType|eventOutcome)(?:\s[^<>]*)?(?<!/)>(?P<text>[^<&]*)</"
+    rb"|<(?:(?P<prefix>[\w.-]+):)?event(?:\s[^<>]*)?(?P<start>(?<!/)>)"
+    rb"|</(?:[\w.-]+:)?event\s*(?P<end>>)"
+    rb"|(?P<doubt><(?:[\w.-]+:)?(?:event|eventType|eventOutcome)[\s/>]|<!|<\?)"
+)
+XML_DECLARATION_PATTERN = re.compile(rb"\s*<\?xml\s[^<>]*\?>")
+ROOT_START_PATTERN = re.compile(rb"<events(?:\s[^<>]*)?>")
+ROOT_END_PATTERN = re.compile(rb"</events\s*>\s*$")
+# Declarations of the Premis namespace, by prefix (empty for the default)
+PREMIS_DECLARATION_PATTERN = re.compile(
+    rb"xmlns(?::([\w.-]+))?\s*=\s*[\"']" + re.escape(PREMIS_NAMESPACE.encode()) + rb"[\"']"
+)
+VALID_EVENT_TYPE_VALUES = {event_type.encode() for event_type in VALID_EVENT_TYPES}
+VALID_OUTCOME_VALUE = VALID_OUTCOME.encode()
+
+
+class PrescanResult(NamedTuple):
+    event_count: int
+    actionable: bool
+
+
+def prescan(input_xml: bytes) -> PrescanResult:
+    """Check whether a payload can contain events that need to be handled,
+    without parsing it.
+
+    A payload is not actionable if none of the valid event types occurs in it
+    and every event has exactly one outcome, which is OK. The check errs on
+    the side of caution: anything it can't vouch for is reported as
+    actionable so that it goes through the parser. That includes a payload
+    without recognizable events, a root element other than <events>, events
+    outside the Premis namespace, and comments, CDATA or eventTypes and
+    eventOutcomes that aren't plain text. A payload that passes the check is
+    not validated any further: a syntax error elsewhere in it goes unnoticed.
+
+    Arguments:
+        input_xml {bytes} -- The XML payload.
+
+    Returns:
+        PrescanResult -- The amount of events found and whether the payload
+            should be parsed and handled.
+    """
+    scanner = Prescanner()
+    scanner.feed(input_xml)
+    return scanner.close()
+
+
+class Prescanner:
+    """Incremental version of `prescan`, fed with the chunks of a payload.
+
+    Every pattern starts with a "<" and contains at most two of them, so a
+    match starting before the second to last "<" seen so far is complete.
+    Only the data from that "<" on is kept to be scanned with the next chunk.
+    Namespace declarations are part of a start tag, which is complete if it
+    starts before that "<".
+    """
+
+    def __init__(self):
+        self._tail = b""
+        self._started = False
+        self.event_count = 0
+        # Whether the payload is known to need parsing: it has a valid event
+        # type, an event that isn't OK, or anything the scan can't vouch for
+        self.actionable = False
+        # The outcomes of the event being scanned, None outside an event
+        self._outcomes = None
+        self._event_prefixes = set()
+        self._premis_prefixes = set()
+
+    def feed(self, data: bytes):
+        buffer = self._tail + data if self._tail else data
+        last = buffer.rfind(b"<")
+        end = buffer.rfind(b"<", 0, last) if last > 0 else -1
+        if end <= 0:
+            self._tail = buffer
+            return
+        self._scan(buffer, end)
+        self._tail = buffer[end:]
+
+    def _scan(self, buffer: bytes, end: int):
+        """Scan the matches that start before `end`.
+
+        Those end at most two bytes after `end`, at "</", while any match
+        starting at `end` is longer than two bytes.
+        """
+        endpos = end + 2
+        if self.actionable:
+            # Only the events still need to be counted
+            self.event_count += len(EVENT_START_PATTERN.findall(buffer, 0, endpos))
+            return
+        position = 0
+        if not self._started:
+            self._started = True
+            position = self._scan_root(buffer)
+            if self.actionable:
+                self._scan(buffer, end)
+                return
+        for match in PRESCAN_TOKEN_PATTERN.finditer(buffer, position, endpos):
+            if match.lastgroup == "text":
+                self._scan_leaf(match.group("leaf"), match.group("text"))
+            elif match.lastgroup == "start":
+                self.event_count += 1
+                self._event_prefixes.add(match.group("prefix") or b"")
+                # An event in another event is left to the parser
+                self.actionable = self.actionable or self._outcomes is not None
+                self._outcomes = []
+            elif match.lastgroup == "end":
+                self.actionable = self.actionable or self._outcomes != [VALID_OUTCOME_VALUE]
+                self._outcomes = None
+            else:
+                # A self-closing event still counts
+                self.event_count += bool(EVENT_START_PATTERN.match(match.group()))
+                self.actionable = True
+            if self.actionable:
+                # Count the remaining events
+                self.event_count += len(
+                    EVENT_START_PATTERN.findall(buffer, match.end(), endpos)
+                )
+                return
+        self._premis_prefixes.update(
+            prefix or b"" for prefix in PREMIS_DECLARATION_PATTERN.findall(buffer, 0, end)
+        )
+
+    def _scan_root(self, buffer: bytes) -> int:
+        """Check that the payload starts with an <events> root element
+        without a namespace, and return the position after its start tag"""
+        declaration = XML_DECLARATION_PATTERN.match(buffer)
+        position = declaration.end() if declaration else 0
+        while position < len(buffer) and buffer[position:position + 1].isspace():
+            position += 1
+        root = ROOT_START_PATTERN.match(buffer, position)
+        if root is None or b"xmlns=" in root.group():
+            self.actionable = True
+            return position
+        return root.end()
+
+    def _scan_leaf(self, tag: bytes, text: bytes):
+        if tag == b"eventType":
+            self.actionable = text in VALID_EVENT_TYPE_VALUES
+        elif self._outcomes is not None:
+            self._outcomes.append(text)
+
+    def close(self) -> PrescanResult:
+        """Scan the rest of the payload and return the result of the pre-scan"""
+        tail, self._tail = self._tail, b""
+        if tail or not self._started:
+            self._scan(tail, len(tail))
+        if not self.actionable:
+            self.actionable = (
+                not self.event_count
+                or self._outcomes is not None
+                or not ROOT_END_PATTERN.search(tail)
+                or not self._event_prefixes <= self._premis_prefixes
+            )
+        return PrescanResult(self.event_count, self.actionable)
+
+
 class InvalidPremisEventException(Exception):
     """Valid XML but not a Premis event"""
 
     pass
 
 
+# Marks a lazily read field of a PremisEvent that wasn't read yet
+_UNSET = object()
+
+
+class _LazyField:
+    """Field of a PremisEvent that is only read from its element when used"""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.slot = f"_{name}"
+
+    def __get__(self, event, owner=None):
+        if event is None:
+            return self
+        value = getattr(event, self.slot)
+        if value is _UNSET:
+            value = event._get_xpath_from_event(event.COMPILED_XPATHS[self.name])
+            setattr(event, self.slot, value)
+        return value
+
+
 class PremisEvent:
-    """Convenience class for a single XML Premis Event"""
+    """Convenience class for a single XML Premis Event.
+
+    Only the fields that decide what happens to the event are read when it
+    is created, most events are dropped right after. The other fields and
+    the serialized XML are read when they are first used. `detach` reads
+    whatever is still needed and lets go of the element, so a queued event
+    doesn't keep the document it was parsed from alive.
+    """
+
+    __slots__ = (
+        "xml_element",
+        "event_type",
+        "event_outcome",
+        "fragment_id",
+        "_event_datetime",
+        "_event_detail",
+        "_event_id",
+        "_external_id",
+        "_xml",
+    )
 
     XPATHS = {
         "event_type": "./p:eventType",
@@ -27,29 +234,41 @@ class PremisEvent:
         "fragment_id": "./p:linkingObjectIdentifier[p:linkingObjectIdentifierType='MEDIAHAVEN_ID']/p:linkingObjectIdentifierValue",
         "external_id": "./p:linkingObjectIdentifier[p:linkingObjectIdentifierType='EXTERNAL_ID']/p:linkingObjectIdentifierValue",
     }
+    # Compiled once instead of parsing the XPath strings for every event
+    COMPILED_XPATHS = {
+        name: etree.XPath(xpath, namespaces=NAMESPACES)
+        for name, xpath in XPATHS.items()
+    }
+
+    event_datetime = _LazyField()
+    event_detail = _LazyField()
+    event_id = _LazyField()
+    external_id = _LazyField()
 
     def __init__(self, element):
         self.xml_element = element
-        self.event_type: str = self._get_xpath_from_event(self.XPATHS["event_type"])
-        self.event_datetime: str = self._get_xpath_from_event(self.XPATHS["event_datetime"])
-        self.event_detail: str = self._get_xpath_from_event(self.XPATHS["event_detail"])
-        self.event_id: str = self._get_xpath_from_event(self.XPATHS["event_id"])
-        self.event_outcome: str = self._get_xpath_from_event(self.XPATHS["event_outcome"])
-        self.fragment_id: str = self._get_xpath_from_event(self.XPATHS["fragment_id"])
-        self.external_id: str = self._get_xpath_from_event(self.XPATHS["external_id"])
-        self.is_valid: bool = self._is_valid()
-        self.has_valid_outcome: bool = self._has_valid_outcome()
+        xpaths = self.COMPILED_XPATHS
+        self.event_type: str = self._get_xpath_from_event(xpaths["event_type"])
+        self.event_outcome: str = self._get_xpath_from_event(xpaths["event_outcome"])
+        self.fragment_id: str = self._get_xpath_from_event(xpaths["fragment_id"])
+        self._event_datetime = _UNSET
+        self._event_detail = _UNSET
+        self._event_id = _UNSET
+        self._external_id = _UNSET
+        self._xml = None
 
     def _get_xpath_from_event(self, xpath) -> str:
-        """Parses based on an xpath, returns empty string if absent"""
+        """Parses based on an xpath (a string or a compiled `etree.XPath`),
+        returns empty string if absent"""
+        if isinstance(xpath, str):
+            xpath = etree.XPath(xpath, namespaces=NAMESPACES)
         try:
-            return self.xml_element.xpath(
-                xpath, namespaces={"p": PREMIS_NAMESPACE}
-            )[0].text
+            return xpath(self.xml_element)[0].text
         except IndexError:
             return ""
 
-    def _is_valid(self):
+    @property
+    def is_valid(self) -> bool:
         """A PremisEvent is valid only if:
             - it has a valid eventType for this particular application,
             - if it has a fragment ID.
@@ -59,21 +278,217 @@ class PremisEvent:
             return True
         return False
 
-    def _has_valid_outcome(self):
+    @property
+    def has_valid_outcome(self) -> bool:
         """Check if the outcome of the event was successful"""
         return self.event_outcome == VALID_OUTCOME
 
+    def detach(self, keep_xml=False):
+        """Read the remaining fields and release the element.
+
+        Only the XML of an event with a NOK outcome is kept, as only those
+        events are forwarded, unless `keep_xml` is set. Detaching again
+        without it drops the XML of an event with an OK outcome.
+        """
+        if self.xml_element is not None:
+            for name in ("event_datetime", "event_detail", "event_id", "external_id"):
+                getattr(self, name)
+            if keep_xml or not self.has_valid_outcome:
+                self.to_bytes()
+            self.xml_element = None
+        if not keep_xml and self.has_valid_outcome:
+            self._xml = None
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the event, once.
+
+        Raises:
+            ValueError -- If the event was detached without keeping its XML.
+        """
+        if self._xml is None:
+            if self.xml_element is None:
+                raise ValueError("The XML of a detached event with an OK outcome is not kept")
+            self._xml = etree.tostring(self.xml_element, encoding="UTF-8")
+        return self._xml
+
     def to_string(self):
-        return etree.tostring(self.xml_element, encoding="UTF-8").decode("UTF-8")
+        return self.to_bytes().decode("UTF-8")
+
+class PremisEventsParser:
+    """Incremental parser for XML Premis Events.
+
+    The XML is fed in chunks and the `/events/p:event` elements are returned
+    as PremisEvent objects as soon as they are complete. The pull parser only
+    reports the end of event elements, and the elements before an event are
+    removed from the document, so the document doesn't grow with the size
+    of the payload. An event still references the document until it is
+    detached, see `PremisEvent.detach`.
+    """
+
+    EVENT_TAG = f"{{{PREMIS_NAMESPACE}}}event"
+
+    def __init__(self):
+        self._parser = etree.XMLPullParser(events=("end",), tag=self.EVENT_TAG)
+        self.count = 0
+
+    def feed(self, data: bytes) -> List[PremisEvent]:
+        """Parse a chunk of XML and return the events it completed"""
+        self._parser.feed(data)
+        return self._read_events()
+
+    def close(self) -> List[PremisEvent]:
+        """Finish parsing and return the remaining events.
+
+        Raises:
+            XMLSyntaxError -- If the XML is not well-formed.
+            InvalidPremisEventException -- If the XML contains no events.
+        """
+        root = self._parser.close()
+        events = self._read_events()
+        if not self.count:
+            docinfo = root.getroottree().docinfo
+            raise InvalidPremisEventException(
+                f'No events found at xpath "/events/p:event": Root tag=<{docinfo.root_name}>, encoding="{docinfo.encoding}"'
+            )
+        return events
+
+    def _read_events(self) -> List[PremisEvent]:
+        # Only events directly in an <events> root element count
+        elements = [
+            element
+            for _, element in self._parser.read_events()
+            if self._is_top_level(element)
+        ]
+        if not elements:
+            return []
+        events = [PremisEvent(element) for element in elements]
+        self.count += len(events)
+        # Drop everything before the last event from the document, once per
+        # chunk. The last event itself can't be removed while the parser may
+        # still append its tail.
+        last = elements[-1]
+        root = last.getparent()
+        del root[: root.index(last)]
+        return events
+
+    @staticmethod
+    def _is_top_level(element) -> bool:
+        root = element.getparent()
+        return root is not None and root.tag == "events" and root.getparent() is None
+
+
+class PremisPayloadParser:
+    """Parses a payload of Premis events while it arrives, if it needs work.
+
+    Chunks are pre-scanned (see `prescan`) and only held on to until the
+    payload turns out to be actionable. From then on they are fed to a
+    `PremisEventsParser` as they arrive. A payload that is not actionable is
+    never parsed.
+
+    The events are collected in `events`, or handed to `on_event` as soon as
+    they are complete, so the caller can detach them before the rest of the
+    payload arrives.
+    """
+
+    def __init__(self, on_event: Callable[[PremisEvent], None] = None):
+        self._scanner = Prescanner()
+        self._chunks = []
+        self._parser = None
+        self.events: List[PremisEvent] = []
+        self._on_event = self.events.append if on_event is None else on_event
+        # Seconds spent in the XML parser
+        self.parse_time = 0.0
+
+    def feed(self, data: bytes):
+        """Scan or parse a chunk of the payload.
+
+        Raises:
+            XMLSyntaxError -- If the XML is not well-formed.
+        """
+        # The scanner keeps counting the events of an actionable payload
+        self._scanner.feed(data)
+        if self._parser is not None:
+            self._parse(data)
+            return
+        self._chunks.append(data)
+        if self._scanner.actionable:
+            self._start_parsing()
+
+    def _start_parsing(self):
+        self._parser = PremisEventsParser()
+        chunks, self._chunks = self._chunks, None
+        for chunk in chunks:
+            self._parse(chunk)
+
+    @property
+    def count(self) -> int:
+        """The number of events parsed so far"""
+        return 0 if self._parser is None else self._parser.count
+
+    def _parse(self, data: bytes):
+        started = time.perf_counter()
+        try:
+            events = self._parser.feed(data)
+        finally:
+            self.parse_time += time.perf_counter() - started
+        for event in events:
+            self._on_event(event)
+
+    def close(self) -> PrescanResult:
+        """Finish the payload.
+
+        Returns:
+            PrescanResult -- The result of the pre-scan. The events of an
+                actionable payload are in `events`.
+
+        Raises:
+            XMLSyntaxError -- If the XML is not well-formed.
+            InvalidPremisEventException -- If the XML contains no events.
+        """
+        result = self._scanner.close()
+        if not result.actionable:
+            return result
+        if self._parser is None:
+            self._start_parsing()
+        started = time.perf_counter()
+        try:
+            events = self._parser.close()
+        finally:
+            self.parse_time += time.perf_counter() - started
+        for event in events:
+            self._on_event(event)
+        return result
+
 
 class PremisEvents:
     """Convenience class for XML Premis Events"""
 
-    def __init__(self, input_xml):
+    def __init__(self, input_xml, stream=False):
+        """Parse the events in the input XML.
+
+        Arguments:
+            input_xml {bytes} -- The XML payload.
+            stream {bool} -- Parse with `iterparse` instead of building and
+                keeping the DOM of the whole payload.
+        """
         self.input_xml = input_xml
-        self.xml_tree = self._xml_to_tree(input_xml)
-        self.docinfo = self.xml_tree.docinfo
-        self.events = self._parse_events()
+        if stream:
+            self.xml_tree = None
+            self.docinfo = None
+            self.events = list(self.iterparse(input_xml))
+        else:
+            self.xml_tree = self._xml_to_tree(input_xml)
+            self.docinfo = self.xml_tree.docinfo
+            self.events = self._parse_events()
+
+    @staticmethod
+    def iterparse(input_xml, chunk_size=64 * 1024) -> Iterator[PremisEvent]:
+        """Yield the events in the input XML one by one"""
+        parser = PremisEventsParser()
+        for start in range(0, len(input_xml), chunk_size):
+            yield from parser.feed(input_xml[start:start + chunk_size])
+        yield from parser.close()
 
     def _xml_to_tree(self, input_xml):
         """Parse the input XML to a DOM"""
@@ -84,9 +499,7 @@ class PremisEvents:
         """Parse possibly multiple events in the XML-DOM and return a list of
         DOM Premis-events"""
         events = []
-        elements = self.xml_tree.xpath(
-            "/events/p:event", namespaces={"p": PREMIS_NAMESPACE}
-        )
+        elements = self.xml_tree.xpath("/events/p:event", namespaces=NAMESPACES)
         for element in elements:
             events.append(PremisEvent(element))
         if not events:
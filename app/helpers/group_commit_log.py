@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+from typing import Dict, Iterator, List
+
+
+class GroupCommitLog:
+    """Append-only file of JSON records with group commit.
+
+    `append` only returns once the record has been fsync'ed. Concurrent
+    appenders don't each pay an fsync: the first one becomes the leader and
+    writes and syncs everything that was queued in the meantime, the others
+    wait for the leader to report their record as committed. If the write
+    fails, the file is truncated back and every append of the batch fails.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._cond = threading.Condition()
+        self._pending: List[bytes] = []
+        self._appended = 0
+        # Appends up to this sequence number were committed or failed
+        self._resolved = 0
+        self._failed: Dict[int, OSError] = {}
+        self._flushing = False
+
+    def _open(self):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "ab")
+
+    def records(self) -> Iterator[dict]:
+        """Iterate over the records currently stored in the file.
+
+        A torn last line, e.g. after a crash during a write, is ignored.
+        """
+        try:
+            with open(self.path, "rb") as log_file:
+                for line in log_file:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            return
+
+    def append(self, record: dict, sync: bool = True):
+        """Append a record and wait until it is durable, see `append_all`"""
+        self.append_all([record], sync=sync)
+
+    def append_all(self, records: List[dict], sync: bool = True):
+        """Append records and wait until they are durable.
+
+        With `sync` False the records are written right away without waiting
+        for an fsync: they survive a crash of the process but not of the
+        machine.
+        """
+        lines = b"".join(
+            json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+            for record in records
+        )
+        with self._cond:
+            if not sync:
+                while self._flushing:
+                    self._cond.wait()
+                self._open()
+                self._file.write(lines)
+                self._file.flush()
+                return
+            self._pending.append(lines)
+            self._appended += 1
+            sequence = self._appended
+            while self._resolved < sequence:
+                if self._flushing:
+                    self._cond.wait()
+                    continue
+                # Become the leader for everything queued so far
+                self._flushing = True
+                batch = self._pending
+                self._pending = []
+                first, last = self._resolved + 1, self._appended
+                self._open()
+                offset = os.fstat(self._file.fileno()).st_size
+                self._cond.release()
+                try:
+                    self._file.write(b"".join(batch))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except OSError as error:
+                    self._cond.acquire()
+                    self._discard_from(offset)
+                    for failed in range(first, last + 1):
+                        self._failed[failed] = error
+                    self._flushing = False
+                    self._resolved = last
+                    self._cond.notify_all()
+                    break
+                self._cond.acquire()
+                self._flushing = False
+                self._resolved = last
+                self._cond.notify_all()
+            error = self._failed.pop(sequence, None)
+            if error is not None:
+                raise error
+
+    def _discard_from(self, offset: int):
+        """Drop whatever a failed write left in the file after `offset`.
+
+        The file is reopened on the next append, so data still buffered by
+        the failed write can't end up in the file later.
+        """
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        self._file = None
+        try:
+            os.truncate(self.path, offset)
+        except OSError:
+            # The records of the batch may remain, a torn last one is ignored
+            pass
+
+    def rewrite(self, records: List[dict]):
+        """Atomically replace the file contents with the given records"""
+        with self._cond:
+            while self._flushing:
+                self._cond.wait()
+            self._open()
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, "wb") as temporary_file:
+                for record in records:
+                    temporary_file.write(
+                        json.dumps(record, separators=(",", ":")).encode("utf-8")
+                        + b"\n"
+                    )
+                temporary_file.flush()
+                os.fsync(temporary_file.fileno())
+            os.replace(temporary_path, self.path)
+            self._file.close()
+            self._file = open(self.path, "ab")
+
+    def close(self):
+        with self._cond:
+            while self._flushing:
+                self._cond.wait()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
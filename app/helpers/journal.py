@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import threading
+from typing import List, Tuple
+import uuid
+
+from .group_commit_log import GroupCommitLog
+
+
+class EventJournal:
+    """Write-ahead journal of accepted events.
+
+    Events are appended before the payload is acknowledged, with one group
+    commit per payload, and marked done once they are handled. Entries that
+    were not done when the process stopped are recovered on the next start.
+    The journal is compacted to its unfinished entries once it holds
+    `compact_after` records.
+    """
+
+    def __init__(self, path: str, compact_after: int = 10000):
+        self.path = path
+        self.compact_after = compact_after
+        self._log = GroupCommitLog(path)
+        self._entries = None
+        self._recovered = []
+        self._records = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Load the unfinished entries from disk, once"""
+        with self._lock:
+            if self._entries is not None:
+                return
+            entries = OrderedDict()
+            done = set()
+            for record in self._log.records():
+                if record["op"] == "add":
+                    entries[record["id"]] = record["event"]
+                elif record["op"] == "done":
+                    done.add(record["id"])
+            for entry_id in done:
+                entries.pop(entry_id, None)
+            self._log.rewrite(self._add_records(entries))
+            self._entries = entries
+            self._recovered = list(entries.items())
+            self._records = len(entries)
+
+    @staticmethod
+    def _add_records(entries: dict) -> List[dict]:
+        return [
+            {"op": "add", "id": entry_id, "event": event}
+            for entry_id, event in entries.items()
+        ]
+
+    @property
+    def pending(self) -> int:
+        self._load()
+        return len(self._entries)
+
+    def recover(self) -> List[Tuple[str, str]]:
+        """Return the entries left unfinished by a previous run, once.
+
+        Returns:
+            List[Tuple[str, str]] -- The IDs and events of the entries.
+        """
+        self._load()
+        with self._lock:
+            recovered, self._recovered = self._recovered, []
+        return recovered
+
+    def add_all(self, events: List[str]) -> List[str]:
+        """Durably append events, waiting for a single (group) commit.
+
+        Arguments:
+            events {List[str]} -- The serialized events.
+
+        Returns:
+            List[str] -- The IDs of the new entries.
+        """
+        self._load()
+        entries = OrderedDict((uuid.uuid4().hex, event) for event in events)
+        with self._lock:
+            self._entries.update(entries)
+            self._records += len(entries)
+        try:
+            self._log.append_all(self._add_records(entries))
+        except OSError:
+            with self._lock:
+                for entry_id in entries:
+                    self._entries.pop(entry_id, None)
+            raise
+        return list(entries)
+
+    def done(self, entry_id: str):
+        """Mark an entry as done, without waiting for an fsync"""
+        self._load()
+        with self._lock:
+            self._entries.pop(entry_id, None)
+            self._records += 1
+            compact = self._should_compact()
+        self._log.append({"op": "done", "id": entry_id}, sync=False)
+        if compact:
+            self._compact()
+
+    def _should_compact(self) -> bool:
+        # Don't rewrite over and over while many entries are unfinished
+        return self._records >= max(self.compact_after, 2 * len(self._entries))
+
+    def _compact(self):
+        """Rewrite the journal with only the unfinished entries"""
+        with self._lock:
+            if not self._should_compact():
+                return
+            self._log.rewrite(self._add_records(self._entries))
+            self._records = len(self._entries)
+
+    def close(self):
+        self._log.close()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timezone
+import os
+from typing import Callable, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily
+
+from .cache import TTLCache
+
+NAMESPACE = "event_handler"
+
+STAGE_DURATION = Histogram(
+    "stage_duration_seconds",
+    "Duration of the stages of handling an event",
+    ["stage"],
+    namespace=NAMESPACE,
+)
+EVENTS = Counter(
+    "events",
+    "Premis events received, by event type and outcome",
+    ["event_type", "outcome"],
+    namespace=NAMESPACE,
+)
+DROPPED_PAYLOADS = Counter(
+    "dropped_payloads",
+    "Payloads acknowledged without parsing because they need no action",
+    namespace=NAMESPACE,
+)
+DROPPED_EVENTS = Counter(
+    "dropped_events",
+    "Premis events dropped without handling them",
+    namespace=NAMESPACE,
+)
+DEDUP_HITS = Counter(
+    "dedup_hits",
+    "Premis events skipped because they were already handled",
+    namespace=NAMESPACE,
+)
+COALESCED_LOOKUPS = Counter(
+    "coalesced_lookups",
+    "Fragment lookups that shared the outstanding MediaHaven request of another event",
+    namespace=NAMESPACE,
+)
+BACKLOG = Gauge(
+    "backlog",
+    "Premis events accepted but not handled yet",
+    namespace=NAMESPACE,
+    # Summed over the running worker processes in multiprocess mode
+    multiprocess_mode="livesum",
+)
+COLD_START = Gauge(
+    "cold_start_seconds",
+    "Seconds since the start of the process at the end of a phase of the cold start",
+    ["phase"],
+    namespace=NAMESPACE,
+    multiprocess_mode="max",
+)
+ARCHIVE_NOTIFY_LAG = Histogram(
+    "archive_notify_lag_seconds",
+    "Time between archiving in MediaHaven and sending the essenceArchivedEvent",
+    namespace=NAMESPACE,
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, float("inf")),
+)
+
+
+def process_age() -> Optional[float]:
+    """Return the seconds since the start of this process.
+
+    Returns None where that can't be read from /proc.
+    """
+    try:
+        with open("/proc/self/stat") as stat_file:
+            # The fields after the command name, which may contain spaces
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    return max(uptime - started, 0)
+
+
+def observe_archive_lag(event_datetime: str):
+    """Observe the time since the given ISO 8601 event timestamp.
+
+    Timestamps without a timezone are taken to be in UTC, unparsable
+    timestamps are ignored.
+    """
+    try:
+        archived_at = datetime.fromisoformat(event_datetime.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return
+    if archived_at.tzinfo is None:
+        archived_at = archived_at.replace(tzinfo=timezone.utc)
+    lag = datetime.now(timezone.utc) - archived_at
+    ARCHIVE_NOTIFY_LAG.observe(max(lag.total_seconds(), 0))
+
+
+class CacheCollector:
+    """Exposes the hit and miss counters of a TTLCache"""
+
+    def __init__(self, name: str, get_cache: Callable[[], TTLCache]):
+        self.name = name
+        self.get_cache = get_cache
+
+    def collect(self):
+        cache = self.get_cache()
+        hits = CounterMetricFamily(
+            f"{NAMESPACE}_{self.name}_cache_hits", f"Hits of the {self.name} cache"
+        )
+        misses = CounterMetricFamily(
+            f"{NAMESPACE}_{self.name}_cache_misses", f"Misses of the {self.name} cache"
+        )
+        if cache is not None:
+            hits.add_metric([], cache.hits)
+            misses.add_metric([], cache.misses)
+        yield hits
+        yield misses
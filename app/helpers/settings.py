@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+from types import MappingProxyType
+
+from viaa.configuration import ConfigParser
+
+_config: ConfigParser = None
+config_lock = threading.Lock()
+
+
+def _freeze(value):
+    """Return a read-only copy of a parsed configuration value"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def get_config() -> ConfigParser:
+    """Return the configuration shared by all modules, loading it once.
+
+    The settings in its `config` are read-only: mappings can't be changed
+    and lists are tuples.
+    """
+    global _config
+    with config_lock:
+        if _config is None:
+            config = ConfigParser()
+            config.config = _freeze(config.config)
+            _config = config
+        return _config
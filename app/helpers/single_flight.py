@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+from concurrent.futures import Future
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into a single call.
+
+    The first caller for a key runs the function, callers arriving while it
+    runs wait for it and get the same result or exception. Once the call is
+    done the key is forgotten, so a later caller runs the function again.
+    """
+
+    def __init__(self, on_shared: Callable[[], None] = None):
+        self._on_shared = on_shared
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, function: Callable, *args) -> Any:
+        """
+        Call `function(*args)`, or wait for the outstanding call for the key.
+
+        Raises:
+            Exception -- The exception raised by the function.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            lead = future is None
+            if lead:
+                future = self._in_flight[key] = Future()
+        if not lead:
+            if self._on_shared is not None:
+                self._on_shared()
+            return future.result()
+
+        try:
+            result = function(*args)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
+class AsyncSingleFlight:
+    """`SingleFlight` for coroutines, on a single event loop.
+
+    The call runs in its own task: a cancelled caller doesn't cancel the call
+    other callers wait for.
+    """
+
+    def __init__(self, on_shared: Callable[[], None] = None):
+        self._on_shared = on_shared
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, function: Callable[..., Awaitable], *args) -> Any:
+        """
+        Await `function(*args)`, or the outstanding call for the key.
+
+        Raises:
+            Exception -- The exception raised by the function.
+        """
+        call = self._in_flight.get(key)
+        if call is None:
+            call = asyncio.ensure_future(function(*args))
+            self._in_flight[key] = call
+            call.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        elif self._on_shared is not None:
+            self._on_shared()
+        return await asyncio.shield(call)
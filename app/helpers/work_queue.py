@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from collections import deque
+import threading
+from typing import Callable, List, Tuple
+
+from viaa.observability import logging
+
+from .settings import get_config
+
+config = get_config()
+logger = logging.get_logger(__name__, config=config)
+
+
+class QueueFullException(Exception):
+    """The work queue can't take the submitted tasks"""
+
+    pass
+
+
+class WorkQueue:
+    """Bounded in-process queue of tasks, run by a fixed amount of workers.
+
+    The depth of the queue is the amount of tasks that are waiting or
+    running. Submitting tasks beyond `max_depth` is refused instead of
+    letting the queued work grow without bounds.
+    """
+
+    def __init__(self, workers: int = 4, max_depth: int = 1000):
+        self.workers = workers
+        self.max_depth = max_depth
+        self._tasks = deque()
+        self._cond = threading.Condition()
+        # Joiners wait separately, so waking a worker never wakes a joiner
+        self._done = threading.Condition(self._cond)
+        self._unfinished = 0
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+
+    @property
+    def depth(self) -> int:
+        return self._unfinished
+
+    @property
+    def full(self) -> bool:
+        return self._unfinished >= self.max_depth
+
+    def _start(self):
+        """Start the workers. Must be called with the condition held."""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._work, name=f"worker-{len(self._threads)}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit_all(self, tasks: List[Tuple[Callable, tuple]]):
+        """Queue all given tasks, or none if they don't all fit.
+
+        Arguments:
+            tasks {List[Tuple[Callable, tuple]]} -- Functions with their arguments.
+
+        Raises:
+            QueueFullException -- If the queue can't take all tasks.
+        """
+        with self._cond:
+            if self._closed:
+                raise QueueFullException("The work queue is closed.")
+            if self._unfinished + len(tasks) > self.max_depth:
+                raise QueueFullException(
+                    f"The work queue is full: {self._unfinished} of {self.max_depth} tasks pending."
+                )
+            self._tasks.extend(tasks)
+            self._unfinished += len(tasks)
+            self._start()
+            self._cond.notify(len(tasks))
+
+    def submit(self, function: Callable, *args):
+        self.submit_all([(function, args)])
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._tasks and not self._closed:
+                    self._cond.wait()
+                if not self._tasks:
+                    return
+                function, args = self._tasks.popleft()
+            try:
+                function(*args)
+            except Exception as error:
+                logger.error(f"Background task failed: {error!r}", exc_info=True)
+            finally:
+                with self._cond:
+                    self._unfinished -= 1
+                    if not self._unfinished:
+                        self._done.notify_all()
+
+    def join(self):
+        """Wait until all submitted tasks are done"""
+        with self._cond:
+            while self._unfinished:
+                self._done.wait()
+
+    def close(self):
+        """Run the remaining tasks and stop the workers"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
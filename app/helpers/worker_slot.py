@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import fcntl
+import os
+import time
+
+
+class WorkerSlot:
+    """Exclusive slot of a worker process, held with a file lock.
+
+    When several worker processes serve the application, every worker needs
+    its own outbox and journal files. A worker claims the first
+    free slot out of `count` and uses the slot number in those file names, so
+    a restarted worker picks up the files left behind by its predecessor.
+    The lock is released by the OS when the process exits.
+    """
+
+    def __init__(self, directory: str, count: int, retry_delay: float = 0.1):
+        os.makedirs(directory, exist_ok=True)
+        self.number = None
+        self._file = None
+        while self.number is None:
+            for number in range(count):
+                lock_file = open(os.path.join(directory, f"worker-{number}.lock"), "w")
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    lock_file.close()
+                    continue
+                self.number = number
+                self._file = lock_file
+                break
+            else:
+                # A worker that is shutting down still holds its slot
+                time.sleep(retry_delay)
+
+    def path(self, path: str) -> str:
+        """Return the file of this slot for a path: "a/b.log" becomes "a/b.3.log"."""
+        root, extension = os.path.splitext(path)
+        return f"{root}.{self.number}{extension}"
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
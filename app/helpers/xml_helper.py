@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import re
+from typing import Dict, Sequence
+
 from lxml import etree
 
+# Characters that lxml escapes in text, or refuses because XML 1.0 can't hold them
+_SPECIAL_CHARACTERS = re.compile("[&<>\r\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+_INVALID_CHARACTERS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
 
 class XMLBuilder(object):
     XML_ENCODING = "UTF-8"
@@ -31,9 +38,76 @@ class XMLBuilder(object):
         )
 
     def to_string(self, pretty=False) -> str:
-        return etree.tostring(
-            self.xml,
-            pretty_print=pretty,
-            encoding=self.XML_ENCODING,
-            xml_declaration=True,
-        ).decode("utf-8")
+        return self.to_bytes(pretty).decode("utf-8")
+
+
+def escape_text(value: str) -> str:
+    """Escape a string for the text of an element like lxml does.
+
+    Raises:
+        ValueError -- If the string contains characters XML can't hold.
+    """
+    if not _SPECIAL_CHARACTERS.search(value):
+        return value
+    if _INVALID_CHARACTERS.search(value):
+        raise ValueError("Strings must be XML compatible: no NULL bytes or control characters")
+    return (
+        value.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace("\r", "&#13;")
+    )
+
+
+class XMLTemplate(object):
+    """Precompiled `XMLBuilder` document with a fixed set of elements.
+
+    The document is serialized once with a marker in every element, and
+    split into the static parts around the markers. Rendering only escapes
+    the values and joins them with those parts, which gives the same bytes
+    as building the document with `XMLBuilder`. Like there, an element
+    without a value (None) is rendered as an empty element tag.
+    """
+
+    _MARKER = "{}"
+
+    def __init__(self, fields: Sequence[str], pretty=False):
+        self.fields = tuple(fields)
+        builder = XMLBuilder()
+        builder.build(
+            {field: self._MARKER.format(index) for index, field in enumerate(self.fields)}
+        )
+        document = builder.to_string(pretty)
+        self._parts = []
+        for index in range(len(self.fields)):
+            part, _, document = document.partition(self._MARKER.format(index))
+            self._parts.append(part)
+        self._parts.append(document)
+        self._end_tags = [f"</{field}>" for field in self.fields]
+
+    def render(self, values: Dict[str, str]) -> bytes:
+        """
+        Fill in the elements of the template.
+
+        Arguments:
+            values {Dict[str, str]} -- The text of every element, by name,
+                or None for an empty element.
+
+        Returns:
+            bytes -- The UTF-8 encoded document.
+
+        Raises:
+            ValueError -- If a value contains characters XML can't hold.
+        """
+        parts = self._parts
+        chunks = [parts[0]]
+        for index, field in enumerate(self.fields, 1):
+            value = values[field]
+            if value is None:
+                # <field></field> becomes <field/>
+                chunks[-1] = chunks[-1][:-1] + "/>"
+                chunks.append(parts[index][len(self._end_tags[index - 1]):])
+                continue
+            chunks.append(escape_text(value))
+            chunks.append(parts[index])
+        return "".join(chunks).encode(XMLBuilder.XML_ENCODING)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+from typing import Optional
+
+import httpx
+from mediahaven.mediahaven import MediaHavenException
+
+
+class AsyncMediaHaven:
+    """Minimal MediaHaven REST client for the async pipeline.
+
+    The mediahaven client is synchronous, so this client talks to the REST
+    API directly over a shared `httpx.AsyncClient`. It requests an OAuth2
+    token with the resource owner password credentials grant and requests a
+    new one when MediaHaven rejects the current token.
+    """
+
+    API_PATH = "/mediahaven-rest-api/v2"
+    TOKEN_PATH = "/auth/ropc.php"
+
+    def __init__(
+        self,
+        url: str,
+        client_id: str,
+        client_secret: str,
+        username: str,
+        password: str,
+        max_connections: int = 4,
+        timeout: float = 30,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self._credentials = {
+            "grant_type": "password",
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "username": username,
+            "password": password,
+        }
+        self._client = httpx.AsyncClient(
+            base_url=url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections),
+            transport=transport,
+        )
+        self._access_token = None
+        # time.monotonic() at which the token expires, if MediaHaven said so
+        self._token_expires_at = None
+        self._token_lock = asyncio.Lock()
+
+    @staticmethod
+    def _error(response: httpx.Response) -> MediaHavenException:
+        error = MediaHavenException(response.text)
+        # Like the mediahaven client, the status code is a string
+        error.status_code = str(response.status_code)
+        return error
+
+    async def request_token(self, stale_token: str = None):
+        """Request a new access token, unless another request already replaced
+        `stale_token` in the meantime.
+
+        Raises:
+            MediaHavenException -- If the token could not be requested.
+        """
+        async with self._token_lock:
+            if stale_token is not None and self._access_token != stale_token:
+                return
+            response = await self._client.post(self.TOKEN_PATH, data=self._credentials)
+            if response.status_code != 200:
+                raise self._error(response)
+            token = response.json()
+            self._access_token = token["access_token"]
+            expires_in = token.get("expires_in")
+            self._token_expires_at = (
+                None if expires_in is None else time.monotonic() + float(expires_in)
+            )
+
+    @property
+    def token_expires_in(self) -> Optional[float]:
+        """Seconds until the current token expires, None if unknown"""
+        if self._token_expires_at is None:
+            return None
+        return self._token_expires_at - time.monotonic()
+
+    async def get_record(self, record_id: str) -> dict:
+        """Get a record as JSON.
+
+        Raises:
+            MediaHavenException -- If the record could not be fetched.
+        """
+        try:
+            if self._access_token is None:
+                await self.request_token()
+            for attempt in (1, 2):
+                token = self._access_token
+                response = await self._client.get(
+                    f"{self.API_PATH}/records/{record_id}",
+                    headers={
+                        "Authorization": f"Bearer {token}",
+                        "Accept": "application/json",
+                    },
+                )
+                if response.status_code == 401 and attempt == 1:
+                    await self.request_token(stale_token=token)
+                    continue
+                break
+        except httpx.HTTPError as e:
+            error = MediaHavenException(f"MediaHaven request failed: {e!r}")
+            error.status_code = None
+            raise error from e
+        if response.status_code != 200:
+            raise self._error(response)
+        return response.json()
+
+    async def close(self):
+        await self._client.aclose()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+from typing import Union
+
+import aio_pika
+from viaa.observability import logging
+
+from ..helpers.settings import get_config
+from .outbox import Outbox
+from .rabbit_service import DEFAULT_HEARTBEAT, DEFAULT_OUTBOX_PATH
+
+config = get_config()
+logger = logging.get_logger(__name__, config=config)
+
+# Seconds the outbox waits for a publish on the event loop
+PUBLISH_TIMEOUT = 60
+
+
+class AsyncRabbitService:
+    """Publisher for the async pipeline, on a single robust aio-pika connection.
+
+    Publishes wait for the publisher confirm of the broker without blocking
+    the event loop. Like `RabbitService`, messages that can't be published
+    are stored in the on-disk outbox, which retries them in the background.
+    """
+
+    def __init__(self, config: dict = None, ctx=None, outbox_path: str = None):
+        self.context = ctx
+        self.name = "RabbitMQ Service"
+        rabbit_config = config["environment"]["rabbit"]
+        self.host = rabbit_config["host"]
+        self.username = rabbit_config["username"]
+        self.password = rabbit_config["password"]
+        self.heartbeat = int(rabbit_config.get("heartbeat", DEFAULT_HEARTBEAT))
+        self._connection = None
+        self._channel = None
+        self._connect_lock = asyncio.Lock()
+        self._loop = None
+        self.outbox = Outbox(
+            outbox_path or rabbit_config.get("outbox_path", DEFAULT_OUTBOX_PATH),
+            self._publish_from_outbox,
+            base_delay=float(rabbit_config.get("retry_base_delay", 1)),
+            max_delay=float(rabbit_config.get("retry_max_delay", 300)),
+        )
+
+    async def start(self):
+        """Start delivering messages left in the outbox"""
+        self._loop = asyncio.get_running_loop()
+        await asyncio.to_thread(self.outbox.start)
+
+    async def warm_up(self):
+        """Open the connection ahead of the first publish"""
+        await self._get_channel()
+
+    async def _get_channel(self) -> aio_pika.abc.AbstractChannel:
+        async with self._connect_lock:
+            if self._channel is None or self._channel.is_closed:
+                if self._connection is None or self._connection.is_closed:
+                    self._connection = await aio_pika.connect_robust(
+                        host=self.host,
+                        login=self.username,
+                        password=self.password,
+                        heartbeat=self.heartbeat,
+                    )
+                self._channel = await self._connection.channel(publisher_confirms=True)
+            return self._channel
+
+    async def _publish(self, message: Union[bytes, str], exchange: str, routing_key: str):
+        channel = await self._get_channel()
+        if exchange:
+            target = await channel.get_exchange(exchange, ensure=False)
+        else:
+            target = channel.default_exchange
+        await target.publish(
+            aio_pika.Message(
+                body=message if isinstance(message, bytes) else message.encode("utf-8"),
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            ),
+            routing_key=routing_key,
+        )
+
+    def _publish_from_outbox(
+        self, message: Union[bytes, str], exchange: str, routing_key: str
+    ):
+        """Publish on the event loop from the background thread of the outbox"""
+        asyncio.run_coroutine_threadsafe(
+            self._publish(message, exchange, routing_key), self._loop
+        ).result(timeout=PUBLISH_TIMEOUT)
+
+    async def publish_message(
+        self, message: Union[bytes, str], exchange: str, routing_key: str
+    ) -> bool:
+        """
+        Publishes a message to an exchange with a routing key.
+
+        Arguments:
+            message {Union[bytes, str]} -- Message to be posted.
+            exchange {str} -- Exchange to publish to.
+            routing_key {str} -- The routing key.
+        """
+
+        # While older messages wait in the outbox, queue behind them
+        if not self.outbox.pending:
+            try:
+                await self._publish(message, exchange, routing_key)
+                return True
+            except Exception as error:
+                logger.error(
+                    f"Cannot connect to RabbitMq {error}, storing message in the outbox."
+                )
+
+        try:
+            # Storing the message waits for an fsync
+            await asyncio.to_thread(self.outbox.add, message, exchange, routing_key)
+        except OSError as error:
+            logger.critical(
+                f"Message will not be delivered, manual publish needed: {error}",
+                xml=message.decode("utf-8") if isinstance(message, bytes) else message,
+            )
+        return False
+
+    async def close(self):
+        """Stop the outbox and close the connection"""
+        await asyncio.to_thread(self.outbox.close)
+        if self._connection is not None and not self._connection.is_closed:
+            await self._connection.close()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import base64
+import hashlib
+from typing import Callable, Dict, List, Set, Tuple
+from urllib.parse import quote
+
+from botocore.auth import S3SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+import httpx
+from lxml import etree
+from viaa.observability import logging
+
+from ..helpers.metrics import STAGE_DURATION
+from ..helpers.settings import get_config
+from .s3 import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_DELETE_BATCH_WINDOW,
+    DEFAULT_MAX_ATTEMPTS,
+    DEFAULT_MAX_POOL_CONNECTIONS,
+    DEFAULT_READ_TIMEOUT,
+    MAX_DELETE_BATCH_SIZE,
+    _run_callbacks,
+)
+
+config = get_config()
+logger = logging.get_logger(__name__, config=config)
+
+S3_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+DEFAULT_REGION = "us-east-1"
+
+
+class AsyncS3Client:
+    """S3 client for the async pipeline.
+
+    boto3 is synchronous, so requests are signed with the SigV4 signer of
+    botocore and sent with a shared `httpx.AsyncClient`. Only the
+    DeleteObjects operation is supported.
+    """
+
+    def __init__(self, config_dict: dict = None, transport: httpx.AsyncBaseTransport = None):
+        if not config_dict:
+            config_dict = config.config
+        s3_config = config_dict["environment"]["s3"]
+        self.host = s3_config["host"].rstrip("/")
+        self.region = s3_config.get("region", DEFAULT_REGION)
+        self.max_attempts = int(s3_config.get("max_attempts", DEFAULT_MAX_ATTEMPTS))
+        self._credentials = Credentials(
+            s3_config["aws_access_key_id"], s3_config["aws_secret_access_key"]
+        )
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                float(s3_config.get("read_timeout", DEFAULT_READ_TIMEOUT)),
+                connect=float(s3_config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+            ),
+            limits=httpx.Limits(
+                max_connections=int(
+                    s3_config.get("max_pool_connections", DEFAULT_MAX_POOL_CONNECTIONS)
+                )
+            ),
+            transport=transport,
+        )
+
+    def _signed_headers(self, method: str, url: str, body: bytes, headers: dict) -> dict:
+        request = AWSRequest(method=method, url=url, data=body, headers=headers)
+        S3SigV4Auth(self._credentials, "s3", self.region).add_auth(request)
+        return dict(request.headers.items())
+
+    async def _send(self, method: str, url: str, body: bytes, headers: dict) -> httpx.Response:
+        """Send a signed request, retrying connection errors and server errors"""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                response = await self._client.request(
+                    method,
+                    url,
+                    content=body,
+                    headers=self._signed_headers(method, url, body, headers),
+                )
+                if response.status_code < 500 or attempt == self.max_attempts:
+                    return response
+            except httpx.TransportError:
+                if attempt == self.max_attempts:
+                    raise
+            await asyncio.sleep(0.1 * 2 ** (attempt - 1))
+
+    @staticmethod
+    def _delete_request_body(s3_keys: List[str]) -> bytes:
+        delete = etree.Element(f"{{{S3_NAMESPACE}}}Delete", nsmap={None: S3_NAMESPACE})
+        for s3_key in s3_keys:
+            s3_object = etree.SubElement(delete, f"{{{S3_NAMESPACE}}}Object")
+            etree.SubElement(s3_object, f"{{{S3_NAMESPACE}}}Key").text = s3_key
+        return etree.tostring(delete, xml_declaration=True, encoding="UTF-8")
+
+    async def delete_objects(self, s3_bucket: str, s3_keys: List[str]) -> List[str]:
+        """Delete multiple objects of a bucket with DeleteObjects requests.
+
+        Arguments:
+            s3_bucket {str} -- Bucket of the objects.
+            s3_keys {List[str]} -- Keys of the objects to delete.
+
+        Returns:
+            List[str] -- The keys that were deleted.
+        """
+        deleted = []
+        url = f"{self.host}/{quote(s3_bucket)}?delete"
+        for start in range(0, len(s3_keys), MAX_DELETE_BATCH_SIZE):
+            batch = s3_keys[start:start + MAX_DELETE_BATCH_SIZE]
+            body = self._delete_request_body(batch)
+            headers = {
+                "Content-Type": "application/xml",
+                "Content-MD5": base64.b64encode(hashlib.md5(body).digest()).decode(),
+            }
+            try:
+                with STAGE_DURATION.labels(stage="s3_delete").time():
+                    response = await self._send("POST", url, body, headers)
+            except httpx.TransportError as e:
+                for s3_key in batch:
+                    logger.error(
+                        f"Unable to connect to endpoint: {self.host}/{s3_bucket}/{s3_key}",
+                        error=e,
+                        s3_bucket=s3_bucket,
+                        s3_key=s3_key
+                    )
+                continue
+            if response.status_code != 200:
+                for s3_key in batch:
+                    logger.error(
+                        f"Unable to delete s3 object in bucket: {s3_bucket} for key: {s3_key}",
+                        error=f"{response.status_code}: {response.text}",
+                        s3_bucket=s3_bucket,
+                        s3_key=s3_key
+                    )
+                continue
+
+            result = etree.fromstring(response.content)
+            for s3_key in result.xpath("//*[local-name()='Deleted']/*[local-name()='Key']/text()"):
+                deleted.append(s3_key)
+                logger.info(
+                    f"Deleted s3 object in bucket: {s3_bucket} for key: {s3_key}",
+                    s3_bucket=s3_bucket,
+                    s3_key=s3_key
+                )
+            for error in result.xpath("//*[local-name()='Error']"):
+                fields = {etree.QName(field).localname: field.text for field in error}
+                s3_key = fields.get("Key")
+                logger.error(
+                    f"Unable to delete s3 object in bucket: {s3_bucket} for key: {s3_key}",
+                    error=f"{fields.get('Code')}: {fields.get('Message')}",
+                    s3_bucket=s3_bucket,
+                    s3_key=s3_key
+                )
+        return deleted
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class AsyncS3BatchDeleter:
+    """Async version of `S3BatchDeleter`, running on the event loop.
+
+    Keys are collected per bucket and deleted once the first key of a bucket
+    has waited `delete_batch_window` seconds or the bucket has
+    `delete_batch_size` keys queued. A window of 0 disables batching.
+    """
+
+    def __init__(self, s3_client: AsyncS3Client, config_dict: dict = None):
+        if not config_dict:
+            config_dict = config.config
+        s3_config = config_dict["environment"]["s3"]
+        self.s3_client = s3_client
+        self.window = float(
+            s3_config.get("delete_batch_window", DEFAULT_DELETE_BATCH_WINDOW)
+        )
+        self.max_keys = min(
+            int(s3_config.get("delete_batch_size", MAX_DELETE_BATCH_SIZE)),
+            MAX_DELETE_BATCH_SIZE,
+        )
+        # Bucket -> (queued keys, callbacks)
+        self._pending: Dict[str, Tuple[List[str], List[Callable[[], None]]]] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+        self._deletes: Set[asyncio.Task] = set()
+
+    async def delete(self, s3_bucket: str, s3_key: str, callback: Callable[[], None] = None):
+        """Schedule an object for deletion.
+
+        Arguments:
+            s3_bucket {str} -- Bucket of the object.
+            s3_key {str} -- Key of the object.
+            callback {Callable} -- Called in a thread once the delete was
+                attempted.
+        """
+        callbacks = [callback] if callback is not None else []
+        if self.window <= 0:
+            await self._delete_batch(s3_bucket, [s3_key], callbacks)
+            return
+        keys, bucket_callbacks = self._pending.setdefault(s3_bucket, ([], []))
+        keys.append(s3_key)
+        bucket_callbacks.extend(callbacks)
+        if len(keys) >= self.max_keys:
+            self._start_delete(s3_bucket)
+        elif s3_bucket not in self._timers:
+            self._timers[s3_bucket] = asyncio.ensure_future(self._delete_later(s3_bucket))
+
+    async def _delete_later(self, s3_bucket: str):
+        await asyncio.sleep(self.window)
+        del self._timers[s3_bucket]
+        self._start_delete(s3_bucket)
+
+    def _start_delete(self, s3_bucket: str):
+        """Delete the queued keys of a bucket in the background"""
+        timer = self._timers.pop(s3_bucket, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        keys, callbacks = self._pending.pop(s3_bucket, ([], []))
+        if keys:
+            task = asyncio.ensure_future(self._delete_batch(s3_bucket, keys, callbacks))
+            self._deletes.add(task)
+            task.add_done_callback(self._deletes.discard)
+
+    async def _delete_batch(
+        self, s3_bucket: str, keys: List[str], callbacks: List[Callable[[], None]]
+    ):
+        try:
+            await self.s3_client.delete_objects(s3_bucket, keys)
+        except Exception as e:
+            logger.error(
+                f"Unable to delete {len(keys)} s3 object(s) in bucket: {s3_bucket}",
+                error=e,
+                s3_bucket=s3_bucket,
+            )
+        finally:
+            if callbacks:
+                await asyncio.to_thread(_run_callbacks, callbacks)
+
+    async def flush(self):
+        """Delete all queued keys and wait for batches that are in flight"""
+        for s3_bucket in list(self._pending):
+            self._start_delete(s3_bucket)
+        if self._deletes:
+            await asyncio.gather(*self._deletes)
+
+    async def close(self):
+        await self.flush()
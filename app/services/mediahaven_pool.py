@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import Future
+from contextlib import contextmanager
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from mediahaven import MediaHaven
+from mediahaven.mediahaven import MediaHavenException
+from viaa.observability import logging
+
+from ..helpers.settings import get_config
+
+config = get_config()
+logger = logging.get_logger(__name__, config=config)
+
+# Seconds before retrying a failed token refresh
+TOKEN_REFRESH_RETRY_DELAY = 30
+# Seconds before its expiry a token is refreshed, at most a tenth of its lifetime
+TOKEN_EXPIRY_MARGIN = 60
+# Seconds between two token refreshes, at least
+MIN_TOKEN_REFRESH_DELAY = 1
+
+
+def token_refresh_delay(interval: float, expires_in: Optional[float]) -> float:
+    """
+    Return the seconds until a token should be refreshed: a margin before it
+    expires, and `interval` at most.
+
+    Arguments:
+        interval {float} -- The longest delay between two refreshes.
+        expires_in {Optional[float]} -- Seconds until the token expires, or
+            None if that's unknown.
+    """
+    if expires_in is None:
+        return interval
+    margin = min(TOKEN_EXPIRY_MARGIN, expires_in / 10)
+    return max(min(interval, expires_in - margin), MIN_TOKEN_REFRESH_DELAY)
+
+
+class MediaHavenPool:
+    """Bounded pool of MediaHaven clients.
+
+    Every client holds its own OAuth2 token and session, so a client is only
+    used by one thread at a time while different threads query MediaHaven
+    concurrently. The amount of clients is the concurrency limit: callers
+    block until a client is returned to the pool.
+    """
+
+    def __init__(self, clients: List[MediaHaven]):
+        self.clients = list(clients)
+        # Idle clients, the most recently returned one is reused first
+        self._idle = list(self.clients)
+        self._cond = threading.Condition()
+        self._closed = threading.Event()
+        self._refresh_thread = None
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    @contextmanager
+    def client(self) -> Iterator[MediaHaven]:
+        """Borrow a client from the pool for the duration of the block"""
+        with self._cond:
+            while not self._idle:
+                self._cond.wait()
+            client = self._idle.pop()
+        try:
+            yield client
+        finally:
+            self._put(client)
+
+    def _put(self, client: MediaHaven):
+        with self._cond:
+            self._idle.append(client)
+            self._cond.notify_all()
+
+    def _take(self, client: MediaHaven):
+        """Take a specific client out of the pool, once it is idle"""
+        with self._cond:
+            while client not in self._idle:
+                self._cond.wait()
+            self._idle.remove(client)
+
+    def for_each_client(self, function: Callable[[MediaHaven], None]):
+        """Call `function` with every client, one at a time, while that client
+        is out of the pool. Every client is returned as soon as it was
+        handled, so the other clients keep serving requests."""
+        for client in self.clients:
+            self._take(client)
+            try:
+                function(client)
+            finally:
+                self._put(client)
+
+    def start_token_refresh(
+        self,
+        refresh: Callable[[MediaHaven], Optional[float]],
+        interval: float,
+        expires_in: Optional[float] = None,
+    ):
+        """Refresh the token of every client before it expires.
+
+        Refreshing ahead of the expiry of the tokens in a background thread
+        means requests never wait for a token renewal. `refresh` returns the
+        seconds until the new token of a client expires, if it's known. The
+        tokens are refreshed a margin before the first of them expires, and
+        every `interval` seconds at most.
+
+        Arguments:
+            refresh {Callable} -- Requests a new token for a client.
+            interval {float} -- The longest delay between two refreshes.
+            expires_in {Optional[float]} -- Seconds until the current tokens
+                expire, if it's known.
+        """
+        if self._refresh_thread is None:
+            self._refresh_thread = threading.Thread(
+                target=self._refresh_tokens,
+                args=(refresh, interval, expires_in),
+                name="mediahaven-token-refresh",
+                daemon=True,
+            )
+            self._refresh_thread.start()
+
+    def _refresh_tokens(
+        self,
+        refresh: Callable[[MediaHaven], Optional[float]],
+        interval: float,
+        expires_in: Optional[float],
+    ):
+        delay = token_refresh_delay(interval, expires_in)
+        while not self._closed.wait(delay):
+            expiries = []
+            try:
+                self.for_each_client(lambda client: expiries.append(refresh(client)))
+                expires_in = min(
+                    (expiry for expiry in expiries if expiry is not None), default=None
+                )
+                delay = token_refresh_delay(interval, expires_in)
+            except Exception as error:
+                logger.error(f"Refreshing the MediaHaven tokens failed: {error}")
+                delay = min(interval, TOKEN_REFRESH_RETRY_DELAY)
+
+    def close(self):
+        """Stop refreshing the tokens"""
+        self._closed.set()
+        if self._refresh_thread is not None:
+            self._refresh_thread.join()
+            self._refresh_thread = None
+
+
+class FragmentLookupBatcher:
+    """Resolves fragment lookups with as few MediaHaven requests as possible.
+
+    Like a group commit, a lookup becomes a leader and queries MediaHaven,
+    while lookups arriving in the meantime are combined in the next request,
+    a search for up to `batch_size` fragment IDs. A leader can also wait
+    `window` seconds for more lookups before its request. There are at most
+    as many leaders as clients in the pool, so batches are resolved
+    concurrently, and a leader stops leading as soon as its own lookups are
+    resolved. Lookups for a fragment that is already being looked up wait
+    for that result instead of querying MediaHaven again.
+
+    A batch with a single ID uses a plain `records.get`. Fragments missing
+    from a search result are fetched one by one, so that errors such as a
+    404 are reported per fragment.
+    """
+
+    SEARCH_FIELD = "FragmentId"
+
+    def __init__(self, window: float = 0, batch_size: int = 100):
+        self.window = window
+        self.batch_size = batch_size
+        self._cond = threading.Condition()
+        self._in_flight: Dict[str, Future] = {}
+        self._pending: List[str] = []
+        self._leaders = 0
+
+    def get(self, mh_pool: MediaHavenPool, fragment_id: str):
+        """Get the record of a fragment.
+
+        Raises:
+            MediaHavenException -- If the fragment could not be fetched.
+        """
+        if self.batch_size <= 1:
+            return self._get_single(mh_pool, fragment_id)
+        future = self._register([fragment_id])[fragment_id]
+        self._wait(mh_pool, [future], self.window)
+        fragment = future.result()
+        if fragment is None:
+            fragment = self._get_single(mh_pool, fragment_id)
+        return fragment
+
+    def prefetch(self, mh_pool: MediaHavenPool, fragment_ids: List[str]) -> dict:
+        """Look up multiple fragments at once, without waiting for a window.
+
+        Returns:
+            dict -- The records that were found, by fragment ID.
+        """
+        registered = self._register(fragment_ids)
+        self._wait(mh_pool, list(registered.values()), 0)
+        fragments = {}
+        for fragment_id, future in registered.items():
+            try:
+                fragment = future.result()
+            except MediaHavenException:
+                continue
+            if fragment is not None:
+                fragments[fragment_id] = fragment
+        return fragments
+
+    def _register(self, fragment_ids: List[str]) -> Dict[str, Future]:
+        """Get or create the futures of the given fragment IDs"""
+        registered = {}
+        with self._cond:
+            for fragment_id in fragment_ids:
+                future = self._in_flight.get(fragment_id)
+                if future is None:
+                    future = Future()
+                    self._in_flight[fragment_id] = future
+                    self._pending.append(fragment_id)
+                registered[fragment_id] = future
+            # Wake leaders waiting for a batch and callers that may lead
+            self._cond.notify_all()
+        return registered
+
+    def _wait(self, mh_pool: MediaHavenPool, futures: List[Future], window: float):
+        """Wait until the futures are resolved, resolving batches as a leader
+        while there are pending lookups and fewer leaders than clients."""
+        max_leaders = max(len(mh_pool), 1)
+        while True:
+            with self._cond:
+                while not all(future.done() for future in futures) and (
+                    not self._pending or self._leaders >= max_leaders
+                ):
+                    self._cond.wait()
+                if all(future.done() for future in futures):
+                    return
+                self._leaders += 1
+                deadline = time.monotonic() + window
+                remaining = window
+                while 0 < len(self._pending) < self.batch_size and remaining > 0:
+                    self._cond.wait(remaining)
+                    remaining = deadline - time.monotonic()
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+            try:
+                if batch:
+                    self._resolve(mh_pool, batch)
+            finally:
+                with self._cond:
+                    self._leaders -= 1
+                    self._cond.notify_all()
+
+    def _resolve(self, mh_pool: MediaHavenPool, batch: List[str]):
+        results, error = {}, None
+        try:
+            if len(batch) == 1:
+                results[batch[0]] = self._get_single(mh_pool, batch[0])
+            else:
+                results = self._search(mh_pool, batch)
+        except MediaHavenException as e:
+            # A failing search falls back to looking up the fragments one by one
+            if len(batch) == 1:
+                error = e
+        except Exception as e:
+            error = e
+        with self._cond:
+            futures = [self._in_flight.pop(fragment_id) for fragment_id in batch]
+        for fragment_id, future in zip(batch, futures):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results.get(fragment_id))
+
+    def _search(self, mh_pool: MediaHavenPool, fragment_ids: List[str]) -> dict:
+        query = " ".join(f"{self.SEARCH_FIELD}:{fragment_id}" for fragment_id in fragment_ids)
+        with mh_pool.client() as mh_client:
+            page = mh_client.records.search(
+                q=f"+({query})", nrOfResults=len(fragment_ids)
+            )
+            return {record.Internal.FragmentId: record for record in page.as_generator()}
+
+    @staticmethod
+    def _get_single(mh_pool: MediaHavenPool, fragment_id: str):
+        with mh_pool.client() as mh_client:
+            return mh_client.records.get(fragment_id)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import base64
+from collections import OrderedDict
+import threading
+from typing import Callable, Union
+import uuid
+
+from viaa.observability import logging
+
+from ..helpers.group_commit_log import GroupCommitLog
+from ..helpers.settings import get_config
+
+config = get_config()
+logger = logging.get_logger(__name__, config=config)
+
+
+def _body(record: dict) -> Union[bytes, str]:
+    """Return the message of an outbox record as it was added"""
+    if record.get("encoding") == "base64":
+        return base64.b64decode(record["body"])
+    return record["body"]
+
+
+class Outbox(object):
+    """Durable store for messages that could not be published to RabbitMQ.
+
+    Messages are written to an append-only log before `add` returns, so they
+    survive a restart. A single background scheduler drains the outbox in
+    order and backs off exponentially while the broker stays unreachable.
+    The log is compacted to the pending messages once it holds
+    `compact_after` delivered ones, and more delivered than pending ones.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        publish: Callable[[Union[bytes, str], str, str], None],
+        base_delay: float = 1,
+        max_delay: float = 300,
+        compact_after: int = 1000,
+    ):
+        self.path = path
+        self._publish = publish
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.compact_after = compact_after
+        self._log = GroupCommitLog(path)
+        self._entries = None
+        # The amount of delivered messages in the log
+        self._delivered = 0
+        # Delivered messages whose "done" record still has to be written
+        self._unrecorded = []
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._failures = 0
+        self._thread = None
+
+    def _load(self):
+        """Load the undelivered messages from disk, once"""
+        with self._lock:
+            if self._entries is not None:
+                return
+            entries = OrderedDict()
+            delivered = set()
+            for record in self._log.records():
+                if record["op"] == "add":
+                    entries[record["id"]] = record
+                elif record["op"] == "done":
+                    delivered.add(record["id"])
+            for entry_id in delivered:
+                entries.pop(entry_id, None)
+            self._entries = entries
+            self._delivered = len(delivered)
+        if entries:
+            logger.warning(f"Outbox contains {len(entries)} undelivered message(s).")
+
+    @property
+    def pending(self) -> int:
+        self._load()
+        return len(self._entries)
+
+    def start(self):
+        """Load the outbox and start the background scheduler"""
+        self._load()
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="rabbit-outbox", daemon=True
+            )
+            self._thread.start()
+        if self._entries:
+            self._wakeup.set()
+
+    def add(self, message: Union[bytes, str], exchange: str, routing_key: str):
+        """Durably store a message and schedule its delivery"""
+        self._load()
+        record = {
+            "op": "add",
+            "id": uuid.uuid4().hex,
+            "exchange": exchange,
+            "routing_key": routing_key,
+        }
+        # The log holds JSON, which can't contain bytes
+        if isinstance(message, bytes):
+            record["body"] = base64.b64encode(message).decode("ascii")
+            record["encoding"] = "base64"
+        else:
+            record["body"] = message
+        with self._lock:
+            self._entries[record["id"]] = record
+        try:
+            self._log.append(record)
+        except OSError:
+            with self._lock:
+                self._entries.pop(record["id"], None)
+            raise
+        self._wakeup.set()
+
+    def drain(self) -> bool:
+        """Publish the pending messages in order.
+
+        Returns:
+            bool -- False if publishing failed and should be retried later.
+        """
+        self._load()
+        with self._drain_lock:
+            if not self._record_delivered():
+                return False
+            with self._lock:
+                entries = list(self._entries.values())
+            for entry in entries:
+                try:
+                    self._publish(_body(entry), entry["exchange"], entry["routing_key"])
+                except Exception as error:
+                    logger.warning(
+                        f"Outbox delivery failed, {self.pending} message(s) pending: {error}",
+                        retry=self._failures + 1,
+                    )
+                    return False
+                # Not published again, even if recording it fails
+                with self._lock:
+                    self._entries.pop(entry["id"], None)
+                self._unrecorded.append(entry["id"])
+                if not self._record_delivered():
+                    return False
+            if not self._compact():
+                return False
+        if entries:
+            logger.info(f"Outbox delivered {len(entries)} message(s).")
+        return True
+
+    def _record_delivered(self) -> bool:
+        """Write the "done" records of the delivered messages.
+
+        Returns:
+            bool -- False if writing failed and should be retried later.
+        """
+        while self._unrecorded:
+            try:
+                self._log.append({"op": "done", "id": self._unrecorded[0]})
+            except OSError as error:
+                logger.error(
+                    f"Unable to record a delivered outbox message, retrying: {error}",
+                    retry=self._failures + 1,
+                )
+                return False
+            self._unrecorded.pop(0)
+            self._delivered += 1
+        return True
+
+    def _compact(self) -> bool:
+        """Compact the log to the pending messages, if it's due.
+
+        Returns:
+            bool -- False if compacting failed and should be retried later.
+        """
+        with self._lock:
+            if self._delivered < max(self.compact_after, len(self._entries)):
+                return True
+            try:
+                self._log.rewrite(list(self._entries.values()))
+            except OSError as error:
+                logger.error(
+                    f"Unable to compact the outbox, retrying: {error}",
+                    retry=self._failures + 1,
+                )
+                return False
+            self._delivered = 0
+        return True
+
+    def _run(self):
+        delay = None
+        while not self._closed.is_set():
+            if delay is None:
+                # Nothing is failing: sleep until a message is added
+                self._wakeup.wait()
+            else:
+                # Back off, regardless of newly added messages
+                self._closed.wait(delay)
+            self._wakeup.clear()
+            if self._closed.is_set():
+                break
+            if self.drain():
+                self._failures = 0
+                delay = None
+            else:
+                self._failures += 1
+                delay = min(self.base_delay * 2 ** (self._failures - 1), self.max_delay)
+
+    def close(self):
+        self._closed.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._log.close()
@@ -1,66 +1,243 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import pika
-from pika.credentials import PlainCredentials
-from viaa.configuration import ConfigParser
+from contextlib import contextmanager
+import queue
+import threading
+from typing import TYPE_CHECKING, Union
+
 from viaa.observability import logging
-import time
 
-config = ConfigParser()
+from ..helpers.settings import get_config
+from .outbox import Outbox
+
+# pika is imported when the service is created, it slows down the start of the
+# application while the async pipeline doesn't need it
+if TYPE_CHECKING:
+    import pika
+
+config = get_config()
 logger = logging.get_logger(__name__, config=config)
 
+# Defaults for the optional connection pool settings
+DEFAULT_POOL_SIZE = 2
+DEFAULT_HEARTBEAT = 60
+DEFAULT_OUTBOX_PATH = "outbox/rabbit.log"
+
+
+class _PooledConnection(object):
+    """A long-lived pika connection together with its publishing channel"""
+
+    def __init__(self, connection: "pika.BlockingConnection", amqp_error: type):
+        self.connection = connection
+        self.channel = self.connection.channel()
+        self._amqp_error = amqp_error
+
+    @property
+    def is_open(self) -> bool:
+        return self.connection.is_open and self.channel.is_open
+
+    def process_data_events(self):
+        """Service heartbeats and pending frames without blocking"""
+        self.connection.process_data_events(time_limit=0)
+
+    def close(self):
+        try:
+            if self.connection.is_open:
+                self.connection.close()
+        except self._amqp_error:
+            pass
+
 
 class RabbitService(object):
-    def __init__(self, config: dict = None, ctx=None):
+    """Thread-safe publisher backed by a small pool of long-lived connections.
+
+    A pika `BlockingConnection` is not thread-safe, so every connection (and
+    its channel) is only ever used by the thread that checked it out of the
+    pool. Connections are opened lazily, reopened when they were closed by
+    the broker and kept alive with heartbeats while they sit idle.
+
+    Messages that can't be published are stored in an on-disk outbox and
+    retried in the background, so callers never wait for the broker.
+    """
+
+    def __init__(self, config: dict = None, ctx=None, outbox_path: str = None):
         self.context = ctx
         self.name = "RabbitMQ Service"
-        self.retrycount = 1
-        self.host = config["environment"]["rabbit"]["host"]
+        import pika
+        from pika.credentials import PlainCredentials
+        from pika.exceptions import AMQPError
+
+        # Kept so that connecting and publishing don't import pika again
+        self._pika = pika
+        self._amqp_error = AMQPError
+        self._properties = pika.BasicProperties(delivery_mode=2,)
+        rabbit_config = config["environment"]["rabbit"]
+        self.host = rabbit_config["host"]
         credentials = PlainCredentials(
-            config["environment"]["rabbit"]["username"],
-            config["environment"]["rabbit"]["password"],
+            rabbit_config["username"],
+            rabbit_config["password"],
         )
+        self.heartbeat = int(rabbit_config.get("heartbeat", DEFAULT_HEARTBEAT))
         self.connection_params = pika.ConnectionParameters(
-            host=self.host, credentials=credentials,
+            host=self.host,
+            credentials=credentials,
+            heartbeat=self.heartbeat,
+            blocked_connection_timeout=self.heartbeat,
+        )
+        self.pool_size = int(rabbit_config.get("pool_size", DEFAULT_POOL_SIZE))
+        # Every slot holds an open connection or None if it still needs to
+        # be (re)connected. Taking a slot blocks when all of them are in use.
+        self._pool = queue.LifoQueue(maxsize=self.pool_size)
+        for _ in range(self.pool_size):
+            self._pool.put(None)
+        self._closed = threading.Event()
+        self._heartbeat_thread = None
+        self._heartbeat_lock = threading.Lock()
+        self.outbox = Outbox(
+            outbox_path or rabbit_config.get("outbox_path", DEFAULT_OUTBOX_PATH),
+            self._publish,
+            base_delay=float(rabbit_config.get("retry_base_delay", 1)),
+            max_delay=float(rabbit_config.get("retry_max_delay", 300)),
+        )
+
+    def start(self):
+        """Start delivering messages left in the outbox"""
+        self.outbox.start()
+
+    def warm_up(self):
+        """Open all pooled connections ahead of the first publish"""
+        slots = [self._pool.get() for _ in range(self.pool_size)]
+        try:
+            for index, pooled in enumerate(slots):
+                if pooled is None or not pooled.is_open:
+                    slots[index] = self._connect()
+        finally:
+            for pooled in slots:
+                self._pool.put(pooled)
+
+    def _connect(self) -> _PooledConnection:
+        pooled = _PooledConnection(
+            self._pika.BlockingConnection(self.connection_params), self._amqp_error
         )
+        self._start_heartbeat()
+        return pooled
+
+    def _start_heartbeat(self):
+        """Start the thread servicing heartbeats of idle connections"""
+        with self._heartbeat_lock:
+            if self._heartbeat_thread is None and self.heartbeat:
+                self._heartbeat_thread = threading.Thread(
+                    target=self._heartbeat_loop,
+                    name="rabbit-heartbeat",
+                    daemon=True,
+                )
+                self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self):
+        # Idle connections don't process any frames, so the broker would close
+        # them after missing a couple of heartbeats. Periodically take the idle
+        # connections out of the pool and let pika answer the heartbeats.
+        while not self._closed.wait(self.heartbeat / 2):
+            idle = []
+            try:
+                while True:
+                    idle.append(self._pool.get_nowait())
+            except queue.Empty:
+                pass
+            for index, pooled in enumerate(idle):
+                if pooled is None:
+                    continue
+                try:
+                    pooled.process_data_events()
+                except self._amqp_error as error:
+                    logger.warning(f"Dropping broken RabbitMQ connection: {error}")
+                    pooled.close()
+                    idle[index] = None
+            for pooled in idle:
+                self._pool.put(pooled)
+
+    @contextmanager
+    def _checkout(self):
+        """Take a connection out of the pool and return it when done.
+
+        A slot is handed back empty if its connection broke while in use, so
+        the next user reconnects.
+        """
+        pooled = self._pool.get()
+        try:
+            if pooled is not None and not pooled.is_open:
+                pooled.close()
+                pooled = None
+            if pooled is None:
+                pooled = self._connect()
+            yield pooled
+        except Exception:
+            if pooled is not None:
+                pooled.close()
+            pooled = None
+            raise
+        finally:
+            self._pool.put(pooled)
+
+    def _publish(self, message: Union[bytes, str], exchange: str, routing_key: str):
+        """Publish on a pooled channel, reconnecting once if the connection
+        turns out to be stale."""
+        for attempt in (1, 2):
+            try:
+                with self._checkout() as pooled:
+                    pooled.channel.basic_publish(
+                        exchange=exchange,
+                        routing_key=routing_key,
+                        body=message,
+                        properties=self._properties,
+                    )
+                return
+            except self._amqp_error as error:
+                if attempt == 2:
+                    raise
+                logger.warning(f"RabbitMQ connection lost, reconnecting: {error}")
 
-    def publish_message(self, message: str, exchange: str, routing_key: str) -> bool:
+    def publish_message(
+        self, message: Union[bytes, str], exchange: str, routing_key: str
+    ) -> bool:
         """
         Publishes a message to an exchange with a routing key.
 
         Arguments:
-            message {str} -- Message to be posted.
+            message {Union[bytes, str]} -- Message to be posted.
             exchange {str} -- Exchange to publish to.
             routing_key {str} -- The routing key.
         """
 
+        # While older messages wait in the outbox, queue behind them instead
+        # of trying (and waiting for) a broker that is known to be down.
+        if not self.outbox.pending:
+            try:
+                self._publish(message, exchange, routing_key)
+                return True
+            except Exception as error:
+                logger.error(
+                    f"Cannot connect to RabbitMq {error}, storing message in the outbox."
+                )
+
         try:
-            connection = pika.BlockingConnection(self.connection_params)
-        except Exception as error:
+            self.outbox.add(message, exchange, routing_key)
+        except OSError as error:
             logger.critical(
-                f"Cannot connect to RabbitMq {error}", retry=self.retrycount
+                f"Message will not be delivered, manual publish needed: {error}",
+                xml=message.decode("utf-8") if isinstance(message, bytes) else message,
             )
-            if self.retrycount <= 10:
-                time.sleep(60 * self.retrycount)
-                self.retrycount = self.retrycount + 1
-                self.publish_message(message, exchange, routing_key)
-            else:
-                logger.critical(
-                    f"Message will not be delivered, manual publish needed.",
-                    xml=message,
-                )
-            return False
-
-        channel = connection.channel()
-
-        channel.basic_publish(
-            exchange=exchange,
-            routing_key=routing_key,
-            body=message,
-            properties=pika.BasicProperties(delivery_mode=2,),
-        )
-
-        connection.close()
+        return False
 
-        return True
+    def close(self):
+        """Stop the outbox and close all pooled connections"""
+        self.outbox.close()
+        self._closed.set()
+        for _ in range(self.pool_size):
+            try:
+                pooled = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            if pooled is not None:
+                pooled.close()
@@ -1,47 +1,284 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import boto3
-from botocore.exceptions import ClientError, EndpointConnectionError
+from collections import OrderedDict
+import threading
+import time
+from typing import Callable, List
 
-from viaa.configuration import ConfigParser
 from viaa.observability import logging
 
-config = ConfigParser()
+from ..helpers.metrics import STAGE_DURATION
+from ..helpers.settings import get_config
+
+config = get_config()
 logger = logging.get_logger(__name__, config=config)
 
+# Defaults for the optional client tuning settings
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_RETRY_MODE = "standard"
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_DELETE_BATCH_WINDOW = 0.5
+# Maximum amount of keys in a single DeleteObjects request
+MAX_DELETE_BATCH_SIZE = 1000
+
 
 class S3Client:
+    """Wrapper around a boto3 S3 client.
+
+    Creating a boto3 client is expensive and every client has its own HTTP
+    connection pool, so a single instance should be shared by the process.
+    boto3 clients are thread-safe.
+    """
+
     def __init__(self, config_dict: dict = None):
         if not config_dict:
             config_dict = config.config
-        self.host = config_dict["environment"]["s3"]["host"]
+        s3_config = config_dict["environment"]["s3"]
+        self.host = s3_config["host"]
+        # Imported when the client is created: importing boto3 slows down the
+        # start of the application, while the async pipeline doesn't need it
+        import boto3
+        from botocore.config import Config
+        from botocore.exceptions import ClientError, EndpointConnectionError
+
+        # Kept so that deleting doesn't import botocore again
+        self._client_error = ClientError
+        self._endpoint_connection_error = EndpointConnectionError
+
+        client_config = Config(
+            max_pool_connections=int(
+                s3_config.get("max_pool_connections", DEFAULT_MAX_POOL_CONNECTIONS)
+            ),
+            connect_timeout=float(
+                s3_config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT)
+            ),
+            read_timeout=float(s3_config.get("read_timeout", DEFAULT_READ_TIMEOUT)),
+            retries={
+                "mode": s3_config.get("retry_mode", DEFAULT_RETRY_MODE),
+                "max_attempts": int(
+                    s3_config.get("max_attempts", DEFAULT_MAX_ATTEMPTS)
+                ),
+            },
+        )
         self.client = boto3.client(
             's3',
-            aws_access_key_id=config_dict["environment"]["s3"]["aws_access_key_id"],
-            aws_secret_access_key=config_dict["environment"]["s3"]["aws_secret_access_key"],
-            endpoint_url=self.host
+            aws_access_key_id=s3_config["aws_access_key_id"],
+            aws_secret_access_key=s3_config["aws_secret_access_key"],
+            endpoint_url=self.host,
+            config=client_config,
         )
 
     def delete_object(self, s3_bucket: str, s3_key: str):
         try:
-            self.client.delete_object(Bucket=s3_bucket, Key=s3_key)
+            with STAGE_DURATION.labels(stage="s3_delete").time():
+                self.client.delete_object(Bucket=s3_bucket, Key=s3_key)
             logger.info(
                 f"Deleted s3 object in bucket: {s3_bucket} for key: {s3_key}",
                 s3_bucket=s3_bucket,
                 s3_key=s3_key
             )
-        except ClientError as e:
+        except self._client_error as e:
             logger.error(
                 f"Unable to delete s3 object in bucket: {s3_bucket} for key: {s3_key}",
                 error=e,
                 s3_bucket=s3_bucket,
                 s3_key=s3_key
             )
-        except EndpointConnectionError as e:
+        except self._endpoint_connection_error as e:
             logger.error(
                 f"Unable to connect to endpoint: {self.host}/{s3_bucket}/{s3_key}",
                 error=e,
                 s3_bucket=s3_bucket,
                 s3_key=s3_key
             )
+
+    def delete_objects(self, s3_bucket: str, s3_keys: List[str]) -> List[str]:
+        """Delete multiple objects of a bucket with DeleteObjects requests.
+
+        Arguments:
+            s3_bucket {str} -- Bucket of the objects.
+            s3_keys {List[str]} -- Keys of the objects to delete.
+
+        Returns:
+            List[str] -- The keys that were deleted.
+        """
+        deleted = []
+        for start in range(0, len(s3_keys), MAX_DELETE_BATCH_SIZE):
+            batch = s3_keys[start:start + MAX_DELETE_BATCH_SIZE]
+            try:
+                with STAGE_DURATION.labels(stage="s3_delete").time():
+                    response = self.client.delete_objects(
+                        Bucket=s3_bucket,
+                        Delete={"Objects": [{"Key": key} for key in batch]},
+                    )
+            except self._client_error as e:
+                for s3_key in batch:
+                    logger.error(
+                        f"Unable to delete s3 object in bucket: {s3_bucket} for key: {s3_key}",
+                        error=e,
+                        s3_bucket=s3_bucket,
+                        s3_key=s3_key
+                    )
+                continue
+            except self._endpoint_connection_error as e:
+                for s3_key in batch:
+                    logger.error(
+                        f"Unable to connect to endpoint: {self.host}/{s3_bucket}/{s3_key}",
+                        error=e,
+                        s3_bucket=s3_bucket,
+                        s3_key=s3_key
+                    )
+                continue
+
+            for result in response.get("Deleted", []):
+                s3_key = result["Key"]
+                deleted.append(s3_key)
+                logger.info(
+                    f"Deleted s3 object in bucket: {s3_bucket} for key: {s3_key}",
+                    s3_bucket=s3_bucket,
+                    s3_key=s3_key
+                )
+            for result in response.get("Errors", []):
+                s3_key = result["Key"]
+                logger.error(
+                    f"Unable to delete s3 object in bucket: {s3_bucket} for key: {s3_key}",
+                    error=f"{result.get('Code')}: {result.get('Message')}",
+                    s3_bucket=s3_bucket,
+                    s3_key=s3_key
+                )
+        return deleted
+
+
+def _run_callbacks(callbacks: List[Callable[[], None]]):
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"S3 delete callback failed: {e!r}")
+
+
+class S3BatchDeleter:
+    """Coalesces object deletes into multi-object DeleteObjects requests.
+
+    Keys are collected per bucket and deleted by a background thread once the
+    first key of a bucket has waited `delete_batch_window` seconds or the
+    bucket has `delete_batch_size` keys queued. A window of 0 disables
+    batching: every key is then deleted right away with `delete_object`.
+    """
+
+    def __init__(self, s3_client: S3Client, config_dict: dict = None):
+        if not config_dict:
+            config_dict = config.config
+        s3_config = config_dict["environment"]["s3"]
+        self.s3_client = s3_client
+        self.window = float(
+            s3_config.get("delete_batch_window", DEFAULT_DELETE_BATCH_WINDOW)
+        )
+        self.max_keys = min(
+            int(s3_config.get("delete_batch_size", MAX_DELETE_BATCH_SIZE)),
+            MAX_DELETE_BATCH_SIZE,
+        )
+        # Bucket -> (monotonic time of the oldest key, queued keys, callbacks)
+        self._pending = OrderedDict()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+
+    def delete(self, s3_bucket: str, s3_key: str, callback: Callable[[], None] = None):
+        """Schedule an object for deletion.
+
+        Arguments:
+            s3_bucket {str} -- Bucket of the object.
+            s3_key {str} -- Key of the object.
+            callback {Callable} -- Called once the delete was attempted.
+        """
+        if self.window <= 0:
+            try:
+                self.s3_client.delete_object(s3_bucket, s3_key)
+            finally:
+                if callback is not None:
+                    _run_callbacks([callback])
+            return
+        with self._cond:
+            if s3_bucket not in self._pending:
+                self._pending[s3_bucket] = (time.monotonic(), [], [])
+            _, keys, callbacks = self._pending[s3_bucket]
+            keys.append(s3_key)
+            if callback is not None:
+                callbacks.append(callback)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="s3-batch-deleter", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _take_due(self, force: bool = False) -> list:
+        """Remove and return the batches that should be deleted now.
+
+        Must be called with the condition held.
+        """
+        now = time.monotonic()
+        due = []
+        for s3_bucket, (since, keys, callbacks) in list(self._pending.items()):
+            if force or len(keys) >= self.max_keys or now - since >= self.window:
+                del self._pending[s3_bucket]
+                due.append((s3_bucket, keys, callbacks))
+        self._in_flight += len(due)
+        return due
+
+    def _next_timeout(self):
+        if not self._pending:
+            return None
+        oldest = min(since for since, _, _ in self._pending.values())
+        return max(oldest + self.window - time.monotonic(), 0)
+
+    def _delete_batches(self, batches: list):
+        for s3_bucket, keys, callbacks in batches:
+            try:
+                self.s3_client.delete_objects(s3_bucket, keys)
+            except Exception as e:
+                logger.error(
+                    f"Unable to delete {len(keys)} s3 object(s) in bucket: {s3_bucket}",
+                    error=e,
+                    s3_bucket=s3_bucket,
+                )
+            finally:
+                _run_callbacks(callbacks)
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batches = self._take_due(force=self._closed)
+                while not batches and not self._closed:
+                    self._cond.wait(self._next_timeout())
+                    batches = self._take_due(force=self._closed)
+                if not batches and self._closed:
+                    return
+            self._delete_batches(batches)
+
+    def flush(self):
+        """Delete all queued keys and wait for batches that are in flight"""
+        with self._cond:
+            batches = self._take_due(force=True)
+        self._delete_batches(batches)
+        with self._cond:
+            while self._in_flight:
+                self._cond.wait()
+
+    def close(self):
+        """Delete all queued keys and stop the background thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
@@ -1,31 +1,73 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import logging
+import glob
+import os
+import tempfile
 
-from uvicorn import Config, Server
+import uvicorn
 
-from viaa.configuration import ConfigParser
+from app.helpers.settings import get_config
 
 
-cfg_log_level = ConfigParser().config["logging"]["level"]
+config = get_config().config
+cfg_log_level = config["logging"]["level"]
 # Uvicorn expects lowercase string or integer as the logging level.
 LOG_LEVEL = cfg_log_level.lower() if isinstance(cfg_log_level, str) else cfg_log_level
 
-if __name__ == "__main__":
-    server = Server(
-        Config(
-            "app.app:app",
-            host="0.0.0.0",
-            port=8080,
-            access_log=False,
-            log_level=LOG_LEVEL,
-        ),
+# Don't give the Uvicorn loggers any handlers, as our own loggers log in a JSON
+# format. Uvicorn applies this config in every worker process, so the handlers
+# can't be removed after the fact like with a single process.
+LOG_CONFIG = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "loggers": {
+        "uvicorn": {"handlers": [], "level": "INFO", "propagate": False},
+        "uvicorn.error": {"level": "INFO"},
+        "uvicorn.access": {"handlers": [], "level": "INFO", "propagate": False},
+    },
+}
+
+server_config = config["environment"].get("server", {})
+WORKERS = int(server_config.get("workers", 1))
+
+
+def _limit_concurrency():
+    limit_concurrency = server_config.get("limit_concurrency")
+    return int(limit_concurrency) if limit_concurrency else None
+
+
+def _prepare_multiprocess_metrics():
+    """Let the worker processes share their Prometheus metrics through files"""
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or server_config.get(
+        "metrics_dir"
     )
+    if not metrics_dir:
+        metrics_dir = tempfile.mkdtemp(prefix="prometheus-")
+    os.makedirs(metrics_dir, exist_ok=True)
+    # Metrics of a previous run would be added to the new ones
+    for metrics_file in glob.glob(os.path.join(metrics_dir, "*.db")):
+        os.remove(metrics_file)
+    # Set before the workers import prometheus_client
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+
 
-    # Remove the Uvicorn logging handlers, as our own loggers log in a JSON format.
-    # Just remove them all although the access handler is already removed by "access_log=False".
-    for name, logger in logging.root.manager.loggerDict.items():
-        if name.startswith("uvicorn"):
-            logger.handlers = []
+if __name__ == "__main__":
+    if WORKERS > 1:
+        _prepare_multiprocess_metrics()
 
-    server.run()
+    # Every worker process imports the app and creates its own MediaHaven,
+    # RabbitMQ and S3 clients in the startup handlers.
+    uvicorn.run(
+        "app.app:app",
+        host="0.0.0.0",
+        port=8080,
+        workers=WORKERS,
+        loop=server_config.get("loop", "auto"),
+        http=server_config.get("http", "auto"),
+        backlog=int(server_config.get("backlog", 2048)),
+        limit_concurrency=_limit_concurrency(),
+        timeout_keep_alive=int(server_config.get("timeout_keep_alive", 5)),
+        access_log=False,
+        log_level=LOG_LEVEL,
+        log_config=LOG_CONFIG,
+    )
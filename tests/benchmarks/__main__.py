@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Microbenchmarks for the hot paths of the event handler.
+
+Run from the root of the repository:
+
+    $ python -m tests.benchmarks --output bench.json
+    $ python -m tests.benchmarks --compare bench.json
+
+Every benchmark reports the throughput in events per second and the p50
+and p99 latency of a single operation. With `--compare`, the results are
+compared to an earlier run and regressions are reported.
+"""
+
+import argparse
+from contextlib import ExitStack
+import gc
+import json
+import sys
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+from unittest.mock import patch
+
+from app.helpers.events_parser import (
+    PremisEvent,
+    PremisEvents,
+    PremisPayloadParser,
+    prescan,
+)
+from app.helpers.xml_helper import XMLBuilder, XMLTemplate
+from tests.benchmarks.payloads import generate_actionable_payload, generate_payload
+from tests.benchmarks.stand_ins import (
+    FakeMediaHavenPool,
+    FakeRabbitService,
+    FakeS3Deleter,
+)
+from tests.resources import single_premis_event_nok
+
+PAYLOAD_SIZES = [1, 10, 100, 1000]
+FRAGMENT_INFO = {
+    "pid": "a1b2c3d4e5",
+    "md5": "0123456789abcdef0123456789abcdef",
+    "s3_object_key": "a1b2c3d4e5.mxf",
+    "s3_bucket": "bucket",
+}
+TIMESTAMP = "2019-03-30T05:28:40Z"
+BENCH_CONFIG = {
+    "environment": {
+        "rabbit": {"exchange": "exchange", "exchange_nok": "nok", "queue": "queue"}
+    }
+}
+
+
+class Benchmark:
+    """A named operation that handles `events` events per call"""
+
+    def __init__(self, name: str, operation: Callable, events: int = 1, setup=None):
+        self.name = name
+        self.operation = operation
+        self.events = events
+        self.setup = setup
+
+    def run(self, min_time: float, min_rounds: int) -> Dict[str, float]:
+        with ExitStack() as stack:
+            if self.setup:
+                self.setup(stack)
+            # Warm up caches and lazily created objects
+            self.operation()
+            timings = []
+            gc.collect()
+            gc.disable()
+            try:
+                started = time.perf_counter()
+                while (
+                    len(timings) < min_rounds
+                    or time.perf_counter() - started < min_time
+                ):
+                    start = time.perf_counter_ns()
+                    self.operation()
+                    timings.append(time.perf_counter_ns() - start)
+            finally:
+                gc.enable()
+        timings.sort()
+        return {
+            "events_per_sec": self.events * 1e9 * len(timings) / sum(timings),
+            "p50_us": _percentile(timings, 50) / 1000,
+            "p99_us": _percentile(timings, 99) / 1000,
+            "rounds": len(timings),
+        }
+
+
+def _percentile(sorted_timings: List[int], percentile: float) -> float:
+    index = round((len(sorted_timings) - 1) * percentile / 100)
+    return sorted_timings[index]
+
+
+def _parser_benchmarks() -> List[Benchmark]:
+    benchmarks = []
+    for size in PAYLOAD_SIZES:
+        payload = generate_payload(size)
+        elements = [event.xml_element for event in PremisEvents(payload).events]
+        benchmarks += [
+            Benchmark(f"prescan[{size}]", lambda p=payload: prescan(p), size),
+            Benchmark(f"parse_dom[{size}]", lambda p=payload: PremisEvents(p), size),
+            Benchmark(
+                f"parse_stream[{size}]",
+                lambda p=payload: PremisEvents(p, stream=True),
+                size,
+            ),
+            Benchmark(
+                f"parse_payload[{size}]",
+                lambda p=payload: _parse_payload(p),
+                size,
+            ),
+            Benchmark(
+                f"extract_fields[{size}]",
+                lambda e=elements: [PremisEvent(element) for element in e],
+                size,
+            ),
+        ]
+    return benchmarks
+
+
+def _parse_payload(payload: bytes, chunk_size: int = 64 * 1024):
+    """Parse a payload like the endpoint does, in chunks as they arrive, and
+    detach the events as they are complete"""
+    events = []
+
+    def accept(event):
+        event.detach()
+        events.append(event)
+
+    parser = PremisPayloadParser(on_event=accept)
+    for start in range(0, len(payload), chunk_size):
+        parser.feed(payload[start:start + chunk_size])
+    parser.close()
+
+
+VRT_XML_VALUES = {
+    "timestamp": TIMESTAMP,
+    "file": FRAGMENT_INFO["s3_object_key"],
+    "pid": FRAGMENT_INFO["pid"],
+    "s3bucket": FRAGMENT_INFO["s3_bucket"],
+    "md5sum": FRAGMENT_INFO["md5"],
+}
+VRT_XML_TEMPLATE = XMLTemplate(VRT_XML_VALUES, pretty=True)
+
+
+def _xml_builder() -> None:
+    builder = XMLBuilder()
+    builder.build(VRT_XML_VALUES)
+    builder.to_bytes(True)
+
+
+def _app_benchmarks() -> List[Benchmark]:
+    # Importing the app needs the configuration and all client libraries
+    from app import app as app_module
+    from app.helpers.cache import TTLCache
+    from app.helpers.dedup import DedupIndex
+    from app.services.mediahaven_pool import FragmentLookupBatcher
+
+    def patch_services(stack: ExitStack):
+        stack.enter_context(
+            patch.object(app_module, "config", SimpleNamespace(config=BENCH_CONFIG))
+        )
+        stack.enter_context(
+            patch.object(app_module, "_rabbit_service", FakeRabbitService())
+        )
+        stack.enter_context(patch.object(app_module, "_s3_deleter", FakeS3Deleter()))
+        # Without caching, so every event queries the MediaHaven stand-in
+        stack.enter_context(
+            patch.object(app_module, "_fragment_cache", TTLCache(ttl=0))
+        )
+        stack.enter_context(
+            patch.object(app_module, "_fragment_lookup", FragmentLookupBatcher())
+        )
+        # Every round handles the same events again
+        stack.enter_context(
+            patch.object(app_module, "_dedup_index", DedupIndex(max_size=0))
+        )
+
+    mh_pool = FakeMediaHavenPool()
+    benchmarks = [
+        Benchmark(
+            "generate_vrt_xml",
+            lambda: app_module._generate_vrt_xml(FRAGMENT_INFO, TIMESTAMP),
+        ),
+    ]
+    for size in PAYLOAD_SIZES:
+        events = PremisEvents(generate_actionable_payload(size)).events
+        nok_template = PremisEvents(single_premis_event_nok).events[0].xml_element
+        nok_events = PremisEvents(generate_payload(size, [nok_template])).events
+        benchmarks += [
+            Benchmark(
+                f"handle_archived_event[{size}]",
+                lambda e=events: [app_module._handle_premis_event(x, mh_pool) for x in e],
+                size,
+                patch_services,
+            ),
+            Benchmark(
+                f"handle_nok_event[{size}]",
+                lambda e=nok_events: [
+                    app_module._handle_premis_event(x, mh_pool) for x in e
+                ],
+                size,
+                patch_services,
+            ),
+        ]
+    return benchmarks
+
+
+def collect_benchmarks() -> List[Benchmark]:
+    benchmarks = _parser_benchmarks()
+    benchmarks.append(Benchmark("xml_builder", _xml_builder))
+    benchmarks.append(
+        Benchmark("xml_template", lambda: VRT_XML_TEMPLATE.render(VRT_XML_VALUES))
+    )
+    try:
+        benchmarks += _app_benchmarks()
+    except ImportError as error:
+        print(f"Skipping app benchmarks: {error}", file=sys.stderr)
+    return benchmarks
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Return the benchmarks of which the throughput dropped more than
+    `threshold` (a fraction) compared to the baseline."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]["events_per_sec"]
+        change = result["events_per_sec"] / old - 1
+        result["change"] = change
+        if change < -threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="only run matching benchmarks")
+    parser.add_argument("--min-time", type=float, default=0.5)
+    parser.add_argument("--min-rounds", type=int, default=20)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="throughput drop reported as a regression (default 0.1 = 10%%)",
+    )
+    args = parser.parse_args(argv)
+
+    results = {}
+    for benchmark in collect_benchmarks():
+        if args.filter not in benchmark.name:
+            continue
+        results[benchmark.name] = benchmark.run(args.min_time, args.min_rounds)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+
+    print(f"{'benchmark':32} {'events/s':>12} {'p50 (us)':>10} {'p99 (us)':>10} {'change':>8}")
+    for name, result in results.items():
+        change = f"{result['change']:+.1%}" if "change" in result else ""
+        print(
+            f"{name:32} {result['events_per_sec']:12.0f} "
+            f"{result['p50_us']:10.1f} {result['p99_us']:10.1f} {change:>8}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from copy import deepcopy
+from itertools import cycle
+from typing import List
+
+from lxml import etree
+
+from app.helpers.events_parser import NAMESPACES, PremisEvents
+from tests.resources import (
+    multi_premis_event,
+    single_premis_event,
+    single_premis_event_archived_on_tape,
+    single_premis_event_nok,
+)
+
+# Share of each kind of event in a generated payload, roughly what the
+# MediaHaven webhook sends: mostly events we drop, some archived and NOK.
+TEMPLATE_RESOURCES = [
+    single_premis_event,
+    single_premis_event_archived_on_tape,
+    single_premis_event_archived_on_tape,
+    single_premis_event_nok,
+    multi_premis_event,
+]
+
+
+def _template_events() -> List[etree._Element]:
+    events = []
+    for resource in TEMPLATE_RESOURCES:
+        events.extend(event.xml_element for event in PremisEvents(resource).events)
+    return events
+
+
+def generate_payload(event_count: int, templates=None) -> bytes:
+    """Build a payload with `event_count` events copied from the resources.
+
+    Every event gets a unique event ID and fragment ID.
+    """
+    if templates is None:
+        templates = _template_events()
+    root = etree.Element("events")
+    root.text = "\n  "
+    for index, template in zip(range(event_count), cycle(templates)):
+        event = deepcopy(template)
+        event.tail = "\n  "
+        for xpath, prefix in (
+            ("./p:eventIdentifier/p:eventIdentifierValue", "event"),
+            (
+                "./p:linkingObjectIdentifier[p:linkingObjectIdentifierType='MEDIAHAVEN_ID']/p:linkingObjectIdentifierValue",
+                "fragment",
+            ),
+        ):
+            for element in event.xpath(xpath, namespaces=NAMESPACES):
+                element.text = f"{prefix}-{index}"
+        root.append(event)
+    return etree.tostring(root, encoding="UTF-8", xml_declaration=True)
+
+
+def generate_actionable_payload(event_count: int) -> bytes:
+    """Build a payload with only valid archived events"""
+    return generate_payload(
+        event_count,
+        [event.xml_element for event in PremisEvents(single_premis_event).events],
+    )
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+
+class FakeRecords:
+    """In-process stand-in for the MediaHaven records resource"""
+
+    def get(self, fragment_id: str):
+        return SimpleNamespace(
+            Administrative=SimpleNamespace(
+                ExternalId=f"pid-{fragment_id}", OrganisationName="org"
+            ),
+            Dynamic=SimpleNamespace(
+                s3_object_key=f"{fragment_id}.mxf", s3_bucket="bucket"
+            ),
+            Technical=SimpleNamespace(Md5="0123456789abcdef"),
+        )
+
+
+class FakeMediaHavenPool:
+    """In-process stand-in for the MediaHaven client pool"""
+
+    def __init__(self):
+        self.records = FakeRecords()
+
+    def __len__(self) -> int:
+        return 1
+
+    @contextmanager
+    def client(self):
+        yield self
+
+
+class FakeRabbitService:
+    """In-process stand-in for the RabbitService, only counts messages"""
+
+    def __init__(self):
+        self.published = 0
+
+    def publish_message(self, message, exchange: str, routing_key: str) -> bool:
+        self.published += 1
+        return True
+
+    def close(self):
+        pass
+
+
+class FakeS3Deleter:
+    """In-process stand-in for the S3BatchDeleter, only counts keys"""
+
+    def __init__(self):
+        self.deleted = 0
+
+    def delete(self, s3_bucket: str, s3_key: str, callback=None):
+        self.deleted += 1
+        if callback is not None:
+            callback()
+
+    def close(self):
+        pass
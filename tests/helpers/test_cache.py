@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from app.helpers.cache import TTLCache
+
+
+class Clock:
+    """Controllable replacement for time.monotonic"""
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_and_set():
+    cache = TTLCache()
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+def test_expiry():
+    clock = Clock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set("key", "value")
+    cache.set("short", "value", ttl=1)
+    clock.now = 5
+    assert cache.get("key") == "value"
+    assert cache.get("short", "default") == "default"
+    clock.now = 10
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Using "a" makes "b" the least recently used entry
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+def test_disabled_cache():
+    cache = TTLCache(ttl=0)
+    cache.set("key", "value")
+    assert cache.get("key") is None
+
+def test_invalidate():
+    cache = TTLCache()
+    cache.set("key", "value")
+    cache.invalidate("key")
+    assert cache.get("key") is None
+
+def test_contains():
+    clock = Clock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set("key", "value")
+    assert "key" in cache
+    assert "other" not in cache
+    clock.now = 10
+    assert "key" not in cache
+    # Checking membership is not counted
+    assert cache.hits == 0
+    assert cache.misses == 0
+
+def test_peek():
+    clock = Clock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set("key", "value")
+    assert cache.peek("key") == "value"
+    assert cache.peek("other", "default") == "default"
+    clock.now = 10
+    assert cache.peek("key") is None
+    # Peeking is not counted
+    assert cache.hits == 0
+    assert cache.misses == 0
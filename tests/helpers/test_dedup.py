@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from app.helpers.dedup import DedupIndex
+
+
+def test_claim_and_commit():
+    index = DedupIndex()
+    assert index.claim("111")
+    # A concurrent duplicate is skipped while the first one is handled
+    assert not index.claim("111")
+    index.commit("111")
+    assert "111" in index
+    assert not index.claim("111")
+    assert index.hits == 2
+
+def test_release():
+    index = DedupIndex()
+    assert index.claim("111")
+    index.release("111")
+    assert "111" not in index
+    assert index.claim("111")
+
+def test_bounded():
+    index = DedupIndex(max_size=2)
+    for key in ("1", "2", "3"):
+        index.claim(key)
+        index.commit(key)
+    assert "1" not in index
+    assert "2" in index and "3" in index
+
+def test_disabled():
+    index = DedupIndex(max_size=0)
+    assert index.claim("111")
+    index.commit("111")
+    assert index.claim("111")
+
+def test_persisted(tmp_path):
+    path = str(tmp_path / "dedup" / "index")
+    index = DedupIndex(path=path)
+    index.claim("111")
+    index.commit("111")
+    index.claim("222")
+    index.close()
+
+    # Only committed IDs survive a restart
+    index = DedupIndex(path=path)
+    assert "111" in index
+    assert "222" not in index
+    index.close()
+
+def test_commit_after_close(tmp_path, caplog):
+    path = str(tmp_path / "index")
+    index = DedupIndex(path=path)
+    index.close()
+    index.claim("111")
+    index.commit("111")
+    # The ID is remembered, but the lost write is reported
+    assert "111" in index
+    assert caplog.records[-1].levelname == "WARNING"
+    assert "111" not in DedupIndex(path=path)
+
+def test_persisted_compaction(tmp_path):
+    path = tmp_path / "index"
+    index = DedupIndex(max_size=2, path=str(path))
+    for key in ("1", "2", "3", "4", "5"):
+        index.claim(key)
+        index.commit(key)
+    index.close()
+    # The file is compacted to the remembered hashes when it grows too big
+    assert path.stat().st_size <= 4 * 8
+
+    index = DedupIndex(max_size=2, path=str(path))
+    assert "5" in index and "4" in index
+    assert "1" not in index
+    index.close()
+
+def test_torn_entry_is_ignored(tmp_path):
+    path = tmp_path / "index"
+    index = DedupIndex(path=str(path))
+    index.claim("111")
+    index.commit("111")
+    index.close()
+    with open(path, "ab") as index_file:
+        index_file.write(b"\x00\x01")
+
+    index = DedupIndex(path=str(path))
+    assert "111" in index
+    assert path.stat().st_size == 8
+    index.close()
+
+def test_shared_between_processes(tmp_path):
+    path = str(tmp_path / "index")
+    first = DedupIndex(path=path)
+    second = DedupIndex(path=path)
+    first.claim("111")
+    first.commit("111")
+    # IDs committed by another process are skipped
+    assert not second.claim("111")
+    second.claim("222")
+    second.commit("222")
+    assert "222" in first
+    first.close()
+    second.close()
+
+def test_shared_compaction(tmp_path):
+    path = tmp_path / "index"
+    first = DedupIndex(max_size=2, path=str(path))
+    second = DedupIndex(max_size=2, path=str(path))
+    for key in ("1", "2", "3", "4", "5"):
+        first.claim(key)
+        first.commit(key)
+    assert path.stat().st_size <= 4 * 8
+    # The other process follows the compacted file
+    assert "5" in second and "4" in second
+    second.claim("6")
+    second.commit("6")
+    assert "6" in first
+    first.close()
+    second.close()
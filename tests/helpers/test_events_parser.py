@@ -17,7 +17,13 @@ from tests.resources import (
 from app.helpers.events_parser import (
     PremisEvent,
     PremisEvents,
+    PremisEventsParser,
+    PremisPayloadParser,
+    Prescanner,
     InvalidPremisEventException,
+    PREMIS_NAMESPACE,
+    prescan,
+    _UNSET,
 )
 
 def test_single_event():
@@ -103,3 +109,248 @@ def test_get_xpath_from_event():
     p = PremisEvent(tree)
     assert p._get_xpath_from_event("no_such_path") == ""
     assert p._get_xpath_from_event("path") == "value"
+
+def test_get_xpath_from_event_compiled():
+    p = PremisEvents(single_premis_event).events[0]
+    for name, xpath in PremisEvent.XPATHS.items():
+        compiled = PremisEvent.COMPILED_XPATHS[name]
+        assert p._get_xpath_from_event(compiled) == p._get_xpath_from_event(xpath)
+
+@pytest.mark.parametrize(
+    "resource",
+    [single_premis_event, single_premis_event_nok, multi_premis_event],
+)
+def test_stream_matches_dom(resource):
+    dom_events = PremisEvents(resource).events
+    # Use a tiny chunk size to split elements over multiple chunks
+    stream_events = list(PremisEvents.iterparse(resource, chunk_size=7))
+    assert len(stream_events) == len(dom_events)
+    for stream_event, dom_event in zip(stream_events, dom_events):
+        for name in PremisEvent.XPATHS:
+            assert getattr(stream_event, name) == getattr(dom_event, name)
+        assert stream_event.to_string() == dom_event.to_string()
+
+def test_to_bytes():
+    event = PremisEvents(single_premis_event_nok).events[0]
+    data = event.to_bytes()
+    assert isinstance(data, bytes)
+    assert data.decode("UTF-8") == event.to_string()
+    # The serialized event parses back to the same event
+    reparsed = PremisEvent(parse_xml_string(data))
+    for name in PremisEvent.XPATHS:
+        assert getattr(reparsed, name) == getattr(event, name)
+
+def test_stream_mode():
+    p = PremisEvents(multi_premis_event, stream=True)
+    assert p.xml_tree is None
+    assert [event.event_id for event in p.events] == ["222", "333", "444"]
+
+def test_stream_invalid_premis_event():
+    with pytest.raises(InvalidPremisEventException):
+        PremisEvents(invalid_premis_event, stream=True)
+
+def test_stream_invalid_xml_event():
+    with pytest.raises(XMLSyntaxError):
+        PremisEvents(invalid_xml_event, stream=True)
+
+def test_stream_releases_parsed_events():
+    parser = PremisEventsParser()
+    events = parser.feed(multi_premis_event)
+    # Only the last parsed event is still part of the document
+    assert len(events) == 3
+    root = events[-1].xml_element.getparent()
+    assert len(root) == 1
+    assert events[0].xml_element.getparent() is None
+
+@pytest.mark.parametrize(
+    "resource, actionable",
+    [
+        (single_premis_event, True),
+        (single_premis_event_nok, True),
+        (multi_premis_event, True),
+        (single_premis_event_archived_flow, False),
+        (single_premis_event_archived_on_tape, False),
+        (invalid_premis_event, True),
+        (invalid_xml_event, True),
+    ],
+)
+def test_prescan(resource, actionable):
+    result = prescan(resource)
+    assert result.actionable == actionable
+    if not actionable:
+        # A payload is only dropped if the parser would drop every event
+        events = PremisEvents(resource).events
+        assert result.event_count == len(events)
+        assert all(e.has_valid_outcome and not e.is_valid for e in events)
+
+def test_prescan_event_without_outcome():
+    xml = b"""<events><p:event xmlns:p="info:lc/xmlns/premis-v2">
+        <p:eventType>EXPORT</p:eventType></p:event></events>"""
+    # An event without an outcome is not OK and should be handled
+    assert prescan(xml).actionable
+
+@pytest.mark.parametrize(
+    "event_type, actionable",
+    [
+        (b'<p:eventType>EXPORT</p:eventType>', False),
+        (b'<p:eventType id="1">EXPORT</p:eventType>', False),
+        (b'<p:eventType id="1">RECORDS.FLOW.ARCHIVED</p:eventType>', True),
+        (b'<p:eventType><![CDATA[RECORDS.FLOW.ARCHIVED]]></p:eventType>', True),
+        (b'<p:eventType>RECORDS&#46;FLOW.ARCHIVED</p:eventType>', True),
+        (b'<p:eventType><!-- type -->EXPORT</p:eventType>', True),
+    ],
+)
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024])
+def test_prescan_event_type(event_type, actionable, chunk_size):
+    xml = (
+        b'<events><p:event xmlns:p="info:lc/xmlns/premis-v2">'
+        + event_type
+        + b"<p:eventOutcomeInformation><p:eventOutcome>OK</p:eventOutcome>"
+        b"</p:eventOutcomeInformation></p:event></events>"
+    )
+    scanner = Prescanner()
+    for chunk in _chunks(xml, chunk_size):
+        scanner.feed(chunk)
+    # Any eventType that isn't plain text is left to the parser
+    assert scanner.close() == (1, actionable)
+
+OK_OUTCOME = b"<p:eventOutcome>OK</p:eventOutcome>"
+
+
+def _ok_payload(outcomes=OK_OUTCOME, root=b"events", namespace=PREMIS_NAMESPACE, count=2):
+    event = (
+        b'<p:event xmlns:p="' + namespace.encode() + b'"><p:eventType>EXPORT</p:eventType>'
+        b"<p:eventOutcomeInformation>" + outcomes + b"</p:eventOutcomeInformation>"
+        b"</p:event>"
+    )
+    return b"<" + root + b">" + event * count + b"</" + root + b">"
+
+@pytest.mark.parametrize(
+    "xml, actionable",
+    [
+        (_ok_payload(), False),
+        # An outcome that isn't read, or not exactly one per event
+        (_ok_payload(b"<!-- " + OK_OUTCOME + b" -->"), True),
+        (_ok_payload(b"<p:eventOutcome><![CDATA[OK]]></p:eventOutcome>"), True),
+        (_ok_payload(OK_OUTCOME + b"<p:eventOutcome>NOK</p:eventOutcome>"), True),
+        (_ok_payload(OK_OUTCOME + OK_OUTCOME), True),
+        (_ok_payload(b""), True),
+        # Payloads the parser refuses
+        (_ok_payload(root=b"root"), True),
+        (_ok_payload(namespace="urn:other"), True),
+        (_ok_payload()[:-len(b"</events>")], True),
+    ],
+)
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024])
+def test_prescan_outcome_per_event(xml, actionable, chunk_size):
+    scanner = Prescanner()
+    for chunk in _chunks(xml, chunk_size):
+        scanner.feed(chunk)
+    assert scanner.close() == (2, actionable)
+
+
+def _chunks(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+@pytest.mark.parametrize(
+    "resource",
+    [
+        single_premis_event,
+        multi_premis_event,
+        single_premis_event_archived_flow,
+        single_premis_event_archived_on_tape,
+    ],
+)
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64])
+def test_prescanner_matches_prescan(resource, chunk_size):
+    scanner = Prescanner()
+    for chunk in _chunks(resource, chunk_size):
+        scanner.feed(chunk)
+    assert scanner.close() == prescan(resource)
+
+def test_payload_parser_parses_actionable_payload():
+    payload = PremisPayloadParser()
+    for chunk in _chunks(multi_premis_event, 100):
+        payload.feed(chunk)
+    assert payload.close().actionable
+    assert [event.event_id for event in payload.events] == [
+        event.event_id for event in PremisEvents(multi_premis_event).events
+    ]
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100])
+def test_payload_parser_counts_events_of_actionable_payload(chunk_size):
+    # The payload is known to be actionable after its first event
+    xml = _ok_payload(b"<p:eventOutcome>NOK</p:eventOutcome>", count=5)
+    payload = PremisPayloadParser()
+    for chunk in _chunks(xml, chunk_size):
+        payload.feed(chunk)
+    assert payload.close() == (5, True)
+    assert payload.count == 5
+
+def test_payload_parser_hands_off_events():
+    handed_off = []
+
+    def on_event(event):
+        event.detach()
+        handed_off.append(event)
+
+    payload = PremisPayloadParser(on_event=on_event)
+    end = multi_premis_event.rindex(b"</events>")
+    payload.feed(multi_premis_event[:end])
+    # Events are handed off as soon as they are complete
+    assert len(handed_off) == 3
+    payload.feed(multi_premis_event[end:])
+    assert payload.close().actionable
+    assert payload.events == []
+    assert payload.count == 3
+    assert all(event.xml_element is None for event in handed_off)
+
+def test_payload_parser_skips_payload_without_action():
+    payload = PremisPayloadParser()
+    for chunk in _chunks(single_premis_event_archived_on_tape, 100):
+        payload.feed(chunk)
+    assert payload.close() == (1, False)
+    assert payload.events == []
+    assert payload.parse_time == 0
+
+def test_payload_parser_invalid_xml_event():
+    payload = PremisPayloadParser()
+    with pytest.raises(XMLSyntaxError):
+        payload.feed(invalid_xml_event)
+        payload.close()
+
+def test_lazy_fields():
+    event = PremisEvents(single_premis_event).events[0]
+    assert not hasattr(event, "__dict__")
+    # Only the fields that classify the event are read up front
+    assert event._event_id is _UNSET
+    assert event.event_id == "111"
+    assert event._event_id == "111"
+
+def test_detach():
+    ok_event, nok_event = (
+        PremisEvents(resource).events[0]
+        for resource in (single_premis_event, single_premis_event_nok)
+    )
+    nok_xml = nok_event.to_bytes()
+    ok_fields = {name: getattr(ok_event, name) for name in PremisEvent.XPATHS}
+    ok_event.detach()
+    nok_event.detach()
+    assert ok_event.xml_element is None
+    assert nok_event.xml_element is None
+    assert {name: getattr(ok_event, name) for name in PremisEvent.XPATHS} == ok_fields
+    # Only the XML of a NOK event is kept to be forwarded
+    assert nok_event.to_bytes() == nok_xml
+    with pytest.raises(ValueError):
+        ok_event.to_bytes()
+
+def test_detach_keep_xml():
+    event = PremisEvents(single_premis_event).events[0]
+    xml = event.to_bytes()
+    event.detach(keep_xml=True)
+    assert event.xml_element is None
+    assert event.to_bytes() == xml
+    # Detaching again drops the XML of an event with an OK outcome
+    event.detach()
+    with pytest.raises(ValueError):
+        event.to_bytes()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+
+import pytest
+
+from app.helpers.group_commit_log import GroupCommitLog
+
+
+def test_append_and_read_records(tmp_path):
+    log = GroupCommitLog(str(tmp_path / "log" / "records.log"))
+    log.append({"id": 1})
+    log.append({"id": 2})
+    log.close()
+    assert list(GroupCommitLog(log.path).records()) == [{"id": 1}, {"id": 2}]
+
+
+def test_concurrent_appends(tmp_path):
+    log = GroupCommitLog(str(tmp_path / "records.log"))
+    threads = [
+        threading.Thread(target=log.append, args=({"id": i},)) for i in range(50)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(record["id"] for record in log.records()) == list(range(50))
+
+
+def test_append_all(tmp_path):
+    log = GroupCommitLog(str(tmp_path / "records.log"))
+    log.append_all([{"id": 1}, {"id": 2}])
+    log.append({"id": 3}, sync=False)
+    assert list(log.records()) == [{"id": 1}, {"id": 2}, {"id": 3}]
+
+
+def test_torn_record_is_ignored(tmp_path):
+    path = tmp_path / "records.log"
+    path.write_bytes(b'{"id":1}\n{"id":')
+    assert list(GroupCommitLog(str(path)).records()) == [{"id": 1}]
+
+
+def test_rewrite(tmp_path):
+    log = GroupCommitLog(str(tmp_path / "records.log"))
+    log.append({"id": 1})
+    log.rewrite([{"id": 2}])
+    log.append({"id": 3})
+    assert list(log.records()) == [{"id": 2}, {"id": 3}]
+
+
+def test_missing_file(tmp_path):
+    assert list(GroupCommitLog(str(tmp_path / "missing.log")).records()) == []
+
+
+def test_failed_append_is_not_retried(tmp_path, monkeypatch):
+    log = GroupCommitLog(str(tmp_path / "records.log"))
+    log.append({"id": "ok"})
+
+    def fail(fd):
+        raise OSError("fsync failed")
+
+    monkeypatch.setattr(os, "fsync", fail)
+    with pytest.raises(OSError):
+        log.append({"id": "failed"})
+    monkeypatch.undo()
+
+    # The failed record was removed from the file and is not written again
+    log.append({"id": "next"})
+    assert list(log.records()) == [{"id": "ok"}, {"id": "next"}]
+
+
+def test_failed_batch_fails_every_append(tmp_path, monkeypatch):
+    log = GroupCommitLog(str(tmp_path / "records.log"))
+    release = threading.Event()
+    calls = []
+    errors = []
+
+    def fsync(fd):
+        # The first batch waits and succeeds, the next one fails
+        calls.append(fd)
+        if len(calls) > 1:
+            raise OSError("fsync failed")
+        release.wait(5)
+
+    def append(record):
+        try:
+            log.append(record)
+        except OSError:
+            errors.append(record["id"])
+
+    monkeypatch.setattr(os, "fsync", fsync)
+    threads = [threading.Thread(target=append, args=({"id": i},)) for i in range(3)]
+    threads[0].start()
+    while not calls:
+        time.sleep(0.001)
+    # Both are queued while the first batch is written, and form the next batch
+    for thread in threads[1:]:
+        thread.start()
+    while len(log._pending) < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(errors) == [1, 2]
+    assert len(calls) == 2
+    assert list(log.records()) == [{"id": 0}]
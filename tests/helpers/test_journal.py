@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+
+from app.helpers.journal import EventJournal
+
+
+def test_recover_unfinished_entries(tmp_path):
+    path = str(tmp_path / "journal" / "events.log")
+    journal = EventJournal(path)
+    first, second, third = journal.add_all(["<a/>", "<b/>", "<c/>"])
+    journal.done(second)
+    journal.close()
+
+    journal = EventJournal(path)
+    assert journal.recover() == [(first, "<a/>"), (third, "<c/>")]
+    # Recovered entries are only handed out once
+    assert journal.recover() == []
+    assert journal.pending == 2
+
+
+def test_new_journal(tmp_path):
+    journal = EventJournal(str(tmp_path / "events.log"))
+    assert journal.recover() == []
+    assert journal.pending == 0
+
+
+def test_concurrent_adds(tmp_path):
+    path = str(tmp_path / "events.log")
+    journal = EventJournal(path)
+    threads = [
+        threading.Thread(target=journal.add_all, args=([f"<e{i}/>"],))
+        for i in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    journal.close()
+    recovered = EventJournal(path).recover()
+    assert sorted(event for _, event in recovered) == sorted(
+        f"<e{i}/>" for i in range(20)
+    )
+
+
+def test_compaction(tmp_path):
+    path = str(tmp_path / "events.log")
+    journal = EventJournal(path, compact_after=10)
+    kept = journal.add_all(["<kept/>"])[0]
+    for _ in range(10):
+        journal.done(journal.add_all(["<done/>"])[0])
+    # Only the unfinished entry and a few records since are left
+    assert len(list(journal._log.records())) < 10
+    journal.close()
+    assert EventJournal(path).recover() == [(kept, "<kept/>")]
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timedelta, timezone
+
+from prometheus_client import CollectorRegistry, REGISTRY
+
+from app.helpers.cache import TTLCache
+from app.helpers.metrics import CacheCollector, observe_archive_lag, process_age
+
+LAG_COUNT = "event_handler_archive_notify_lag_seconds_count"
+LAG_SUM = "event_handler_archive_notify_lag_seconds_sum"
+
+
+def _sample(name):
+    return REGISTRY.get_sample_value(name) or 0
+
+def test_observe_archive_lag():
+    count, total = _sample(LAG_COUNT), _sample(LAG_SUM)
+    archived_at = datetime.now(timezone.utc) - timedelta(seconds=60)
+    observe_archive_lag(archived_at.strftime("%Y-%m-%dT%H:%M:%SZ"))
+    assert _sample(LAG_COUNT) == count + 1
+    assert 59 <= _sample(LAG_SUM) - total < 120
+
+def test_process_age():
+    age = process_age()
+    # Only available on Linux
+    assert age is None or 0 <= age < 24 * 3600
+
+def test_observe_archive_lag_invalid_timestamp():
+    count = _sample(LAG_COUNT)
+    observe_archive_lag("")
+    observe_archive_lag("not a timestamp")
+    assert _sample(LAG_COUNT) == count
+
+def test_cache_collector():
+    cache = TTLCache()
+    cache.set("key", "value")
+    cache.get("key")
+    cache.get("other")
+    registry = CollectorRegistry()
+    registry.register(CacheCollector("test", lambda: cache))
+    assert registry.get_sample_value("event_handler_test_cache_hits_total") == 1
+    assert registry.get_sample_value("event_handler_test_cache_misses_total") == 1
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from unittest.mock import patch
+
+import pytest
+
+from app.helpers import settings
+
+
+@patch("app.helpers.settings.ConfigParser")
+def test_config_is_loaded_once_and_read_only(config_parser_mock):
+    config_parser_mock.return_value.config = {
+        "environment": {"rabbit": {"host": "localhost"}, "hosts": ["a", "b"]}
+    }
+    with patch.object(settings, "_config", None):
+        config = settings.get_config()
+        assert settings.get_config() is config
+    config_parser_mock.assert_called_once()
+
+    environment = config.config["environment"]
+    assert environment["rabbit"]["host"] == "localhost"
+    assert environment["hosts"] == ("a", "b")
+    with pytest.raises(TypeError):
+        environment["rabbit"]["host"] = "other"
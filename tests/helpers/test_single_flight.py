@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+from unittest.mock import MagicMock
+
+from app.helpers.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def _call_in_thread(flight: SingleFlight, function):
+    """Start a call in a thread, its result is appended to the returned list"""
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(flight.do("key", function)), daemon=True
+    )
+    thread.start()
+    return thread, results
+
+
+def test_single_flight_shares_call():
+    started, release, shared = threading.Event(), threading.Event(), threading.Event()
+    calls = []
+
+    def function():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    flight = SingleFlight(on_shared=shared.set)
+    thread, results = _call_in_thread(flight, function)
+    assert started.wait(5)
+    waiter, waiter_results = _call_in_thread(flight, function)
+    assert shared.wait(5)
+    release.set()
+    thread.join(5)
+    waiter.join(5)
+
+    assert results == waiter_results == ["result"]
+    assert len(calls) == 1
+    # Once done, the next call runs the function again
+    assert flight.do("key", lambda: "again") == "again"
+
+
+def test_single_flight_shares_exception():
+    started, release, shared = threading.Event(), threading.Event(), threading.Event()
+
+    def function():
+        started.set()
+        release.wait(5)
+        raise ValueError("failed")
+
+    flight = SingleFlight(on_shared=shared.set)
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", function)
+        except ValueError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=call, daemon=True) for _ in range(2)]
+    threads[0].start()
+    assert started.wait(5)
+    threads[1].start()
+    assert shared.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 2
+    assert errors[0] is errors[1]
+
+
+def test_async_single_flight():
+    function = MagicMock()
+
+    async def fetch(key):
+        function(key)
+        await asyncio.sleep(0.01)
+        return key.upper()
+
+    on_shared = MagicMock()
+    flight = AsyncSingleFlight(on_shared=on_shared)
+
+    async def run():
+        cancelled = asyncio.ensure_future(flight.do("a", fetch, "a"))
+        await asyncio.sleep(0)
+        results = asyncio.gather(flight.do("a", fetch, "a"), flight.do("b", fetch, "b"))
+        # A cancelled caller doesn't cancel the shared call
+        cancelled.cancel()
+        return await results
+
+    assert asyncio.run(run()) == ["A", "B"]
+    assert function.call_count == 2
+    assert on_shared.call_count == 1
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+
+from app.helpers.work_queue import QueueFullException, WorkQueue
+
+
+def test_tasks_are_run():
+    work_queue = WorkQueue(workers=2)
+    results = []
+    work_queue.submit_all([(results.append, (i,)) for i in range(10)])
+    work_queue.join()
+    assert sorted(results) == list(range(10))
+    assert work_queue.depth == 0
+    work_queue.close()
+
+def test_queue_is_bounded():
+    work_queue = WorkQueue(workers=1, max_depth=2)
+    release = threading.Event()
+    work_queue.submit(release.wait)
+    work_queue.submit(release.wait)
+    assert work_queue.full
+    with pytest.raises(QueueFullException):
+        work_queue.submit(release.wait)
+    release.set()
+    work_queue.close()
+
+def test_submit_all_or_nothing():
+    work_queue = WorkQueue(workers=1, max_depth=2)
+    release = threading.Event()
+    work_queue.submit(release.wait)
+    with pytest.raises(QueueFullException):
+        work_queue.submit_all([(release.wait, ()), (release.wait, ())])
+    assert work_queue.depth == 1
+    release.set()
+    work_queue.close()
+
+def test_failing_task_does_not_stop_worker():
+    work_queue = WorkQueue(workers=1)
+    results = []
+    work_queue.submit(lambda: 1 / 0)
+    work_queue.submit(results.append, "done")
+    work_queue.join()
+    assert results == ["done"]
+    work_queue.close()
+
+def test_close_runs_remaining_tasks():
+    work_queue = WorkQueue(workers=1)
+    results = []
+    work_queue.submit_all([(results.append, (i,)) for i in range(5)])
+    work_queue.close()
+    assert results == list(range(5))
+    with pytest.raises(QueueFullException):
+        work_queue.submit(results.append, 5)
+
+
+def test_join_does_not_take_wakeups_of_workers():
+    work_queue = WorkQueue(workers=1)
+    started = threading.Event()
+    release = threading.Event()
+    work_queue.submit(lambda: (started.set(), release.wait()))
+    started.wait()
+    joiner = threading.Thread(target=work_queue.join)
+    joiner.start()
+    results = []
+    work_queue.submit(results.append, "done")
+    release.set()
+    joiner.join(timeout=5)
+    assert not joiner.is_alive()
+    assert results == ["done"]
+    work_queue.close()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+
+from app.helpers.worker_slot import WorkerSlot
+
+
+def test_claims_free_slots(tmp_path):
+    first = WorkerSlot(str(tmp_path), 2)
+    second = WorkerSlot(str(tmp_path), 2)
+    assert (first.number, second.number) == (0, 1)
+    assert second.path("outbox/rabbit.log") == "outbox/rabbit.1.log"
+    first.release()
+    second.release()
+
+def test_waits_for_a_released_slot(tmp_path):
+    first = WorkerSlot(str(tmp_path), 1)
+    claimed = []
+    thread = threading.Thread(
+        target=lambda: claimed.append(WorkerSlot(str(tmp_path), 1, retry_delay=0.01))
+    )
+    thread.start()
+    thread.join(timeout=0.1)
+    assert not claimed
+    first.release()
+    thread.join(timeout=5)
+    assert claimed[0].number == 0
+    claimed[0].release()
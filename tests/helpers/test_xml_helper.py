@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from app.helpers.xml_helper import XMLBuilder, XMLTemplate
+
+FIELDS = ("timestamp", "file", "pid", "s3bucket", "md5sum")
+
+
+@pytest.mark.parametrize("pretty", [True, False])
+@pytest.mark.parametrize(
+    "value",
+    ["a1b2c3", "", None, "a & b <c> \"d\" 'e'", "]]>", "line\r\nbreak\ttab", "é€😀"],
+)
+def test_template_matches_builder(pretty, value):
+    values = {field: f"{field}-{value}" for field in FIELDS}
+    values["pid"] = value
+    builder = XMLBuilder()
+    builder.build(values)
+    template = XMLTemplate(FIELDS, pretty=pretty)
+    assert template.render(values) == builder.to_bytes(pretty)
+
+
+@pytest.mark.parametrize("pretty", [True, False])
+@pytest.mark.parametrize("empty", [FIELDS, ("timestamp",), ("md5sum",), ("timestamp", "file")])
+def test_template_matches_builder_without_values(pretty, empty):
+    values = {field: None if field in empty else field for field in FIELDS}
+    builder = XMLBuilder()
+    builder.build(values)
+    template = XMLTemplate(FIELDS, pretty=pretty)
+    assert template.render(values) == builder.to_bytes(pretty)
+
+
+@pytest.mark.parametrize("value", ["\x00", "a\x1fb", "\ufffe"])
+def test_template_rejects_invalid_characters(value):
+    values = dict.fromkeys(FIELDS, "value")
+    values["file"] = value
+    with pytest.raises(ValueError):
+        XMLTemplate(FIELDS).render(values)
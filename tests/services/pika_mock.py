@@ -12,6 +12,7 @@ class Channel:
     """Mocks a pika Channel"""
     def __init__(self):
         self.messages = []
+        self.is_open = True
 
     def basic_publish(self, *args, **kwargs):
         """Puts a message on the in-memory list"""
@@ -24,11 +25,14 @@ class Channel:
 class Connection:
     """Mocks a pika Connection"""
     def __init__(self):
-        pass
+        self.is_open = True
 
     def channel(self):
         self.channel_mock = Channel()
         return self.channel_mock
 
-    def close(self):
+    def process_data_events(self, time_limit=None):
         pass
+
+    def close(self):
+        self.is_open = False
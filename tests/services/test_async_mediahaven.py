@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import httpx
+from mediahaven.mediahaven import MediaHavenException
+import pytest
+
+from app.services.async_mediahaven import AsyncMediaHaven
+
+
+def _mediahaven(handler) -> AsyncMediaHaven:
+    return AsyncMediaHaven(
+        "http://mediahaven",
+        "client_id",
+        "client_secret",
+        "user",
+        "password",
+        transport=httpx.MockTransport(handler),
+    )
+
+
+def test_get_record():
+    tokens = iter(["expired", "token"])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/auth/ropc.php":
+            return httpx.Response(200, json={"access_token": next(tokens)})
+        if request.headers["Authorization"] == "Bearer expired":
+            return httpx.Response(401)
+        assert request.url.path == "/mediahaven-rest-api/v2/records/fragment_id"
+        return httpx.Response(200, json={"Administrative": {"ExternalId": "pid"}})
+
+    async def get():
+        mediahaven = _mediahaven(handler)
+        try:
+            return await mediahaven.get_record("fragment_id")
+        finally:
+            await mediahaven.close()
+
+    # An expired token is replaced once
+    assert asyncio.run(get()) == {"Administrative": {"ExternalId": "pid"}}
+
+
+def test_token_expiry():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"access_token": "token", "expires_in": 600})
+
+    async def request_token():
+        mediahaven = _mediahaven(handler)
+        try:
+            assert mediahaven.token_expires_in is None
+            await mediahaven.request_token()
+            return mediahaven.token_expires_in
+        finally:
+            await mediahaven.close()
+
+    assert 590 < asyncio.run(request_token()) <= 600
+
+
+def test_get_record_not_found():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/auth/ropc.php":
+            return httpx.Response(200, json={"access_token": "token"})
+        return httpx.Response(404, text="not found")
+
+    with pytest.raises(MediaHavenException) as error:
+        asyncio.run(_mediahaven(handler).get_record("fragment_id"))
+    assert error.value.status_code == "404"
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+from copy import deepcopy
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services.async_rabbit_service import AsyncRabbitService
+
+CONFIG_DICT = {
+    "environment": {
+        "rabbit": {
+            "host": "localhost",
+            "username": "guest",
+            "password": "guest",
+        }
+    }
+}
+
+
+@pytest.fixture
+def rabbit_service(tmp_path):
+    config_dict = deepcopy(CONFIG_DICT)
+    config_dict["environment"]["rabbit"]["outbox_path"] = str(tmp_path / "outbox.log")
+    return AsyncRabbitService(config_dict)
+
+
+def _connection(exchange):
+    channel = MagicMock(is_closed=False)
+    channel.get_exchange = AsyncMock(return_value=exchange)
+    connection = MagicMock(is_closed=False)
+    connection.channel = AsyncMock(return_value=channel)
+    connection.close = AsyncMock()
+    return connection
+
+
+@patch("aio_pika.connect_robust")
+def test_publish_message(connect_mock, rabbit_service):
+    exchange = MagicMock(publish=AsyncMock())
+    connect_mock.return_value = _connection(exchange)
+
+    async def publish():
+        await rabbit_service.start()
+        try:
+            for _ in range(2):
+                assert await rabbit_service.publish_message("message", "exchange", "key")
+        finally:
+            await rabbit_service.close()
+
+    asyncio.run(publish())
+
+    # Both messages are published on the same connection
+    assert connect_mock.call_count == 1
+    assert exchange.publish.call_count == 2
+    message = exchange.publish.call_args[0][0]
+    assert message.body == b"message"
+    assert exchange.publish.call_args[1]["routing_key"] == "key"
+
+
+@patch("aio_pika.connect_robust")
+def test_publish_message_conn_error(connect_mock, rabbit_service):
+    connect_mock.side_effect = ConnectionError("unreachable")
+
+    async def publish():
+        await rabbit_service.start()
+        try:
+            return await rabbit_service.publish_message("message", "exchange", "key")
+        finally:
+            await rabbit_service.close()
+
+    # The message is kept in the outbox
+    assert not asyncio.run(publish())
+    assert rabbit_service.outbox.pending == 1
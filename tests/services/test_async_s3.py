@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+from lxml import etree
+
+from app.services.async_s3 import AsyncS3BatchDeleter, AsyncS3Client
+
+CONFIG_DICT = {
+    "environment": {
+        "s3": {
+            "host": "http://host",
+            "aws_access_key_id": "access",
+            "aws_secret_access_key": "secret",
+            "delete_batch_window": "0.01",
+        }
+    }
+}
+
+DELETE_RESULT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<DeleteResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">
+  <Deleted><Key>key1</Key></Deleted>
+  <Error><Key>key2</Key><Code>AccessDenied</Code><Message>denied</Message></Error>
+</DeleteResult>"""
+
+
+def test_delete_objects():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, content=DELETE_RESULT)
+
+    async def delete():
+        s3_client = AsyncS3Client(CONFIG_DICT, transport=httpx.MockTransport(handler))
+        try:
+            return await s3_client.delete_objects("bucket", ["key1", "key2"])
+        finally:
+            await s3_client.close()
+
+    assert asyncio.run(delete()) == ["key1"]
+
+    request = requests[0]
+    assert request.method == "POST"
+    assert str(request.url) == "http://host/bucket?delete"
+    assert request.headers["Authorization"].startswith("AWS4-HMAC-SHA256 Credential=access/")
+    assert "Content-MD5" in request.headers
+    keys = etree.fromstring(request.content).xpath("//*[local-name()='Key']/text()")
+    assert keys == ["key1", "key2"]
+
+
+def test_delete_objects_retries_server_errors():
+    responses = [httpx.Response(503), httpx.Response(200, content=DELETE_RESULT)]
+
+    async def delete():
+        s3_client = AsyncS3Client(
+            CONFIG_DICT, transport=httpx.MockTransport(lambda _: responses.pop(0))
+        )
+        return await s3_client.delete_objects("bucket", ["key1"])
+
+    assert asyncio.run(delete()) == ["key1"]
+    assert responses == []
+
+
+def test_batch_deleter_coalesces_keys():
+    s3_client = AsyncMock()
+
+    async def delete():
+        deleter = AsyncS3BatchDeleter(s3_client, CONFIG_DICT)
+        await deleter.delete("bucket", "key1")
+        await deleter.delete("bucket", "key2")
+        await deleter.delete("other", "key3")
+        assert s3_client.delete_objects.call_count == 0
+        await asyncio.sleep(0.05)
+
+    asyncio.run(delete())
+    calls = sorted(call.args for call in s3_client.delete_objects.call_args_list)
+    assert calls == [("bucket", ["key1", "key2"]), ("other", ["key3"])]
+
+
+def test_batch_deleter_close_deletes_queued_keys():
+    s3_client = AsyncMock()
+
+    async def delete():
+        deleter = AsyncS3BatchDeleter(s3_client, CONFIG_DICT)
+        deleter.window = 60
+        await deleter.delete("bucket", "key1")
+        await deleter.close()
+
+    asyncio.run(delete())
+    s3_client.delete_objects.assert_called_once_with("bucket", ["key1"])
+
+
+def test_batch_deleter_callbacks_after_delete():
+    s3_client = AsyncMock()
+    callback = MagicMock(side_effect=lambda: s3_client.delete_objects.assert_called())
+
+    async def delete():
+        deleter = AsyncS3BatchDeleter(s3_client, CONFIG_DICT)
+        deleter.window = 60
+        await deleter.delete("bucket", "key1", callback)
+        callback.assert_not_called()
+        await deleter.close()
+
+    asyncio.run(delete())
+    callback.assert_called_once()
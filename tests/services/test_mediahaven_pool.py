@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from mediahaven.mediahaven import MediaHavenException
+
+from app.services import mediahaven_pool
+from app.services.mediahaven_pool import (
+    FragmentLookupBatcher,
+    MediaHavenPool,
+    token_refresh_delay,
+)
+
+
+def test_client_is_returned_to_pool():
+    pool = MediaHavenPool(["client"])
+    with pool.client() as client:
+        assert client == "client"
+    with pool.client() as client:
+        assert client == "client"
+
+def test_clients_are_used_concurrently():
+    pool = MediaHavenPool(["client1", "client2"])
+    with pool.client() as first, pool.client() as second:
+        assert {first, second} == {"client1", "client2"}
+
+def test_pool_bounds_concurrency():
+    pool = MediaHavenPool(["client"])
+    borrowed = threading.Event()
+
+    def borrow():
+        with pool.client():
+            borrowed.set()
+
+    with pool.client():
+        thread = threading.Thread(target=borrow)
+        thread.start()
+        # The only client is in use, so the other thread has to wait
+        assert not borrowed.wait(0.1)
+    assert borrowed.wait(1)
+    thread.join()
+
+def test_for_each_client():
+    pool = MediaHavenPool(["client1", "client2"])
+    handled = []
+
+    def handle(client):
+        handled.append(client)
+        # Only the handled client is out of the pool
+        assert pool._idle == [other for other in pool.clients if other != client]
+
+    pool.for_each_client(handle)
+    assert sorted(handled) == ["client1", "client2"]
+    assert sorted(pool._idle) == ["client1", "client2"]
+
+def test_for_each_client_waits_for_busy_client():
+    pool = MediaHavenPool(["client1", "client2"])
+    handled = []
+    done = threading.Event()
+
+    def refresh():
+        pool.for_each_client(handled.append)
+        done.set()
+
+    with pool.client() as busy:
+        thread = threading.Thread(target=refresh)
+        thread.start()
+        # The idle client is handled and returned while the busy one is in use
+        while not handled:
+            time.sleep(0.001)
+        assert not done.wait(0.05)
+        with pool.client() as other:
+            assert other != busy
+    assert done.wait(1)
+    thread.join()
+    assert sorted(handled) == ["client1", "client2"]
+
+def test_token_refresh():
+    pool = MediaHavenPool(["client"])
+    refreshed = threading.Event()
+    pool.start_token_refresh(lambda client: refreshed.set(), 0.01)
+    assert refreshed.wait(1)
+    pool.close()
+    assert pool._refresh_thread is None
+
+@pytest.mark.parametrize(
+    "interval, expires_in, delay",
+    [
+        (1800, None, 1800),
+        (1800, 3600, 1800),
+        (1800, 600, 540),
+        (1800, 300, 270),
+        (1800, 0, 1),
+    ],
+)
+def test_token_refresh_delay(interval, expires_in, delay):
+    assert token_refresh_delay(interval, expires_in) == delay
+
+def test_token_refresh_follows_expiry(monkeypatch):
+    monkeypatch.setattr(mediahaven_pool, "MIN_TOKEN_REFRESH_DELAY", 0.01)
+    pool = MediaHavenPool(["client"])
+    refreshes = []
+
+    def refresh(client):
+        refreshes.append(client)
+        # Tokens that expire long before the interval
+        return 0.02
+
+    pool.start_token_refresh(refresh, 60, expires_in=0.02)
+    deadline = time.monotonic() + 1
+    while len(refreshes) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    pool.close()
+    assert len(refreshes) >= 3
+
+
+def _record(fragment_id):
+    record = MagicMock()
+    record.Internal.FragmentId = fragment_id
+    return record
+
+
+@pytest.fixture
+def mh_client():
+    mh_client = MagicMock()
+    mh_client.records.search.side_effect = lambda **kwargs: MagicMock(
+        **{
+            "as_generator.return_value": [
+                _record(fragment_id)
+                for fragment_id in ("a", "b", "c")
+                if f"FragmentId:{fragment_id}" in kwargs["q"]
+            ]
+        }
+    )
+    mh_client.records.get.side_effect = _record
+    return mh_client
+
+
+def test_single_lookup_uses_get(mh_client):
+    batcher = FragmentLookupBatcher()
+    fragment = batcher.get(MediaHavenPool([mh_client]), "a")
+    assert fragment.Internal.FragmentId == "a"
+    mh_client.records.get.assert_called_once_with("a")
+    assert mh_client.records.search.call_count == 0
+
+
+def test_prefetch_searches_once(mh_client):
+    batcher = FragmentLookupBatcher()
+    fragments = batcher.prefetch(MediaHavenPool([mh_client]), ["a", "b", "c"])
+    assert sorted(fragments) == ["a", "b", "c"]
+    mh_client.records.search.assert_called_once_with(
+        q="+(FragmentId:a FragmentId:b FragmentId:c)", nrOfResults=3
+    )
+    assert mh_client.records.get.call_count == 0
+
+
+def test_prefetch_splits_batches(mh_client):
+    batcher = FragmentLookupBatcher(batch_size=2)
+    fragments = batcher.prefetch(MediaHavenPool([mh_client]), ["a", "b", "c"])
+    assert sorted(fragments) == ["a", "b", "c"]
+    assert mh_client.records.search.call_count == 1
+    # The remaining single fragment is fetched directly
+    mh_client.records.get.assert_called_once_with("c")
+
+
+def test_concurrent_lookups_are_batched(mh_client):
+    batcher = FragmentLookupBatcher(window=1, batch_size=3)
+    pool = MediaHavenPool([mh_client])
+    results = {}
+
+    def lookup(fragment_id):
+        results[fragment_id] = batcher.get(pool, fragment_id)
+
+    threads = [threading.Thread(target=lookup, args=(f,)) for f in ("a", "b", "c")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # A full batch doesn't wait for the window to pass
+    assert {f: r.Internal.FragmentId for f, r in results.items()} == {
+        "a": "a",
+        "b": "b",
+        "c": "c",
+    }
+    assert mh_client.records.search.call_count == 1
+    assert mh_client.records.get.call_count == 0
+
+
+def test_lookups_during_a_request_are_batched(mh_client):
+    release = threading.Event()
+
+    def slow_get(fragment_id):
+        release.wait()
+        return _record(fragment_id)
+
+    mh_client.records.get.side_effect = slow_get
+    batcher = FragmentLookupBatcher()
+    pool = MediaHavenPool([mh_client])
+    threads = [
+        threading.Thread(target=batcher.get, args=(pool, f)) for f in ("a", "b", "c")
+    ]
+    threads[0].start()
+    while not mh_client.records.get.called:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    while len(batcher._pending) < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    # "a" was fetched right away, "b" and "c" with a single search
+    mh_client.records.get.assert_called_once_with("a")
+    mh_client.records.search.assert_called_once_with(
+        q="+(FragmentId:b FragmentId:c)", nrOfResults=2
+    )
+
+
+def test_lookups_use_all_clients():
+    # Both requests must be outstanding at the same time to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    def get(fragment_id):
+        barrier.wait()
+        return _record(fragment_id)
+
+    clients = [MagicMock(), MagicMock()]
+    for client in clients:
+        client.records.get.side_effect = get
+    batcher = FragmentLookupBatcher()
+    pool = MediaHavenPool(clients)
+    results = {}
+
+    def lookup(fragment_id):
+        results[fragment_id] = batcher.get(pool, fragment_id).Internal.FragmentId
+
+    threads = [threading.Thread(target=lookup, args=(f,)) for f in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"a": "a", "b": "b"}
+    assert all(client.records.get.call_count == 1 for client in clients)
+
+
+def test_fragment_missing_from_search_is_fetched(mh_client):
+    error = MediaHavenException("not found")
+    error.status_code = "404"
+    mh_client.records.get.side_effect = error
+    batcher = FragmentLookupBatcher()
+    pool = MediaHavenPool([mh_client])
+
+    fragments = batcher.prefetch(pool, ["a", "d"])
+
+    assert list(fragments) == ["a"]
+    with pytest.raises(MediaHavenException):
+        batcher.get(pool, "d")
+    mh_client.records.get.assert_called_once_with("d")
+
+
+def test_failing_search_falls_back_to_get(mh_client):
+    mh_client.records.search.side_effect = MediaHavenException("search failed")
+    batcher = FragmentLookupBatcher()
+    pool = MediaHavenPool([mh_client])
+
+    assert batcher.prefetch(pool, ["a", "b"]) == {}
+    assert batcher.get(pool, "a").Internal.FragmentId == "a"
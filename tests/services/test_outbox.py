@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from unittest.mock import MagicMock
+
+from app.services.outbox import Outbox
+
+
+def test_outbox_survives_restart(tmp_path):
+    path = str(tmp_path / "outbox.log")
+    publish = MagicMock(side_effect=Exception)
+    outbox = Outbox(path, publish)
+    outbox.add("message", "exchange", "routing_key")
+    assert not outbox.drain()
+    outbox.close()
+
+    # A new outbox on the same file still holds the undelivered message
+    publish = MagicMock()
+    outbox = Outbox(path, publish)
+    assert outbox.pending == 1
+    assert outbox.drain()
+    publish.assert_called_once_with("message", "exchange", "routing_key")
+    outbox.close()
+
+    # Delivered messages are not replayed
+    assert Outbox(path, publish).pending == 0
+
+
+def test_outbox_bytes_message(tmp_path):
+    path = str(tmp_path / "outbox.log")
+    outbox = Outbox(path, MagicMock(side_effect=Exception))
+    outbox.add(b"<message>\xc3\xa9</message>", "exchange", "routing_key")
+    outbox.close()
+
+    # Bytes are published as bytes after a restart
+    publish = MagicMock()
+    outbox = Outbox(path, publish)
+    assert outbox.drain()
+    publish.assert_called_once_with(
+        b"<message>\xc3\xa9</message>", "exchange", "routing_key"
+    )
+    outbox.close()
+
+
+def test_outbox_retries_recording_delivery(tmp_path, monkeypatch):
+    path = str(tmp_path / "outbox.log")
+    publish = MagicMock()
+    outbox = Outbox(path, publish)
+    outbox.add("message", "exchange", "routing_key")
+    append = outbox._log.append
+    monkeypatch.setattr(outbox._log, "append", MagicMock(side_effect=OSError("disk full")))
+
+    # The failure is retried later instead of raised in the scheduler
+    assert not outbox.drain()
+    assert outbox.pending == 0
+    monkeypatch.setattr(outbox._log, "append", append)
+    assert outbox.drain()
+    # The delivered message is not published again, now or after a restart
+    publish.assert_called_once_with("message", "exchange", "routing_key")
+    outbox.close()
+    assert Outbox(path, publish).pending == 0
+
+
+def test_outbox_compaction(tmp_path):
+    path = tmp_path / "outbox.log"
+    outbox = Outbox(str(path), MagicMock(), compact_after=2)
+    outbox.add("first", "exchange", "routing_key")
+    assert outbox.drain()
+    # A single delivered message doesn't trigger a rewrite
+    assert path.read_bytes().count(b"\n") == 2
+    outbox.add("second", "exchange", "routing_key")
+    assert outbox.drain()
+    assert path.read_bytes() == b""
+    outbox.close()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from copy import deepcopy
 from unittest.mock import patch
 import pytest
 
@@ -23,8 +24,12 @@ class TestRabbitService:
     }
 
     @pytest.fixture
-    def rabbit_service(self):
-        return RabbitService(self.CONFIG_DICT)
+    def rabbit_service(self, tmp_path):
+        config_dict = deepcopy(self.CONFIG_DICT)
+        config_dict["environment"]["rabbit"]["outbox_path"] = str(
+            tmp_path / "outbox.log"
+        )
+        return RabbitService(config_dict)
 
     @patch('pika.BlockingConnection')
     def test_publish_message(self, conn_mock, rabbit_service):
@@ -40,12 +45,80 @@ class TestRabbitService:
         assert message.exchange == "exchange"
         assert message.routing_key == "routing_key"
 
+    @patch('pika.BlockingConnection')
+    def test_publish_message_reuses_connection(self, conn_mock, rabbit_service):
+        pika_conn = PikaConnection()
+        conn_mock.return_value = pika_conn
+
+        rabbit_service.publish_message("first", "exchange", "routing_key")
+        rabbit_service.publish_message("second", "exchange", "routing_key")
+
+        # Only one connection is opened and both messages use its channel
+        assert conn_mock.call_count == 1
+        messages = pika_conn.channel_mock.messages
+        assert [message.body for message in messages] == ["first", "second"]
+
+    @patch('pika.BlockingConnection')
+    def test_warm_up(self, conn_mock, rabbit_service):
+        conn_mock.side_effect = lambda params: PikaConnection()
+
+        rabbit_service.warm_up()
+        rabbit_service.publish_message("message", "exchange", "routing_key")
+
+        # Every pooled connection was opened up front
+        assert conn_mock.call_count == rabbit_service.pool_size
+
+    @patch('pika.BlockingConnection')
+    def test_publish_message_reconnects_closed_connection(
+        self, conn_mock, rabbit_service
+    ):
+        first_conn = PikaConnection()
+        second_conn = PikaConnection()
+        conn_mock.side_effect = [first_conn, second_conn]
+
+        rabbit_service.publish_message("first", "exchange", "routing_key")
+        # The broker closed the connection in the meantime
+        first_conn.is_open = False
+        rabbit_service.publish_message("second", "exchange", "routing_key")
+
+        assert conn_mock.call_count == 2
+        assert len(first_conn.channel_mock.messages) == 1
+        assert second_conn.channel_mock.messages[0].body == "second"
+
     @patch('time.sleep')
     @patch('pika.BlockingConnection')
     def test_publish_message_conn_error(self, conn_mock, sleep_mock, rabbit_service):
         # Creating a pika.BlockedConnection throws Exception
         conn_mock.side_effect = Exception
 
-        rabbit_service.publish_message("message", "exchange", "routing_key")
-        assert rabbit_service.retrycount == 11
-        assert conn_mock.call_count == 11
+        assert not rabbit_service.publish_message("message", "exchange", "routing_key")
+        # The message is stored in the outbox instead of retried inline
+        assert conn_mock.call_count == 1
+        assert sleep_mock.call_count == 0
+        assert rabbit_service.outbox.pending == 1
+
+    @patch('pika.BlockingConnection')
+    def test_publish_message_queues_behind_outbox(self, conn_mock, rabbit_service):
+        conn_mock.side_effect = Exception
+        rabbit_service.publish_message("first", "exchange", "routing_key")
+
+        # Don't try the broker again while older messages are pending
+        rabbit_service.publish_message("second", "exchange", "routing_key")
+        assert conn_mock.call_count == 1
+        assert rabbit_service.outbox.pending == 2
+
+    @patch('pika.BlockingConnection')
+    def test_outbox_drain(self, conn_mock, rabbit_service):
+        conn_mock.side_effect = Exception
+        rabbit_service.publish_message("first", "exchange", "routing_key")
+        rabbit_service.publish_message("second", "exchange", "routing_key")
+
+        # The broker is reachable again
+        pika_conn = PikaConnection()
+        conn_mock.side_effect = None
+        conn_mock.return_value = pika_conn
+        assert rabbit_service.outbox.drain()
+
+        messages = pika_conn.channel_mock.messages
+        assert [message.body for message in messages] == ["first", "second"]
+        assert rabbit_service.outbox.pending == 0
@@ -6,7 +6,7 @@ from unittest.mock import patch, MagicMock
 from botocore.exceptions import ClientError, EndpointConnectionError
 import pytest
 
-from app.services.s3 import S3Client
+from app.services.s3 import S3BatchDeleter, S3Client
 
 
 class TestS3Client:
@@ -33,6 +33,30 @@ class TestS3Client:
         assert mock_boto_client.call_args[1]["aws_access_key_id"] == "access"
         assert mock_boto_client.call_args[1]["aws_secret_access_key"] == "secret"
         assert mock_boto_client.call_args[1]["endpoint_url"] == "host"
+        client_config = mock_boto_client.call_args[1]["config"]
+        assert client_config.max_pool_connections == 10
+        assert client_config.retries == {"mode": "standard", "max_attempts": 3}
+
+    @patch('boto3.client')
+    def test_init_tuned_client(self, mock_boto_client):
+        config_dict = {
+            "environment": {
+                "s3": {
+                    **self.CONFIG_DICT["environment"]["s3"],
+                    "max_pool_connections": "50",
+                    "connect_timeout": "2",
+                    "read_timeout": "10",
+                    "retry_mode": "adaptive",
+                    "max_attempts": "5",
+                }
+            }
+        }
+        S3Client(config_dict)
+        client_config = mock_boto_client.call_args[1]["config"]
+        assert client_config.max_pool_connections == 50
+        assert client_config.connect_timeout == 2
+        assert client_config.read_timeout == 10
+        assert client_config.retries == {"mode": "adaptive", "max_attempts": 5}
 
     def test_delete_object_client_error(self, s3_client, caplog):
         # Patch delete_object to return a client error
@@ -76,3 +100,99 @@ class TestS3Client:
         assert caplog.records[0].levelname == "INFO"
         assert caplog.records[0].s3_bucket == bucket
         assert caplog.records[0].s3_key == key
+
+    def test_delete_objects(self, s3_client, caplog):
+        mock_boto_client = s3_client.client
+        mock_boto_client.delete_objects.return_value = {
+            "Deleted": [{"Key": "key1"}],
+            "Errors": [{"Key": "key2", "Code": "AccessDenied", "Message": "denied"}],
+        }
+
+        deleted = s3_client.delete_objects("bucket", ["key1", "key2"])
+
+        assert deleted == ["key1"]
+        assert mock_boto_client.delete_objects.call_args[1] == {
+            "Bucket": "bucket",
+            "Delete": {"Objects": [{"Key": "key1"}, {"Key": "key2"}]},
+        }
+        assert caplog.records[0].levelname == "INFO"
+        assert caplog.records[0].s3_key == "key1"
+        assert caplog.records[1].levelname == "ERROR"
+        assert caplog.records[1].s3_key == "key2"
+
+    def test_delete_objects_splits_batches(self, s3_client):
+        mock_boto_client = s3_client.client
+        mock_boto_client.delete_objects.return_value = {}
+
+        s3_client.delete_objects("bucket", [f"key{i}" for i in range(1500)])
+
+        assert mock_boto_client.delete_objects.call_count == 2
+        second_batch = mock_boto_client.delete_objects.call_args[1]["Delete"]
+        assert len(second_batch["Objects"]) == 500
+
+    def test_delete_objects_client_error(self, s3_client, caplog):
+        mock_boto_client = s3_client.client
+        error = ClientError(MagicMock(), MagicMock())
+        mock_boto_client.delete_objects.side_effect = error
+
+        assert s3_client.delete_objects("bucket", ["key1", "key2"]) == []
+        assert [record.s3_key for record in caplog.records] == ["key1", "key2"]
+        assert all(record.levelname == "ERROR" for record in caplog.records)
+
+
+class TestS3BatchDeleter:
+    CONFIG_DICT = {
+        "environment": {
+            "s3": {
+                "delete_batch_window": "60",
+                "delete_batch_size": "3",
+            }
+        }
+    }
+
+    def test_coalesces_keys_per_bucket(self):
+        s3_client = MagicMock()
+        deleter = S3BatchDeleter(s3_client, self.CONFIG_DICT)
+        deleter.delete("bucket1", "key1")
+        deleter.delete("bucket2", "key2")
+        deleter.delete("bucket1", "key3")
+        deleter.flush()
+
+        calls = sorted(call[0] for call in s3_client.delete_objects.call_args_list)
+        assert calls == [("bucket1", ["key1", "key3"]), ("bucket2", ["key2"])]
+        assert s3_client.delete_object.call_count == 0
+        deleter.close()
+
+    def test_full_batch_is_deleted_before_window(self):
+        s3_client = MagicMock()
+        deleter = S3BatchDeleter(s3_client, self.CONFIG_DICT)
+        for i in range(3):
+            deleter.delete("bucket", f"key{i}")
+        # The background thread picks up the full batch without waiting
+        deleter._thread.join(timeout=0.5)
+        assert s3_client.delete_objects.call_count == 1
+        deleter.close()
+
+    def test_close_deletes_queued_keys(self):
+        s3_client = MagicMock()
+        deleter = S3BatchDeleter(s3_client, self.CONFIG_DICT)
+        deleter.delete("bucket", "key")
+        deleter.close()
+        s3_client.delete_objects.assert_called_once_with("bucket", ["key"])
+
+    def test_callbacks_after_delete(self):
+        s3_client = MagicMock()
+        deleter = S3BatchDeleter(s3_client, self.CONFIG_DICT)
+        callback = MagicMock(side_effect=lambda: s3_client.delete_objects.assert_called())
+        deleter.delete("bucket", "key1", callback)
+        deleter.delete("bucket", "key2")
+        callback.assert_not_called()
+        deleter.close()
+        callback.assert_called_once()
+
+    def test_no_window_deletes_right_away(self):
+        s3_client = MagicMock()
+        config_dict = {"environment": {"s3": {"delete_batch_window": "0"}}}
+        deleter = S3BatchDeleter(s3_client, config_dict)
+        deleter.delete("bucket", "key")
+        s3_client.delete_object.assert_called_once_with("bucket", "key")
@@ -1,25 +1,71 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
 import os
+import threading
+import time
 from datetime import datetime
 from io import BytesIO
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import pytest
 from fastapi.testclient import TestClient
 from lxml import etree
 from lxml.etree import XMLSyntaxError
 from mediahaven.mediahaven import MediaHavenException
 from mediahaven.mocks.base_resource import MediaHavenSingleObjectJSONMock
-
-from app.app import _generate_vrt_xml, _get_fragment_metadata, app
-from app.helpers.events_parser import InvalidPremisEventException, PremisEvents
-from tests.resources import single_premis_event, single_premis_event_nok
+from prometheus_client import REGISTRY
+
+import app.app as app_module
+from app.app import _generate_vrt_xml, _get_fragment_metadata, _request_token, app
+from app.helpers.cache import TTLCache
+from app.helpers.dedup import DedupIndex
+from app.helpers.events_parser import (
+    InvalidPremisEventException,
+    PremisEvents,
+    PremisPayloadParser,
+    PrescanResult,
+)
+from app.helpers.journal import EventJournal
+from app.helpers.work_queue import QueueFullException, WorkQueue
+from app.services.mediahaven_pool import FragmentLookupBatcher, MediaHavenPool
+from app.services.s3 import S3BatchDeleter
+from tests.resources import (
+    multi_premis_event,
+    single_premis_event,
+    single_premis_event_archived_on_tape,
+    single_premis_event_nok,
+)
 
 # Create a FastAPI test client
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def reset_shared_services(tmp_path):
+    """Make sure each test creates its own (mocked) shared services"""
+    app_module._rabbit_service = None
+    app_module._s3_client = None
+    app_module._s3_deleter = None
+    app_module._fragment_cache = TTLCache()
+    app_module._fragment_lookup = FragmentLookupBatcher()
+    app_module._work_queue = WorkQueue()
+    app_module._dedup_index = DedupIndex()
+    app_module._journal = EventJournal(str(tmp_path / "journal" / "events.log"))
+    yield
+    if app_module._work_queue is not None:
+        app_module._work_queue.close()
+    app_module._work_queue = None
+    app_module._rabbit_service = None
+    app_module._s3_client = None
+    app_module._s3_deleter = None
+    app_module._fragment_cache = None
+    if app_module._journal is not None:
+        app_module._journal.close()
+    app_module._journal = None
+
+
 def _create_fragment_info_dict(pid: str, md5: str, s3_object_key: str, s3_bucket: str):
     fragment_info = {
         "pid": pid,
@@ -40,7 +86,7 @@ def test_generate_vrt_xml():
     timestamp = datetime.now().isoformat()
     # Act
     xml = _generate_vrt_xml(fragment_info, timestamp)
-    tree = etree.parse(BytesIO(xml.encode("utf-8")))
+    tree = etree.parse(BytesIO(xml))
     # Assert
     ns = {"m": "http://www.vrt.be/mig/viaa/api"}
     assert tree.xpath("/m:essenceArchivedEvent/m:pid/text()", namespaces=ns)[0] == pid
@@ -61,6 +107,13 @@ def test_generate_vrt_xml():
     )
 
 
+def test_generate_vrt_xml_without_timestamp():
+    fragment_info = _create_fragment_info_dict("pid", "md5", "object_key", "bucket")
+    # An empty <eventDateTime/> has no text
+    xml = _generate_vrt_xml(fragment_info, None)
+    assert b"<timestamp/>" in xml
+
+
 def test_generate_vrt_xml_against_xsd():
     # Arrange
     pid = "a1b2c3"
@@ -75,7 +128,7 @@ def test_generate_vrt_xml_against_xsd():
     )
     schema = etree.XMLSchema(file=xsd_file)
     # Act
-    tree = etree.parse(BytesIO(xml.encode("utf-8")))
+    tree = etree.parse(BytesIO(xml))
     is_xml_valid = schema.validate(tree)
     # Assert
     assert is_xml_valid
@@ -87,6 +140,63 @@ def test_liveness_check():
     assert response.text == "OK"
 
 
+def test_readiness_check():
+    app_module._ready.clear()
+    assert client.get("/health/ready").status_code == 503
+    app_module._ready.set()
+    result = client.get("/health/ready")
+    assert result.status_code == 200
+    assert result.text == "OK"
+    app_module._ready.clear()
+
+
+def test_metrics():
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "event_handler_backlog" in response.text
+    assert "event_handler_fragment_cache_hits_total" in response.text
+
+
+@pytest.mark.parametrize(
+    "token, expires_in",
+    [
+        ({"access_token": "token", "expires_in": 600}, 600),
+        ({"access_token": "token", "expires_at": time.time() + 600}, 600),
+        ({"access_token": "token"}, None),
+        (None, None),
+    ],
+)
+def test_request_token(token, expires_in):
+    grant = MagicMock()
+    grant.request_token.return_value = token
+    grant.session.token = token
+    result = _request_token(grant, "user", "password")
+    grant.request_token.assert_called_once_with("user", "password")
+    if expires_in is None:
+        assert result is None
+    else:
+        assert expires_in - 5 < result <= expires_in
+
+
+def test_multiprocess_metrics(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "event_handler_fragment_cache_hits_total" in response.text
+
+
+@patch("app.app.config")
+def test_worker_paths(config_mock, tmp_path):
+    server_config = {"workers": 2, "lock_dir": str(tmp_path)}
+    config_mock.config = {"environment": {"server": server_config}}
+    try:
+        assert app_module._worker_path("journal/events.log") == "journal/events.0.log"
+        assert app_module._worker_path(None) is None
+    finally:
+        app_module.release_worker_slot()
+    assert app_module._worker_slot is None
+
+
 @patch("app.app.MediaHaven")
 def test_get_fragment_metadata(
     mh_mock,
@@ -101,7 +211,7 @@ def test_get_fragment_metadata(
     }
     result = MediaHavenSingleObjectJSONMock(fragment_metadata)
     mh_mock.records.get.return_value = result
-    metadata = _get_fragment_metadata("fragment_id", mh_mock)
+    metadata = _get_fragment_metadata("fragment_id", MediaHavenPool([mh_mock]))
     assert metadata["pid"] == "pid"
     assert metadata["s3_object_key"] == "s3_object_key"
     assert metadata["s3_bucket"] == "s3_bucket"
@@ -117,7 +227,7 @@ def test_get_fragment_metadata_key_not_found(
     result = MediaHavenSingleObjectJSONMock(fragment_metadata)
 
     mh_mock.records.get.return_value = result
-    metadata = _get_fragment_metadata("fragment_id", mh_mock)
+    metadata = _get_fragment_metadata("fragment_id", MediaHavenPool([mh_mock]))
     assert metadata == {}
 
 
@@ -126,15 +236,140 @@ def test_get_fragment_metadata_media_not_found(mh_mock):
     # Mock call to MediaHaven to raise A MediaObjectNotFoundException
     mh_mock.records.get.side_effect = MediaHavenException("denied")
 
-    metadata = _get_fragment_metadata("fragment_id", mh_mock)
+    metadata = _get_fragment_metadata("fragment_id", MediaHavenPool([mh_mock]))
     assert metadata == {}
 
 
+@patch("app.app.MediaHaven")
+def test_get_fragment_metadata_cached(mh_mock):
+    fragment_metadata = {
+        "Administrative": {"ExternalId": "pid"},
+        "Dynamic": {
+            "s3_object_key": "s3_object_key",
+            "s3_bucket": "s3_bucket",
+        },
+        "Technical": {"Md5": "md5"},
+    }
+    mh_mock.records.get.return_value = MediaHavenSingleObjectJSONMock(
+        fragment_metadata
+    )
+    mh_pool = MediaHavenPool([mh_mock])
+
+    first = _get_fragment_metadata("fragment_id", mh_pool)
+    second = _get_fragment_metadata("fragment_id", mh_pool)
+
+    # The second lookup is served from the cache
+    assert first == second
+    assert mh_mock.records.get.call_count == 1
+    assert app_module.get_fragment_cache().hits == 1
+    assert app_module.get_fragment_cache().misses == 1
+
+
+@patch("app.app.MediaHaven")
+@patch("app.app.config")
+def test_get_fragment_metadata_not_found_cached(config_mock, mh_mock):
+    error = MediaHavenException("not found")
+    error.status_code = "404"
+    mh_mock.records.get.side_effect = error
+    mh_pool = MediaHavenPool([mh_mock])
+
+    assert _get_fragment_metadata("fragment_id", mh_pool) == {}
+    assert _get_fragment_metadata("fragment_id", mh_pool) == {}
+    assert mh_mock.records.get.call_count == 1
+
+
+@patch("app.app.MediaHaven")
+def test_get_fragment_lookups_are_shared(mh_mock):
+    started, release = threading.Event(), threading.Event()
+
+    def get(fragment_id):
+        started.set()
+        release.wait(5)
+        return MediaHavenSingleObjectJSONMock(
+            {"Administrative": {"ExternalId": "pid", "OrganisationName": "org"}}
+        )
+
+    mh_mock.records.get.side_effect = get
+    mh_pool = MediaHavenPool([mh_mock, mh_mock])
+    # Without batching, so only the coalescing prevents a second request
+    app_module._fragment_lookup = FragmentLookupBatcher(batch_size=1)
+    # Expire right away, so the second lookup can't be served from the cache
+    app_module._fragment_cache = TTLCache(ttl=0)
+    coalesced = lambda: REGISTRY.get_sample_value(
+        "event_handler_coalesced_lookups_total"
+    )
+    before = coalesced()
+    results = []
+
+    def lookup():
+        results.append(app_module._get_fragment("fragment_id", mh_pool))
+
+    threads = [threading.Thread(target=lookup, daemon=True) for _ in range(2)]
+    threads[0].start()
+    assert started.wait(5)
+    threads[1].start()
+    while coalesced() == before:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert mh_mock.records.get.call_count == 1
+    assert results[0] == results[1]
+    assert results[0]["organisation_name"] == "org"
+
+
+def test_project_fragment():
+    fragment = MediaHavenSingleObjectJSONMock(
+        {
+            "Administrative": {"ExternalId": "pid", "Title": "A long title"},
+            "Descriptive": {"Description": "A long description"},
+            "Technical": {"Md5": "md5"},
+        }
+    )
+
+    # Only the used fields are kept, missing ones are None
+    assert app_module._project_fragment(fragment) == {
+        "pid": "pid",
+        "organisation_name": None,
+        "s3_object_key": None,
+        "s3_bucket": None,
+        "md5": "md5",
+    }
+
+
+@patch("app.app.MediaHaven")
+def test_prefetch_fragments(mh_mock):
+    fragments = [
+        MediaHavenSingleObjectJSONMock(
+            {
+                "Internal": {"FragmentId": fragment_id},
+                "Administrative": {"ExternalId": f"pid_{fragment_id}"},
+                "Dynamic": {"s3_object_key": "key", "s3_bucket": "bucket"},
+                "Technical": {"Md5": "md5"},
+            }
+        )
+        for fragment_id in ("a", "b")
+    ]
+    mh_mock.records.search.return_value.as_generator.return_value = fragments
+    mh_pool = MediaHavenPool([mh_mock])
+
+    app_module._prefetch_fragments(["a", "b"], mh_pool)
+
+    # Both fragments were found with one search and are served from the cache
+    assert mh_mock.records.search.call_count == 1
+    assert _get_fragment_metadata("a", mh_pool)["pid"] == "pid_a"
+    assert _get_fragment_metadata("b", mh_pool)["pid"] == "pid_b"
+    assert mh_mock.records.get.call_count == 0
+
+
 @patch("app.app.S3Client")
 @patch("app.app.RabbitService")
 @patch("app.app._get_fragment_metadata")
 @patch("app.app.config")
 def test_handle_event(config_mock, get_fragment_metadata_mock, rabbit_mock, s3_client):
+    # Only the settings the test uses, the others get their default
+    config_mock.config["environment"].get.return_value = {}
     # Mock _get_fragment_metadata() to return a metadata-dict
     get_fragment_metadata_mock.return_value = {
         "pid": "pid",
@@ -144,6 +379,7 @@ def test_handle_event(config_mock, get_fragment_metadata_mock, rabbit_mock, s3_c
     }
 
     result = client.post("/event", data=single_premis_event)
+    app_module.get_work_queue().join()
 
     # Check if the actual XML message sent to the queue is correct
     assert rabbit_mock().publish_message.call_count == 1
@@ -158,7 +394,7 @@ def test_handle_event(config_mock, get_fragment_metadata_mock, rabbit_mock, s3_c
         os.path.dirname(__file__), "resources", "essenceArchivedEvent.xsd"
     )
     schema = etree.XMLSchema(file=xsd_file)
-    tree = etree.parse(BytesIO(xml.encode("utf-8")))
+    tree = etree.parse(BytesIO(xml))
     assert schema.validate(tree)
 
     ns = {"m": "http://www.vrt.be/mig/viaa/api"}
@@ -182,9 +418,122 @@ def test_handle_event(config_mock, get_fragment_metadata_mock, rabbit_mock, s3_c
     assert result.json() == {"message": "Processing 1 event(s) in the background."}
 
     # Check that it deleted the S3 object
-    assert s3_client().delete_object.call_count == 1
-    assert s3_client().delete_object.call_args[0][0] == "s3_bucket"
-    assert s3_client().delete_object.call_args[0][1] == "s3_object_key"
+    app_module.get_s3_deleter().flush()
+    assert s3_client().delete_objects.call_count == 1
+    assert s3_client().delete_objects.call_args[0][0] == "s3_bucket"
+    assert s3_client().delete_objects.call_args[0][1] == ["s3_object_key"]
+
+
+@patch("app.app._handle_premis_event")
+def test_handle_event_streamed(handle_premis_event_mock):
+    chunks = [
+        multi_premis_event[start:start + 100]
+        for start in range(0, len(multi_premis_event), 100)
+    ]
+    result = client.post("/event", content=iter(chunks))
+    app_module.get_work_queue().join()
+    assert result.status_code == 202
+    assert result.json() == {"message": "Processing 3 event(s) in the background."}
+    # Only the events that need work are handled
+    events = PremisEvents(multi_premis_event).events
+    assert handle_premis_event_mock.call_count == sum(
+        1 for event in events if not event.has_valid_outcome or event.is_valid
+    )
+
+
+@patch("app.app._handle_premis_event")
+@patch("app.app.config")
+def test_handle_event_too_large(config_mock, handle_premis_event_mock):
+    config_mock.config = {"environment": {"server": {"max_body_size": 100}}}
+    chunks = [single_premis_event[:100], single_premis_event[100:]]
+    # Without a Content-Length, the body is refused while it's read
+    result = client.post("/event", content=iter(chunks))
+    assert result.status_code == 413
+    result = client.post("/event", content=single_premis_event)
+    assert result.status_code == 413
+    handle_premis_event_mock.assert_not_called()
+
+
+@patch("app.app.S3Client")
+@patch("app.app.RabbitService")
+@patch("app.app._get_fragment_metadata")
+@patch("app.app.config")
+def test_handle_event_journal(config_mock, get_fragment_metadata_mock, rabbit_mock, s3_client):
+    config_mock.config["environment"].get.return_value = {}
+    get_fragment_metadata_mock.return_value = {
+        "pid": "pid",
+        "md5": "md5",
+        "s3_object_key": "s3_object_key",
+        "s3_bucket": "s3_bucket",
+    }
+    app_module._s3_deleter = S3BatchDeleter(
+        s3_client(), {"environment": {"s3": {"delete_batch_window": "60"}}}
+    )
+    journal = app_module._journal
+
+    result = client.post("/event", data=single_premis_event)
+    app_module.get_work_queue().join()
+
+    assert result.status_code == 202
+    # The entry is only done, and the event only counts as handled, once the
+    # S3 object was deleted
+    event_id = PremisEvents(single_premis_event).events[0].event_id
+    assert journal.pending == 1
+    assert event_id not in app_module.get_dedup_index()
+    app_module.get_s3_deleter().flush()
+    assert journal.pending == 0
+    assert event_id in app_module.get_dedup_index()
+
+
+@patch("app.app.S3Client")
+@patch("app.app.RabbitService")
+@patch("app.app._get_fragment_metadata")
+@patch("app.app.config")
+def test_shutdown_commits_pending_deletes(
+    config_mock, get_fragment_metadata_mock, rabbit_mock, s3_client, tmp_path
+):
+    config_mock.config["environment"].get.return_value = {}
+    get_fragment_metadata_mock.return_value = {
+        "pid": "pid",
+        "md5": "md5",
+        "s3_object_key": "s3_object_key",
+        "s3_bucket": "s3_bucket",
+    }
+    app_module._s3_deleter = S3BatchDeleter(
+        s3_client(), {"environment": {"s3": {"delete_batch_window": "60"}}}
+    )
+    path = str(tmp_path / "dedup.idx")
+    app_module._dedup_index = DedupIndex(path=path)
+
+    client.post("/event", data=single_premis_event)
+    app_module.get_work_queue().join()
+    # Close the S3 deleter and the dedup index in the order of shutdown
+    handlers = {"close_s3_deleter", "close_dedup_index"}
+    for handler in app.router.on_shutdown:
+        if handler.__name__ in handlers:
+            handler()
+
+    # The ID committed by the last delete was persisted
+    event_id = PremisEvents(single_premis_event).events[0].event_id
+    assert event_id in DedupIndex(path=path)
+
+
+@patch("app.app._handle_premis_event")
+def test_replay_journal(handle_premis_event_mock, tmp_path):
+    path = str(tmp_path / "events.log")
+    previous_run = EventJournal(path)
+    event = PremisEvents(single_premis_event).events[0]
+    journal_id = previous_run.add_all([event.to_string()])[0]
+    previous_run.close()
+    app_module._journal = EventJournal(path)
+
+    asyncio.run(app_module.replay_journal())
+    app_module.get_work_queue().join()
+
+    handle_premis_event_mock.assert_called_once()
+    event_arg, _, journal_id_arg = handle_premis_event_mock.call_args[0]
+    assert event_arg.event_id == event.event_id
+    assert journal_id_arg == journal_id
 
 
 @patch("app.app.MediaHaven")
@@ -195,6 +544,7 @@ def test_handle_event(config_mock, get_fragment_metadata_mock, rabbit_mock, s3_c
 def test_handle_event_outcome_nok(
     config_mock, ropc_grant_mock, rabbit_mock, s3_client, mediahaven_mock
 ):
+    config_mock.config["environment"].get.return_value = {}
     # Mock get_fragment() to return "test" as organisation name
     fragment_metadata = {"Administrative": {"OrganisationName": "test_org"}}
     result = MediaHavenSingleObjectJSONMock(fragment_metadata)
@@ -205,7 +555,7 @@ def test_handle_event_outcome_nok(
 
     # Check if there a message send to the "error" exchange
     assert rabbit_mock().publish_message.call_count == 1
-    assert "NOK" in rabbit_mock().publish_message.call_args[0][0]
+    assert b"NOK" in rabbit_mock().publish_message.call_args[0][0]
     assert rabbit_mock().publish_message.call_args[0][1] == (
         config_mock.config["environment"]["rabbit"]["exchange_nok"]
     )
@@ -218,11 +568,12 @@ def test_handle_event_outcome_nok(
 
     # Check that it didn't delete the S3 object
     assert s3_client().delete_object.call_count == 0
+    assert s3_client().delete_objects.call_count == 0
 
 
 @patch.object(
-    PremisEvents,
-    "__init__",
+    PremisPayloadParser,
+    "close",
     side_effect=XMLSyntaxError(
         "Document is empty, line 1, column 1", 1, 1, 1, "<string>"
     ),
@@ -236,7 +587,9 @@ def test_handle_event_xml_error(premis_events_mock):
 
 
 @patch.object(
-    PremisEvents, "__init__", side_effect=InvalidPremisEventException("Invalid event")
+    PremisPayloadParser,
+    "close",
+    side_effect=InvalidPremisEventException("Invalid event"),
 )
 def test_handle_event_invalid_premis_event(premis_events_mock):
     result = client.post("/event", data="")
@@ -244,6 +597,23 @@ def test_handle_event_invalid_premis_event(premis_events_mock):
     assert result.json() == {"detail": "NOK: Invalid event"}
 
 
+@patch("app.app._handle_premis_event")
+def test_handle_event_unparsed_payload_without_action(handle_premis_event_mock):
+    # A payload that isn't an <events> document goes through the parser
+    payload = single_premis_event_archived_on_tape.replace(b"events>", b"root>")
+    result = client.post("/event", content=payload)
+    assert result.status_code == 400
+    # A payload with only OK events is acknowledged without parsing it, so
+    # a syntax error in an event goes unnoticed
+    payload = single_premis_event_archived_on_tape.replace(
+        b"</premis:eventDateTime>", b"</premis:eventDateTime><a></b>"
+    )
+    result = client.post("/event", content=payload)
+    assert result.status_code == 202
+    assert result.json() == {"message": "Dropped 1 event(s) without action."}
+    handle_premis_event_mock.assert_not_called()
+
+
 @patch("app.app.S3Client")
 @patch("app.app.RabbitService")
 @patch("app.app._get_fragment_metadata")
@@ -254,6 +624,7 @@ def test_handle_event_empty_fragment(
     get_fragment_metadata_mock.return_value = {}
 
     result = client.post("/event", data=single_premis_event)
+    app_module.get_work_queue().join()
 
     # Check if there is no message been sent to the queue
     assert rabbit_mock().publish_message.call_count == 0
@@ -263,10 +634,13 @@ def test_handle_event_empty_fragment(
 
     # Check that it didn't delete the S3 object
     assert s3_client().delete_object.call_count == 0
+    assert s3_client().delete_objects.call_count == 0
 
 
+@patch("app.app.RabbitService")
+@patch("app.app.S3Client")
 @patch("app.app.MediaHaven")
-@patch("app.app.PremisEvents")
+@patch("app.app.PremisPayloadParser")
 @patch("app.app._handle_premis_event")
 @patch("app.app.ROPCGrant")
 @patch("app.app.config.config")
@@ -274,18 +648,189 @@ def test_handle_event_init_client(
     config_mock,
     ropc_grant_mock,
     handle_premis_event_mock,
-    premis_events_mock,
+    payload_parser_mock,
     mediahaven_mock,
+    s3_client_mock,
+    rabbit_service_mock,
 ):
-    """Test if mediahaven client gets initialized via dependency injection"""
+    """Test if mediahaven client pool gets initialized via dependency injection"""
     # Mock a premis event
     premis_event = MagicMock()
-    premis_events_mock().events = [premis_event]
+    premis_event.to_string.return_value = "<event/>"
+
+    def parse_payload(on_event):
+        def close():
+            on_event(premis_event)
+            return PrescanResult(1, True)
+
+        payload = MagicMock(count=1, parse_time=0.0)
+        payload.close.side_effect = close
+        return payload
+
+    payload_parser_mock.side_effect = parse_payload
 
     with TestClient(app) as mh_client:
         mh_client.post("/event", data="")
 
-    # Check if _handle_premis_event got the initialized mediahaven mock as an arg
-    handle_premis_event_mock.assert_called_once_with(
-        premis_event, mediahaven_mock.return_value
+    # Check if _handle_premis_event got a pool of initialized mediahaven mocks
+    handle_premis_event_mock.assert_called_once()
+    event_arg, pool_arg, _ = handle_premis_event_mock.call_args[0]
+    assert event_arg is premis_event
+    assert isinstance(pool_arg, MediaHavenPool)
+    assert pool_arg.clients == [mediahaven_mock.return_value] * len(pool_arg)
+    # The RabbitMQ connections were opened before the first event
+    rabbit_service_mock.return_value.warm_up.assert_called_once()
+    # The cold start was reported
+    assert REGISTRY.get_sample_value(
+        "event_handler_cold_start_seconds", {"phase": "ready"}
+    )
+
+
+@patch("app.app._handle_premis_event")
+def test_handle_event_drop_payload(handle_premis_event_mock):
+    dropped_events = REGISTRY.get_sample_value("event_handler_dropped_events_total")
+
+    result = client.post("/event", data=single_premis_event_archived_on_tape)
+
+    # The payload is acknowledged without handling its event
+    assert result.status_code == 202
+    assert result.json() == {"message": "Dropped 1 event(s) without action."}
+    assert handle_premis_event_mock.call_count == 0
+    assert (
+        REGISTRY.get_sample_value("event_handler_dropped_events_total")
+        == dropped_events + 1
     )
+
+
+@patch("app.app._handle_premis_event")
+def test_handle_event_drop_events(handle_premis_event_mock):
+    result = client.post("/event", data=multi_premis_event)
+    app_module.get_work_queue().join()
+
+    # Only the valid archived event of the three is handled
+    assert result.status_code == 202
+    assert handle_premis_event_mock.call_count == 1
+    assert handle_premis_event_mock.call_args[0][0].event_id == "444"
+
+
+@patch("app.app._handle_premis_event")
+@patch("app.app.config")
+def test_handle_event_queue_full(config_mock, handle_premis_event_mock):
+    config_mock.config = {"environment": {"workers": {"retry_after": 10}}}
+    app_module._work_queue = WorkQueue(max_depth=0)
+
+    result = client.post("/event", data=single_premis_event)
+
+    # MediaHaven should back off and retry later
+    assert result.status_code == 503
+    assert result.headers["Retry-After"] == "10"
+    assert handle_premis_event_mock.call_count == 0
+
+
+@patch("app.app.S3Client")
+@patch("app.app.RabbitService")
+@patch("app.app._get_fragment_metadata")
+@patch("app.app.config")
+def test_handle_event_duplicate(
+    config_mock, get_fragment_metadata_mock, rabbit_mock, s3_client
+):
+    config_mock.config["environment"].get.return_value = {}
+    get_fragment_metadata_mock.return_value = {
+        "pid": "pid",
+        "md5": "md5",
+        "s3_object_key": "s3_object_key",
+        "s3_bucket": "s3_bucket",
+    }
+
+    # MediaHaven resends the same event
+    for _ in range(2):
+        result = client.post("/event", data=single_premis_event)
+        app_module.get_work_queue().join()
+        assert result.status_code == 202
+
+    # It is only handled once
+    assert get_fragment_metadata_mock.call_count == 1
+    assert rabbit_mock().publish_message.call_count == 1
+
+
+@patch("app.app.S3Client")
+@patch("app.app.RabbitService")
+@patch("app.app._get_fragment_metadata")
+def test_handle_event_duplicate_after_failure(
+    get_fragment_metadata_mock, rabbit_mock, s3_client
+):
+    # The first time the fragment can't be found
+    get_fragment_metadata_mock.return_value = {}
+
+    for _ in range(2):
+        client.post("/event", data=single_premis_event)
+        app_module.get_work_queue().join()
+
+    # A resent event that failed before is handled again
+    assert get_fragment_metadata_mock.call_count == 2
+
+
+@patch("app.app.config")
+def test_async_pipeline(config_mock):
+    config_mock.config = {
+        "environment": {"rabbit": {"exchange": "exchange", "queue": "queue"}}
+    }
+    mediahaven = AsyncMock()
+    mediahaven.get_record.return_value = {
+        "Administrative": {"ExternalId": "pid"},
+        "Dynamic": {"s3_object_key": "key", "s3_bucket": "bucket"},
+        "Technical": {"Md5": "md5"},
+    }
+    rabbit_service = AsyncMock()
+    s3_deleter = AsyncMock()
+    events = PremisEvents(single_premis_event).events
+
+    async def handle():
+        app_module._submit_async(events)
+        await asyncio.gather(*app_module._async_tasks)
+
+    with patch.multiple(
+        app_module,
+        _async_mediahaven=mediahaven,
+        _async_rabbit_service=rabbit_service,
+        _async_s3_deleter=s3_deleter,
+    ):
+        asyncio.run(handle())
+
+    mediahaven.get_record.assert_called_once_with("a1b2c3")
+    assert rabbit_service.publish_message.call_args[0][1:] == ("exchange", "queue")
+    s3_deleter.delete.assert_called_once()
+    assert s3_deleter.delete.call_args[0][:2] == ("bucket", "key")
+    assert not app_module._async_tasks
+
+
+def test_async_lookups_are_shared():
+    async def get_record(fragment_id):
+        await asyncio.sleep(0.01)
+        return {"Administrative": {"ExternalId": "pid"}}
+
+    mediahaven = AsyncMock()
+    mediahaven.get_record.side_effect = get_record
+
+    async def lookup():
+        return await asyncio.gather(
+            app_module._get_fragment_async("a1b2c3"),
+            app_module._get_fragment_async("a1b2c3"),
+        )
+
+    with patch.object(app_module, "_async_mediahaven", mediahaven):
+        first, second = asyncio.run(lookup())
+
+    assert first == second
+    assert first["pid"] == "pid"
+    assert mediahaven.get_record.call_count == 1
+
+
+@patch("app.app.config")
+def test_async_pipeline_full(config_mock):
+    config_mock.config = {"environment": {"workers": {"max_depth": 1}}}
+    events = PremisEvents(multi_premis_event).events
+
+    with pytest.raises(QueueFullException):
+        app_module._submit_async(events)
+    assert not app_module._async_tasks